@@ -6,7 +6,6 @@ import os
 from kedixa.comm.http import (
     HttpRequest,
     HttpResponse,
-    HttpChunkTransformer,
 )
 from kedixa.comm import (
     Connection,
@@ -100,20 +99,17 @@ class SimpleFileService:
     async def process_file(self, conn: Connection, path: str):
         resp = HttpResponse()
         resp.set_header('Connection', 'keep-alive')
-        resp.set_header('Transfer-Encoding', 'chunked')
+        resp.set_header('Content-Length', str(os.path.getsize(path)))
         resp.set_empty_body(True)
 
         await resp.encode(conn.c)
 
-        # send file with http chunk
+        # the kernel sends the file if conn.c does not change the bytes
         fa = FileAdaptor(path)
-        chunk = HttpChunkTransformer()
-        chunk.bind_next(conn.c)
-
-        async with fa, chunk:
-            bridge = CommBridge(fa, chunk)
+        async with fa:
+            bridge = CommBridge(fa, conn.c)
             await bridge.run()
-            await chunk.flush()
+            await conn.c.flush()
 
     async def process(self, conn: Connection):
         await conn.bind(ReadUntilTransformer())
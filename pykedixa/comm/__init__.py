@@ -1,15 +1,24 @@
 from .exception import *
 from .basic import *
+from .buffer_pool import *
 from .address import *
+from .dns_cache import *
 from .connection import *
+from .connection_pool import *
 
 from .socket_adaptor import *
+from .happy_eyeballs import *
 from .file_adaptor import *
+from .memory_pipe import *
 
 from .read_until_transformer import *
 from .ssl_transformer import *
 from .speed_limit_transformer import *
 from .debug_transformer import *
+from .metrics_transformer import *
+from .capture_transformer import *
+from .timer_wheel import *
 
 from .bridge import *
 from .tcp_server import *
+from .multi_tcp_server import *
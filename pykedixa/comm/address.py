@@ -12,16 +12,33 @@ class SocketAddress:
     def __init__(self, ip: str, port: int, *,
             family: int = socket.AF_INET,
             socktype: int = socket.SOCK_STREAM,
-            proto: int = 0):
+            proto: int = 0,
+            path: str = None):
+        '''
+        Address of ip and port, or of a unix domain socket if path is not
+        None, in that case family is AF_UNIX and ip, port are ignored.
+        A path starts with '\\0' is in the linux abstract namespace.
+        '''
+        if path is not None:
+            ip, port, family = None, None, socket.AF_UNIX
+
         self._ip: str       = ip
         self._port: int     = port
         self._family: int   = family
         self._socktype: int = socktype
         self._proto: int    = proto
+        self._path: str     = path
 
         self._info: str     = None
         self._update_info()
 
+    @classmethod
+    def from_path(cls, path: str, *, abstract: bool = False) -> 'SocketAddress':
+        '''Unix domain socket address, in the abstract namespace if abstract'''
+        if abstract and not path.startswith('\0'):
+            path = '\0' + path
+        return cls(None, None, path=path)
+
     @property
     def info(self) -> str:
         return self._info
@@ -46,19 +63,36 @@ class SocketAddress:
     def proto(self) -> int:
         return self._proto
 
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def abstract(self) -> bool:
+        return self._path is not None and self._path.startswith('\0')
+
+    @property
+    def sockaddr(self):
+        '''The address in the form of socket.connect and socket.bind'''
+        if self._path is not None:
+            return self._path
+        return (self._ip, self._port)
+
     def __str__(self) -> str:
+        if self._path is not None:
+            return f'SocketAddress path:{self._path!r}'
         return f'SocketAddress ip:{self._ip} port:{self._port}'
 
     def _update_info(self):
-        self._info = f'{self.ip}:{self.port},{self.family},{self.socktype}'
-
-async def getaddrinfo(host: str, port: int, *,
-        family: int = socket.AF_INET,
-        socktype: int = socket.SOCK_STREAM,
-        proto: int = 0) -> List[SocketAddress]:
-    if len(host) > 0 and host[0] == '[' and host[-1] == ']':
-        host = host[1:-1]
+        if self._path is not None:
+            # show the abstract namespace as @name like ss and netstat
+            path = '@' + self._path[1:] if self.abstract else self._path
+            self._info = f'unix:{path},{self.socktype}'
+        else:
+            self._info = f'{self.ip}:{self.port},{self.family},{self.socktype}'
 
+async def _resolve_addrinfo(host: str, port: int, family: int,
+        socktype: int, proto: int) -> List[SocketAddress]:
     loop = asyncio.get_event_loop()
     addrs = await loop.getaddrinfo(host, port,
         family=family, type=socktype, proto=proto)
@@ -68,3 +102,21 @@ async def getaddrinfo(host: str, port: int, *,
             family=addr[0], socktype=addr[1], proto=addr[2])
         for addr in addrs
     ]
+
+async def getaddrinfo(host: str, port: int, *,
+        family: int = socket.AF_INET,
+        socktype: int = socket.SOCK_STREAM,
+        proto: int = 0,
+        cache: 'AddrInfoCache' = None) -> List[SocketAddress]:
+    '''
+    Resolve host and port to a list of SocketAddress,
+    if cache is not None, the result is looked up and saved in it.
+    '''
+    if len(host) > 0 and host[0] == '[' and host[-1] == ']':
+        host = host[1:-1]
+
+    if cache is not None:
+        return await cache.resolve(host, port,
+            family=family, socktype=socktype, proto=proto)
+
+    return await _resolve_addrinfo(host, port, family, socktype, proto)
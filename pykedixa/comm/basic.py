@@ -1,10 +1,15 @@
+import asyncio
 import enum
-from typing import Union, List
+import io
+import os
+from collections import deque
+from typing import Deque, Union, List, Sequence
 
 from .exception import (
     AdaptorException,
     AdaptorEofError,
 )
+from .buffer_pool import default_buffer_pool
 
 
 __all__ = [
@@ -29,6 +34,28 @@ ReadRetType    = Union[ReadableBuffer, int]
 
 DEFAULT_MAX_READ_SIZE: int = 2 ** 24
 DEFAULT_LOOPBACK_ADAPTOR_MEMSIZE: int = 2 ** 24
+DEFAULT_SENDFILE_COPY_SIZE: int = 2 ** 16
+
+
+def pread_into(fd: int, buffer: memoryview, pos: int) -> int:
+    '''Read into buffer at pos of fd without the file position'''
+    if hasattr(os, 'preadv'):
+        return os.preadv(fd, [buffer], pos)
+
+    data = os.pread(fd, len(buffer), pos)
+    buffer[:len(data)] = data
+    return len(data)
+
+
+def _pread_fd(file: io.IOBase) -> int:
+    # the descriptor to read at explicit offsets, -1 if not possible
+    if not hasattr(os, 'pread'):
+        return -1
+    try:
+        fd = file.fileno()
+        return fd if file.seekable() else -1
+    except (AttributeError, OSError):
+        return -1
 
 
 class CommFlags(enum.IntFlag):
@@ -113,6 +140,93 @@ class CommunicateBase:
             await self.flush()
         return tot
 
+    async def write_vectored(self, buffers: Sequence[ReadableBuffer]) -> int:
+        '''
+        Write data in buffers in order, return the number of bytes write,
+        which may be less than the total length of buffers.
+        '''
+        tot = 0
+        for buf in buffers:
+            blen = len(buf)
+            if blen == 0:
+                continue
+
+            wlen = await self.write(buf)
+            tot += wlen
+            if wlen < blen:
+                break
+        return tot
+
+    async def write_all_vectored(self, buffers: Sequence[ReadableBuffer], *,
+            flush=True) -> int:
+        '''
+        Write all data in buffers into this object without concatenate them,
+        return the number of bytes write.
+        if flush is True, call self.flush after all write done.
+        Whether the buffers reach the kernel without copy depends on the
+        adaptor, see write_vectored of each adaptor.
+        '''
+        views = [memoryview(b) for b in buffers if len(b) > 0]
+        tot = sum(len(v) for v in views)
+        idx = 0
+
+        try:
+            while idx < len(views):
+                wlen = await self.write_vectored(views[idx:])
+                assert wlen > 0
+
+                while wlen > 0:
+                    vlen = len(views[idx])
+                    if wlen >= vlen:
+                        views[idx].release()
+                        wlen -= vlen
+                        idx += 1
+                    else:
+                        view, views[idx] = views[idx], views[idx][wlen:]
+                        view.release()
+                        wlen = 0
+        finally:
+            for v in views:
+                v.release()
+
+        if flush:
+            await self.flush()
+        return tot
+
+    async def sendfile(self, file: io.BufferedIOBase, offset: int = 0,
+            count: int = None) -> int:
+        '''
+        Write count bytes of file from offset into this object, or until
+        the end of file if count is None, return the number of bytes write.
+        Socket adaptors let the kernel send the file, others read and write
+        it by copy. Files with a descriptor are read at explicit offsets,
+        so windows of one file can be sent concurrently, the file position
+        is unspecified after return.
+        '''
+        loop = asyncio.get_event_loop()
+        fd = _pread_fd(file)
+        if fd < 0:
+            file.seek(offset)
+        tot = 0
+
+        with default_buffer_pool.acquire(DEFAULT_SENDFILE_COPY_SIZE) as lease:
+            view = lease.view
+            while count is None or tot < count:
+                n = len(view) if count is None else min(len(view), count - tot)
+                # do not block the loop on slow disks
+                if fd < 0:
+                    nread = await loop.run_in_executor(None, file.readinto, view[:n])
+                else:
+                    nread = await loop.run_in_executor(None, pread_into,
+                        fd, view[:n], offset + tot)
+                if not nread:
+                    break
+
+                await self.write_all(view[:nread], flush=False)
+                tot += nread
+
+        return tot
+
     async def flush(self):
         pass
 
@@ -129,7 +243,12 @@ class MessageBase:
 
 
 class BasicAdaptor(CommunicateBase):
-    pass
+    def is_healthy(self) -> bool:
+        '''
+        Return False if the adaptor is known to be unusable,
+        for example the connection is closed by peer.
+        '''
+        return True
 
 
 class BasicTransformer(CommunicateBase):
@@ -148,6 +267,20 @@ class BasicTransformer(CommunicateBase):
     async def write(self, buffer: ReadableBuffer) -> int:
         return await self._nxt.write(buffer)
 
+    async def write_vectored(self, buffers: Sequence[ReadableBuffer]) -> int:
+        # pass down only if write is not overridden, which means
+        # this transformer does not change the bytes written
+        if type(self).write is BasicTransformer.write:
+            return await self._nxt.write_vectored(buffers)
+        return await super().write_vectored(buffers)
+
+    async def sendfile(self, file: io.BufferedIOBase, offset: int = 0,
+            count: int = None) -> int:
+        # the same as write_vectored
+        if type(self).write is BasicTransformer.write:
+            return await self._nxt.sendfile(file, offset, count)
+        return await super().sendfile(file, offset, count)
+
     async def read(self, max_bytes: int = -1, *,
             buffer: WritableBuffer = None) -> ReadRetType:
         return await self._nxt.read(max_bytes, buffer=buffer)
@@ -156,61 +289,98 @@ class BasicTransformer(CommunicateBase):
         return await self._nxt.flush()
 
 
-class LoopbackAdaptor(BasicAdaptor):
-    def __init__(self, maxsize: int = DEFAULT_LOOPBACK_ADAPTOR_MEMSIZE):
-        super().__init__()
-        self._lst: List[ReadableBuffer] = []
+class BufferQueue:
+    '''
+    FIFO queue of bytes, data is copied once when put into the queue
+    and once when get out of it, no matter how it is split.
+    '''
+    def __init__(self):
+        self._chunks: Deque[bytes] = deque()
+        self._offset: int = 0
         self._size: int = 0
-        self._maxsize: int = maxsize
 
-    async def read(self, max_bytes: int = -1, *,
+    def __len__(self) -> int:
+        return self._size
+
+    def put(self, buffer: ReadableBuffer):
+        # make a copy of buffer when save into local queue,
+        # buffer may be a memoryview reference to another byte array
+        if len(buffer) > 0:
+            self._chunks.append(bytes(buffer))
+            self._size += len(buffer)
+
+    def get(self, max_bytes: int = -1, *,
             buffer: WritableBuffer = None) -> ReadRetType:
+        '''
+        Get up to max_bytes from queue,
+        when buffer is not None, copy into buffer and return the number of bytes;
+        else return a copy of data.
+        '''
+        if max_bytes < 0 and buffer is not None:
+            max_bytes = len(buffer)
         if max_bytes < 0 or max_bytes > self._size:
             max_bytes = self._size
 
-        if self._size == 0:
-            raise AdaptorEofError('LoopbackAdaptor: no more data')
+        chunks = self._chunks
+        first = chunks[0] if chunks else b''
+
+        # fast path, the whole first chunk is wanted, no copy needed
+        if buffer is None and self._offset == 0 and len(first) == max_bytes:
+            chunks.popleft()
+            self._size -= max_bytes
+            return first
 
         buf = bytearray(max_bytes) if buffer is None else buffer
         pos = 0
 
-        for i in range(len(self._lst)):
-            data = self._lst[i]
-            dlen = len(data)
-
-            # < rather than <=, make sure the last read always
-            # run into else
-            if dlen + pos < max_bytes:
-                buf[pos:pos+dlen] = data
-                pos += dlen
-            else:
-                n = max_bytes - pos
-                buf[pos:pos+n] = data[:n]
-                if n == dlen:
-                    self._lst = self._lst[i+1:]
+        with memoryview(buf) as view:
+            while pos < max_bytes:
+                data = chunks[0]
+                off = self._offset
+                n = min(len(data) - off, max_bytes - pos)
+
+                with memoryview(data) as m:
+                    view[pos:pos+n] = m[off:off+n]
+
+                pos += n
+                if off + n == len(data):
+                    chunks.popleft()
+                    self._offset = 0
                 else:
-                    self._lst[i] = data[n:]
-                    self._lst = self._lst[i:]
-                break
+                    self._offset = off + n
 
         self._size -= max_bytes
         return buf if buffer is None else max_bytes
 
+    def clear(self):
+        self._chunks.clear()
+        self._offset = 0
+        self._size = 0
+
+
+class LoopbackAdaptor(BasicAdaptor):
+    def __init__(self, maxsize: int = DEFAULT_LOOPBACK_ADAPTOR_MEMSIZE):
+        super().__init__()
+        self._que: BufferQueue = BufferQueue()
+        self._maxsize: int = maxsize
+
+    async def read(self, max_bytes: int = -1, *,
+            buffer: WritableBuffer = None) -> ReadRetType:
+        if len(self._que) == 0:
+            raise AdaptorEofError('LoopbackAdaptor: no more data')
+
+        return self._que.get(max_bytes, buffer=buffer)
+
     async def write(self, buffer: ReadableBuffer) -> int:
-        if self._size >= self._maxsize:
+        size = len(self._que)
+        if size >= self._maxsize:
             err = 'LoopbackAdaptor: memory limit exceeded'
             raise AdaptorException(err, maxsize=self._maxsize)
 
-        buf = buffer
-        blen = len(buf)
-
-        if self._size + blen > self._maxsize:
-            blen = self._maxsize - self._size
+        blen = min(len(buffer), self._maxsize - size)
 
-        # make a copy of buffer when save info local list,
-        # buffer may be a memoryview reference to another byte array
-        self._lst.append(buf[:blen])
-        self._size += blen
+        with memoryview(buffer) as view:
+            self._que.put(view[:blen])
 
         return blen
 
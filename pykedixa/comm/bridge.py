@@ -1,4 +1,11 @@
-from typing import Union
+import asyncio
+import os
+from typing import Dict, List, Union
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 from .import (
     CommunicateBase,
@@ -8,18 +15,35 @@ from .exception import (
     AdaptorEofError,
     TransformerEofError,
 )
+from .buffer_pool import BufferLease, BufferPool, default_buffer_pool
+from .file_adaptor import FileAdaptor
+from .socket_adaptor import RawTcpAdaptor
 
 __all__ = [
     'CommBridge',
+    'DuplexBridge',
+    'SpliceBridge',
 ]
 
+DEFAULT_SENDFILE_CHUNK: int = 2 ** 22
+DEFAULT_SPLICE_PIPE_SIZE: int = 2 ** 16
+
 
 class CommBridge:
     def __init__(self,
             read_from: Union[CommunicateBase, Connection],
             write_to: Union[CommunicateBase, Connection],
             *,
-            max_bytes: int = -1, max_per_read: int = 65536):
+            max_bytes: int = -1, max_per_read: int = 65536,
+            buffer_pool: BufferPool = None,
+            use_sendfile: bool = True):
+        '''
+        Copy at most max_bytes (all if < 0) from read_from to write_to.
+        If use_sendfile and read_from is a FileAdaptor opened for binary
+        read, the file is sent by write_to.sendfile, which lets the kernel
+        copy it when write_to is a socket adaptor and no transformer on
+        it changes the bytes; the file is sent from FileAdaptor.tell().
+        '''
         if isinstance(read_from, Connection):
             read_from = read_from.c
         if isinstance(write_to, Connection):
@@ -31,6 +55,8 @@ class CommBridge:
         self._max_bytes: int        = max_bytes
         self._max_per_read: int     = max_per_read
         self._stop: bool            = False
+        self._pool: BufferPool      = buffer_pool or default_buffer_pool
+        self._use_sendfile: bool    = use_sendfile
 
     def _next_read_size(self) -> int:
         if self._max_bytes < 0:
@@ -39,26 +65,282 @@ class CommBridge:
         nleft = self._max_bytes - self._total_read
         return min(nleft, self._max_per_read)
 
+    @property
+    def total_bytes(self) -> int:
+        '''The number of bytes copied'''
+        return self._total_read
+
     def stop(self):
         self._stop = True
 
+    async def _run_sendfile(self, fa: FileAdaptor):
+        file = fa.file
+        offset = fa.tell()
+
+        while not self._stop:
+            # send in chunks to check stop between them
+            count = DEFAULT_SENDFILE_CHUNK
+            if self._max_bytes >= 0:
+                count = min(count, self._max_bytes - self._total_read)
+            if fa.remaining() >= 0:
+                count = min(count, fa.remaining())
+            if count <= 0:
+                break
+
+            nsent: int = await self._to.sendfile(file, offset, count)
+            if nsent == 0:
+                break
+
+            offset += nsent
+            self._total_read += nsent
+            fa.seek(offset)
+
     async def run(self):
-        rlen: int       = self._next_read_size()
-        buf: bytearray  = bytearray(rlen)
-        buflen: int     = len(buf)
+        if self._use_sendfile and isinstance(self._from, FileAdaptor) \
+                and self._from.can_sendfile():
+            return await self._run_sendfile(self._from)
+
+        rlen: int           = self._next_read_size()
+        lease: BufferLease  = self._pool.acquire(rlen)
+
+        try:
+            while rlen > 0 and not self._stop:
+                if rlen > len(lease):
+                    lease.release()
+                    lease = self._pool.acquire(rlen)
+
+                view = lease.view
+                try:
+                    nread: int = await self._from.read(rlen, buffer=view)
+                except (AdaptorEofError, TransformerEofError):
+                    break
+
+                # the buffer is reused by the next read, and transports may
+                # keep a reference of unsent data, such as asyncio since 3.12
+                await self._to.write_all(bytes(view[:nread]), flush=False)
+
+                self._total_read += nread
+                rlen = self._next_read_size()
+        finally:
+            lease.release()
+
 
-        while rlen > 0 and not self._stop:
-            if rlen > buflen:
-                buf.extend(bytearray(rlen - buflen))
-                buflen = rlen
+async def _wait_fd(fd: int, writable: bool):
+    loop = asyncio.get_event_loop()
+    fut = loop.create_future()
 
+    def ready():
+        if not fut.done():
+            fut.set_result(None)
+
+    if writable:
+        loop.add_writer(fd, ready)
+        try:
+            await fut
+        finally:
+            loop.remove_writer(fd)
+    else:
+        loop.add_reader(fd, ready)
+        try:
+            await fut
+        finally:
+            loop.remove_reader(fd)
+
+
+class SpliceBridge(CommBridge):
+    def __init__(self,
+            read_from: Union[CommunicateBase, Connection],
+            write_to: Union[CommunicateBase, Connection],
+            *,
+            max_bytes: int = -1, max_per_read: int = 65536,
+            buffer_pool: BufferPool = None,
+            pipe_size: int = DEFAULT_SPLICE_PIPE_SIZE):
+        '''
+        CommBridge that moves bytes socket -> pipe -> socket by os.splice
+        without copy them into python, when both ends are RawTcpAdaptor
+        without transformers; otherwise it works the same as CommBridge.
+        Requires linux, python 3.10+ and an event loop with add_reader.
+        pipe_size is the capacity of the pipe, if allowed by the system.
+        '''
+        super().__init__(read_from, write_to,
+            max_bytes=max_bytes, max_per_read=max_per_read,
+            buffer_pool=buffer_pool)
+        self._pipe_size: int = pipe_size
+
+    def can_splice(self) -> bool:
+        return hasattr(os, 'splice') \
+            and isinstance(self._from, RawTcpAdaptor) \
+            and isinstance(self._to, RawTcpAdaptor)
+
+    def _open_pipe(self):
+        r, w = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._pipe_size > DEFAULT_SPLICE_PIPE_SIZE \
+                and hasattr(fcntl, 'F_SETPIPE_SZ'):
             try:
-                nread: int = await self._from.read(rlen, buffer=buf)
-            except (AdaptorEofError, TransformerEofError):
-                break
+                self._pipe_size = fcntl.fcntl(w, fcntl.F_SETPIPE_SZ, self._pipe_size)
+            except OSError:
+                self._pipe_size = fcntl.fcntl(w, fcntl.F_GETPIPE_SZ)
+        return r, w
+
+    async def _splice(self, fd_in: int, fd_out: int, count: int, wait_fd: int,
+            writable: bool) -> int:
+        flags = os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK
+
+        while True:
+            try:
+                return os.splice(fd_in, fd_out, count, flags=flags)
+            except (BlockingIOError, InterruptedError):
+                await _wait_fd(wait_fd, writable)
+
+    async def _run_splice(self):
+        src, dst = self._from.fileno(), self._to.fileno()
+        r, w = self._open_pipe()
+
+        try:
+            while not self._stop:
+                count = self._pipe_size
+                if self._max_bytes >= 0:
+                    count = min(count, self._max_bytes - self._total_read)
+                if count <= 0:
+                    break
+
+                # the pipe is empty here, so only the socket may block
+                nread = await self._splice(src, w, count, src, False)
+                if nread == 0:
+                    break
+
+                pending = nread
+                while pending > 0:
+                    pending -= await self._splice(r, dst, pending, dst, True)
+
+                self._total_read += nread
+        finally:
+            os.close(r)
+            os.close(w)
+
+    async def run(self):
+        if self.can_splice():
+            return await self._run_splice()
+        return await super().run()
+
+
+def _half_close(c: CommunicateBase):
+    if getattr(c, 'can_write_eof', None) and c.can_write_eof():
+        c.write_eof()
+
+
+class DuplexBridge:
+    def __init__(self,
+            a: Union[CommunicateBase, Connection],
+            b: Union[CommunicateBase, Connection],
+            *,
+            max_per_read: int = 65536,
+            buffer_pool: BufferPool = None,
+            half_close: bool = True):
+        '''
+        Copy a to b and b to a at the same time until both reach eof.
+        Each direction has two buffers, so reading the next one overlaps
+        writing the previous one. If half_close, write eof to the peer
+        when one direction reaches eof, on the adaptor of a Connection.
+        '''
+        self._ends: List[CommunicateBase] = []
+        self._eof_ends: List[CommunicateBase] = []
+        for x in (a, b):
+            if isinstance(x, Connection):
+                self._ends.append(x.c)
+                self._eof_ends.append(x.adaptor)
+            else:
+                self._ends.append(x)
+                self._eof_ends.append(x)
+
+        self._max_per_read: int     = max_per_read
+        self._pool: BufferPool      = buffer_pool or default_buffer_pool
+        self._half_close: bool      = half_close
+        self._nbytes: List[int]     = [0, 0]
+        self._stop: bool            = False
+        self._tasks: List[asyncio.Future] = []
+
+    @property
+    def a_to_b(self) -> int:
+        '''The number of bytes copied from a to b'''
+        return self._nbytes[0]
+
+    @property
+    def b_to_a(self) -> int:
+        '''The number of bytes copied from b to a'''
+        return self._nbytes[1]
+
+    def stats(self) -> Dict[str, int]:
+        return {'a_to_b': self._nbytes[0], 'b_to_a': self._nbytes[1]}
+
+    def stop(self):
+        '''Cancel both directions, data being copied may be lost'''
+        self._stop = True
+        for task in self._tasks:
+            task.cancel()
+
+    async def _pump(self, idx: int):
+        src, dst = self._ends[idx], self._ends[1 - idx]
+        leases = [self._pool.acquire(self._max_per_read) for _ in range(2)]
+        reading: asyncio.Future = None
+        writing: asyncio.Future = None
+        cur = 0
+
+        try:
+            while True:
+                view = leases[cur].view
+                reading = asyncio.ensure_future(src.read(len(view), buffer=view))
+                if writing is not None:
+                    # a failed write is raised even if src sends nothing more
+                    await asyncio.wait([reading, writing],
+                        return_when=asyncio.FIRST_COMPLETED)
+                    if writing.done():
+                        writing.result()
+
+                try:
+                    nread: int = await reading
+                except (AdaptorEofError, TransformerEofError):
+                    break
+                reading = None
+
+                # the other buffer is free after the previous write done
+                if writing is not None:
+                    await writing
+                writing = asyncio.ensure_future(dst.write_all(view[:nread]))
+
+                self._nbytes[idx] += nread
+                cur = 1 - cur
+
+            if writing is not None:
+                await writing
+
+            if self._half_close:
+                _half_close(self._eof_ends[1 - idx])
+        finally:
+            # both may still use the buffers
+            for fut in (reading, writing):
+                if fut is not None and not fut.done():
+                    fut.cancel()
+                    await asyncio.wait([fut])
+
+            for lease in leases:
+                lease.release()
+
+    async def run(self):
+        '''
+        Return when both directions reach eof, if one of them fails,
+        the other one is cancelled and the exception is raised.
+        '''
+        self._tasks = [asyncio.ensure_future(self._pump(i)) for i in range(2)]
 
-            with memoryview(buf) as view:
-                await self._to.write_all(view[:nread], flush=False)
+        try:
+            await asyncio.gather(*self._tasks)
+        except BaseException as e:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.wait(self._tasks)
 
-            self._total_read += nread
-            rlen = self._next_read_size()
+            if not (self._stop and isinstance(e, asyncio.CancelledError)):
+                raise
+        finally:
+            self._tasks = []
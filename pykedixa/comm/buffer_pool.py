@@ -0,0 +1,118 @@
+from typing import Dict, List
+
+__all__ = [
+    'BufferLease',
+    'BufferPool',
+    'default_buffer_pool',
+]
+
+
+DEFAULT_POOL_MIN_SIZE: int = 2 ** 12
+DEFAULT_POOL_MAX_SIZE: int = 2 ** 24
+DEFAULT_POOL_MAX_BYTES: int = 2 ** 26
+
+
+class BufferLease:
+    '''
+    A buffer rent from BufferPool, use view to access it,
+    and do not keep any reference to it after release.
+    '''
+    def __init__(self, pool: 'BufferPool', buf: bytearray, size: int):
+        self._pool: 'BufferPool' = pool
+        self._buf: bytearray = buf
+        self._view: memoryview = memoryview(buf)[:size]
+
+    def __enter__(self) -> 'BufferLease':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def __len__(self) -> int:
+        return len(self._view)
+
+    @property
+    def view(self) -> memoryview:
+        '''A memoryview with the requested size'''
+        return self._view
+
+    @property
+    def capacity(self) -> int:
+        '''The real size of the buffer, not less than the requested size'''
+        return len(self._buf)
+
+    def released(self) -> bool:
+        return self._buf is None
+
+    def release(self):
+        if self._buf is not None:
+            buf, self._buf = self._buf, None
+            self._view.release()
+            self._pool._give_back(buf)
+
+
+class BufferPool:
+    def __init__(self, *,
+            min_size: int = DEFAULT_POOL_MIN_SIZE,
+            max_size: int = DEFAULT_POOL_MAX_SIZE,
+            max_bytes: int = DEFAULT_POOL_MAX_BYTES):
+        '''
+        Pool of bytearray in power of two size classes from min_size to
+        max_size, at most max_bytes are kept in the pool when they are
+        given back. Requests larger than max_size are not pooled.
+        '''
+        self._min_size: int     = min_size
+        self._max_size: int     = max_size
+        self._max_bytes: int    = max_bytes
+
+        self._free: Dict[int, List[bytearray]] = {}
+        self._bytes_held: int   = 0
+        self._bytes_leased: int = 0
+        self._hits: int         = 0
+        self._misses: int       = 0
+
+    def _size_class(self, size: int) -> int:
+        if size <= self._min_size:
+            return self._min_size
+        return 1 << (size - 1).bit_length()
+
+    def acquire(self, size: int) -> BufferLease:
+        '''Rent a buffer of at least size bytes'''
+        cls = self._size_class(size)
+        free = self._free.get(cls)
+
+        if free:
+            buf = free.pop()
+            self._bytes_held -= cls
+            self._hits += 1
+        else:
+            buf = bytearray(cls if cls <= self._max_size else size)
+            self._misses += 1
+
+        self._bytes_leased += len(buf)
+        return BufferLease(self, buf, size)
+
+    def _give_back(self, buf: bytearray):
+        blen = len(buf)
+        self._bytes_leased -= blen
+
+        if blen > self._max_size or self._bytes_held + blen > self._max_bytes:
+            return
+
+        self._free.setdefault(blen, []).append(buf)
+        self._bytes_held += blen
+
+    def clear(self):
+        self._free.clear()
+        self._bytes_held = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'bytes_held': self._bytes_held,
+            'bytes_leased': self._bytes_leased,
+        }
+
+
+default_buffer_pool: BufferPool = BufferPool()
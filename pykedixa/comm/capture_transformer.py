@@ -0,0 +1,283 @@
+import asyncio
+import enum
+import io
+import itertools
+import logging
+import queue
+import random
+import struct
+import threading
+import time
+from typing import Iterator, List, NamedTuple, Sequence
+
+from .basic import (
+    BasicAdaptor,
+    BasicTransformer,
+    BufferQueue,
+    CommunicateBase,
+
+    ReadableBuffer,
+    WritableBuffer,
+    ReadRetType,
+)
+from .exception import (
+    AdaptorEofError,
+    CommException,
+)
+
+__all__ = [
+    'CaptureDirection',
+    'CaptureRecord',
+    'CaptureWriter',
+    'CaptureTransformer',
+    'CaptureReplayAdaptor',
+    'iter_capture',
+    'replay_capture',
+]
+
+_logger = logging.getLogger('kedixa.comm.capture_transformer')
+
+CAPTURE_MAGIC = b'KDXCAP\x00\x01'
+# timestamp, connection id, direction, payload length
+_RECORD_HEAD = struct.Struct('<dQBI')
+_CONN_ID = itertools.count(1)
+
+
+class CaptureDirection(enum.IntEnum):
+    READ    = 0
+    WRITE   = 1
+    OPEN    = 2
+    CLOSE   = 3
+
+
+class CaptureRecord(NamedTuple):
+    timestamp: float
+    conn_id: int
+    direction: CaptureDirection
+    data: bytes
+
+
+class CaptureWriter:
+    def __init__(self, path: str, *, max_queue_bytes: int = 2 ** 26):
+        '''
+        Write capture records into path in a background thread,
+        records are dropped when more than max_queue_bytes are waiting.
+        '''
+        self._file = open(path, 'wb')
+        self._file.write(CAPTURE_MAGIC)
+
+        self._que: queue.Queue = queue.Queue()
+        self._max_queue_bytes: int = max_queue_bytes
+        self._queue_bytes: int = 0
+        self._lock = threading.Lock()
+        self._closed: bool = False
+
+        self._records: int = 0
+        self._dropped: int = 0
+
+        self._thread = threading.Thread(target=self._run,
+            name='kedixa-capture-writer', daemon=True)
+        self._thread.start()
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
+
+    @property
+    def records(self) -> int:
+        return self._records
+
+    def put(self, conn_id: int, direction: CaptureDirection, data: ReadableBuffer = b''):
+        dlen = len(data)
+
+        with self._lock:
+            if self._closed or self._queue_bytes + dlen > self._max_queue_bytes:
+                self._dropped += 1
+                return
+            self._queue_bytes += dlen
+            self._records += 1
+
+        head = _RECORD_HEAD.pack(time.time(), conn_id, direction, dlen)
+        # copy data, the buffer may be reused after return
+        self._que.put((head, bytes(data)))
+
+    def _run(self):
+        f = self._file
+        while True:
+            item = self._que.get()
+            if item is None:
+                break
+
+            head, data = item
+            try:
+                f.write(head)
+                f.write(data)
+            except OSError:
+                _logger.exception('Exception when write capture file')
+
+            with self._lock:
+                self._queue_bytes -= len(data)
+
+            if self._que.empty():
+                f.flush()
+
+        f.close()
+
+    def _stop(self) -> bool:
+        with self._lock:
+            if self._closed:
+                return False
+            self._closed = True
+
+        self._que.put(None)
+        return True
+
+    def close(self):
+        '''
+        Write all queued records and close the file, this blocks until
+        the writer thread exits, use aclose in a running event loop.
+        '''
+        if self._stop():
+            self._thread.join()
+
+    async def aclose(self):
+        '''The same as close, but wait for the writer thread in executor'''
+        if self._stop():
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self._thread.join)
+
+
+class CaptureTransformer(BasicTransformer):
+    def __init__(self, writer: CaptureWriter, *, sample_rate: float = 1.0):
+        '''
+        Record the bytes passing this layer into writer,
+        each connection is captured with probability sample_rate.
+        '''
+        super().__init__()
+        self._writer: CaptureWriter = writer
+        self._sampled: bool = random.random() < sample_rate
+        self._conn_id: int = next(_CONN_ID)
+
+    @property
+    def conn_id(self) -> int:
+        return self._conn_id
+
+    @property
+    def sampled(self) -> bool:
+        return self._sampled
+
+    async def prepare(self):
+        if self._sampled:
+            self._writer.put(self._conn_id, CaptureDirection.OPEN)
+
+    async def finish(self):
+        if self._sampled:
+            self._writer.put(self._conn_id, CaptureDirection.CLOSE)
+
+    async def read(self, max_bytes: int = -1, *,
+            buffer: WritableBuffer = None) -> ReadRetType:
+        ret = await self._nxt.read(max_bytes, buffer=buffer)
+
+        if self._sampled:
+            if buffer is None:
+                self._writer.put(self._conn_id, CaptureDirection.READ, ret)
+            else:
+                with memoryview(buffer) as view:
+                    self._writer.put(self._conn_id, CaptureDirection.READ, view[:ret])
+        return ret
+
+    async def write(self, buffer: ReadableBuffer) -> int:
+        ret = await self._nxt.write(buffer)
+
+        if self._sampled:
+            with memoryview(buffer) as view:
+                self._writer.put(self._conn_id, CaptureDirection.WRITE, view[:ret])
+        return ret
+
+    async def write_vectored(self, buffers: Sequence[ReadableBuffer]) -> int:
+        if not self._sampled:
+            return await self._nxt.write_vectored(buffers)
+        return await super().write_vectored(buffers)
+
+    async def sendfile(self, file: io.BufferedIOBase, offset: int = 0,
+            count: int = None) -> int:
+        if not self._sampled:
+            return await self._nxt.sendfile(file, offset, count)
+        return await super().sendfile(file, offset, count)
+
+
+def iter_capture(path: str) -> Iterator[CaptureRecord]:
+    '''Iterate records in a capture file written by CaptureWriter'''
+    with open(path, 'rb') as f:
+        if f.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise CommException('BadCaptureFile: magic mismatch', path=path)
+
+        hsize = _RECORD_HEAD.size
+        while True:
+            head = f.read(hsize)
+            if len(head) < hsize:
+                break
+
+            ts, conn_id, direction, dlen = _RECORD_HEAD.unpack(head)
+            data = f.read(dlen)
+            if len(data) < dlen:
+                break
+            yield CaptureRecord(ts, conn_id, CaptureDirection(direction), data)
+
+
+class CaptureReplayAdaptor(BasicAdaptor):
+    def __init__(self, records: List[CaptureRecord], conn_id: int, *,
+            direction: CaptureDirection = CaptureDirection.READ):
+        '''
+        Serve the recorded bytes of a connection in one direction as
+        reads, with the same boundaries as captured; writes are discarded.
+        '''
+        super().__init__()
+        self._chunks: List[bytes] = [
+            r.data for r in records
+            if r.conn_id == conn_id and r.direction == direction
+        ]
+        self._idx: int = 0
+        self._que: BufferQueue = BufferQueue()
+        self._written: int = 0
+
+    @property
+    def written(self) -> int:
+        return self._written
+
+    async def read(self, max_bytes: int = -1, *,
+            buffer: WritableBuffer = None) -> ReadRetType:
+        while len(self._que) == 0:
+            if self._idx >= len(self._chunks):
+                raise AdaptorEofError('CaptureReplayAdaptorEof')
+            self._que.put(self._chunks[self._idx])
+            self._idx += 1
+
+        return self._que.get(max_bytes, buffer=buffer)
+
+    async def write(self, buffer: ReadableBuffer) -> int:
+        self._written += len(buffer)
+        return len(buffer)
+
+
+async def replay_capture(path: str, c: CommunicateBase, conn_id: int, *,
+        direction: CaptureDirection = CaptureDirection.WRITE,
+        keep_timing: bool = False) -> int:
+    '''
+    Write the recorded bytes of a connection in one direction into c,
+    sleep between records as captured if keep_timing,
+    return the number of bytes written.
+    '''
+    tot, last = 0, None
+    for r in iter_capture(path):
+        if r.conn_id != conn_id or r.direction != direction:
+            continue
+
+        if keep_timing and last is not None and r.timestamp > last:
+            await asyncio.sleep(r.timestamp - last)
+        last = r.timestamp
+
+        tot += await c.write_all(r.data, flush=False)
+
+    await c.flush()
+    return tot
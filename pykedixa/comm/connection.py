@@ -39,9 +39,20 @@ class Connection:
     def lock(self) -> asyncio.Lock:
         return self._lock
 
+    @property
+    def depth(self) -> int:
+        '''The number of transformers bound on the adaptor'''
+        return len(self._comms)
+
     @property
     def info(self) -> str:
-        return 'TODO'
+        '''Describe the adaptor and transformers, from bottom to top'''
+        adaptor = self._adaptor
+        name = type(adaptor).__name__
+        addr = getattr(adaptor, 'addr', None)
+        layers = [name if addr is None else f'{name}({addr.info})']
+        layers.extend(type(c).__name__ for c in self._comms)
+        return ' > '.join(layers)
 
     @property
     def context(self):
@@ -100,7 +111,7 @@ class Connection:
 
     async def unbind(self, *, type=None) -> Union[BasicTransformer, None]:
         if len(self._comms) > 0 and (type is None or isinstance(self.c, type)):
-            ret: BasicTransformer = self.c
+            ret: BasicTransformer = self._comms.pop()
             self._c = self._comms[-1] if len(self._comms) > 0 else self._adaptor
             await ret.finish()
             return ret
@@ -0,0 +1,327 @@
+import asyncio
+import logging
+import ssl
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Tuple
+
+from .basic import BasicAdaptor
+from .address import SocketAddress
+from .connection import Connection
+from .exception import CommException
+from .socket_adaptor import TcpAdaptor
+from .ssl_transformer import SslTransformer
+
+__all__ = [
+    'ConnectionPool',
+    'ConnectionPoolError',
+]
+
+_logger = logging.getLogger('kedixa.comm.connection_pool')
+
+AdaptorFactory = Callable[[SocketAddress], BasicAdaptor]
+# the context itself is kept, an id may be reused after it is collected
+PoolKey = Tuple[str, ssl.SSLContext, str]
+
+
+class ConnectionPoolError(CommException):
+    pass
+
+
+class _HostPool:
+    def __init__(self):
+        # (idle since, connection), the last one is the most recently used
+        self.idle: List[Tuple[float, Connection]] = []
+        # connections opened or being opened, include idle ones
+        self.total: int = 0
+
+
+class _PooledConnection:
+    def __init__(self, pool: 'ConnectionPool', addr: SocketAddress, kwargs: dict):
+        self._pool: 'ConnectionPool' = pool
+        self._addr: SocketAddress = addr
+        self._kwargs: dict = kwargs
+        self._conn: Connection = None
+
+    async def __aenter__(self) -> Connection:
+        self._conn = await self._pool.acquire(self._addr, **self._kwargs)
+        return self._conn
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        conn, self._conn = self._conn, None
+        await self._pool.release(conn, reuse=exc_type is None)
+
+
+class ConnectionPool:
+    def __init__(self, *,
+            max_per_host: int = 8,
+            max_total: int = 256,
+            idle_timeout: float = 60.0,
+            adaptor_factory: AdaptorFactory = TcpAdaptor):
+        '''
+        Keep opened connections by address and transformer stack for reuse.
+        At most max_per_host connections per key and max_total connections
+        in all, acquire waits when the limit is reached. Connections idle
+        for more than idle_timeout seconds are closed.
+        '''
+        self._max_per_host: int = max_per_host
+        self._max_total: int    = max_total
+        self._idle_timeout: float = idle_timeout
+        self._factory: AdaptorFactory = adaptor_factory
+
+        self._hosts: Dict[PoolKey, _HostPool] = {}
+        self._keys: Dict[Connection, Tuple[PoolKey, int]] = {}
+        self._total: int = 0
+        self._waiters: Deque[Tuple[PoolKey, asyncio.Future]] = deque()
+        self._sweeper: asyncio.TimerHandle = None
+        self._closed: bool = False
+
+        self._hits: int = 0
+        self._misses: int = 0
+
+    @property
+    def total(self) -> int:
+        '''The number of connections opened by this pool, include idle ones'''
+        return self._total
+
+    @property
+    def idle(self) -> int:
+        return sum(len(h.idle) for h in self._hosts.values())
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'total': self._total,
+            'idle': self.idle,
+            'hits': self._hits,
+            'misses': self._misses,
+            'waiters': len(self._waiters),
+        }
+
+    @staticmethod
+    def _make_key(addr: SocketAddress, ssl_ctx: ssl.SSLContext,
+            server_hostname: str) -> PoolKey:
+        return (addr.info, ssl_ctx, server_hostname)
+
+    def connection(self, addr: SocketAddress, *,
+            ssl_ctx: ssl.SSLContext = None,
+            server_hostname: str = None) -> _PooledConnection:
+        '''
+        async with pool.connection(addr) as conn: ...
+        The connection is released to pool when exit normally,
+        and closed when exit with exception.
+        '''
+        kwargs = {'ssl_ctx': ssl_ctx, 'server_hostname': server_hostname}
+        return _PooledConnection(self, addr, kwargs)
+
+    async def acquire(self, addr: SocketAddress, *,
+            ssl_ctx: ssl.SSLContext = None,
+            server_hostname: str = None) -> Connection:
+        '''
+        Return an idle connection to addr with the same transformer stack,
+        or open a new one; wait if the pool is exhausted.
+        The connection must be given back by release.
+        '''
+        key = self._make_key(addr, ssl_ctx, server_hostname)
+
+        while True:
+            if self._closed:
+                raise ConnectionPoolError('ConnectionPool: pool closed')
+
+            host = self._get_host(key)
+            conn = self._pop_idle(host)
+            if conn is not None:
+                self._hits += 1
+                return conn
+
+            if host.total < self._max_per_host:
+                if self._total >= self._max_total:
+                    self._evict_one()
+
+                if self._total < self._max_total:
+                    break
+
+            waiter = asyncio.get_event_loop().create_future()
+            self._waiters.append((key, waiter))
+            try:
+                await waiter
+            except BaseException:
+                if waiter.done() and not waiter.cancelled():
+                    # woken but cancelled, pass the wakeup on
+                    self._wakeup()
+                raise
+            finally:
+                if not waiter.done():
+                    waiter.cancel()
+                try:
+                    self._waiters.remove((key, waiter))
+                except ValueError:
+                    pass
+
+        # reserve before open, others see the limit while we await
+        self._misses += 1
+        host = self._get_host(key)
+        host.total += 1
+        self._total += 1
+
+        try:
+            conn = await self._open(addr, ssl_ctx, server_hostname)
+        except:
+            self._forget(key)
+            raise
+
+        self._keys[conn] = (key, conn.depth)
+        return conn
+
+    async def _open(self, addr: SocketAddress, ssl_ctx: ssl.SSLContext,
+            server_hostname: str) -> Connection:
+        conn = Connection(self._factory(addr))
+
+        try:
+            await conn.open()
+            if ssl_ctx is not None:
+                await conn.bind(SslTransformer(ssl_ctx, server_hostname))
+        except:
+            await conn.close()
+            raise
+
+        return conn
+
+    async def release(self, conn: Connection, *, reuse: bool = True):
+        '''
+        Give back the connection, transformers bound after acquire are
+        unbound. If reuse is False or the connection is not reusable,
+        it will be closed.
+        '''
+        key, depth = self._keys.get(conn, (None, 0))
+        if key is None:
+            raise ConnectionPoolError('ConnectionPool: unknown connection')
+
+        if reuse and not self._closed and not conn.closed():
+            try:
+                while conn.depth > depth:
+                    await conn.unbind()
+            except Exception as e:
+                _logger.info(f'Unbind failed when release connection {e}')
+                reuse = False
+
+            reuse = reuse and conn.adaptor.is_healthy()
+        else:
+            reuse = False
+
+        if reuse:
+            self._hosts[key].idle.append((time.monotonic(), conn))
+            self._schedule_sweep()
+            self._wakeup()
+        else:
+            await self._close_conn(conn)
+
+    async def close(self):
+        '''Close all idle connections and fail all waiters'''
+        self._closed = True
+
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+        conns = []
+        for host in self._hosts.values():
+            conns.extend(conn for _, conn in host.idle)
+            host.idle.clear()
+
+        for conn in conns:
+            await self._close_conn(conn)
+
+        for _, waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _get_host(self, key: PoolKey) -> _HostPool:
+        host = self._hosts.get(key)
+        if host is None:
+            host = self._hosts[key] = _HostPool()
+        return host
+
+    def _pop_idle(self, host: _HostPool) -> Connection:
+        now = time.monotonic()
+        while host.idle:
+            since, conn = host.idle.pop()
+
+            if now - since > self._idle_timeout or not conn.adaptor.is_healthy():
+                self._close_later(conn)
+                continue
+            return conn
+
+        return None
+
+    def _evict_one(self):
+        '''Close the oldest idle connection to make room for another host'''
+        oldest, target = None, None
+        for host in self._hosts.values():
+            if host.idle and (oldest is None or host.idle[0][0] < oldest):
+                oldest, target = host.idle[0][0], host
+
+        if target is not None:
+            _, conn = target.idle.pop(0)
+            self._close_later(conn)
+
+    def _forget(self, key: PoolKey):
+        host = self._hosts[key]
+        host.total -= 1
+        self._total -= 1
+
+        if host.total == 0 and not host.idle:
+            del self._hosts[key]
+        self._wakeup()
+
+    async def _close_quietly(self, conn: Connection):
+        try:
+            await conn.close()
+        except Exception as e:
+            _logger.info(f'Exception when close pooled connection {e}')
+
+    async def _close_conn(self, conn: Connection):
+        key, _ = self._keys.pop(conn)
+        try:
+            await self._close_quietly(conn)
+        finally:
+            self._forget(key)
+
+    def _close_later(self, conn: Connection):
+        # the connection leaves the pool at once, close it in background
+        key, _ = self._keys.pop(conn)
+        self._forget(key)
+        asyncio.ensure_future(self._close_quietly(conn))
+
+    def _can_acquire(self, key: PoolKey) -> bool:
+        host = self._hosts.get(key)
+        if host is not None:
+            if host.idle:
+                return True
+            if host.total >= self._max_per_host:
+                return False
+        return self._total < self._max_total or self.idle > 0
+
+    def _wakeup(self):
+        '''Wake the first waiter that can go on, only one at a time'''
+        for key, waiter in self._waiters:
+            if not waiter.done() and self._can_acquire(key):
+                waiter.set_result(None)
+                break
+
+    def _schedule_sweep(self):
+        if self._sweeper is None:
+            loop = asyncio.get_event_loop()
+            self._sweeper = loop.call_later(self._idle_timeout, self._sweep)
+
+    def _sweep(self):
+        self._sweeper = None
+        now = time.monotonic()
+
+        for host in list(self._hosts.values()):
+            # idle list is ordered by idle since, the oldest first
+            while host.idle and now - host.idle[0][0] > self._idle_timeout:
+                _, conn = host.idle.pop(0)
+                self._close_later(conn)
+
+        if self.idle > 0:
+            self._schedule_sweep()
@@ -0,0 +1,143 @@
+import asyncio
+import copy
+import logging
+import socket
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from . import address
+from .address import SocketAddress
+
+__all__ = [
+    'AddrInfoCache',
+]
+
+_logger = logging.getLogger('kedixa.comm.dns_cache')
+
+CacheKey = Tuple[str, int, int, int, int]
+
+
+class _CacheEntry:
+    def __init__(self, addrs: List[SocketAddress], error: Exception, expire: float):
+        self.addrs: List[SocketAddress] = addrs
+        self.error: Exception   = error
+        self.expire: float      = expire
+        self.hits: int          = 0
+
+
+class AddrInfoCache:
+    def __init__(self, *,
+            ttl: float = 60.0,
+            negative_ttl: float = 5.0,
+            max_size: int = 1024,
+            refresh_ahead: float = 0.2,
+            refresh_min_hits: int = 2):
+        '''
+        Cache of getaddrinfo results, successful results live for ttl seconds
+        and failures for negative_ttl seconds. Concurrent lookups of the same
+        key share one resolution. An entry hit at least refresh_min_hits times
+        is refreshed in background when it's in the last refresh_ahead
+        fraction of its ttl. At most max_size entries are kept, the least
+        recently used one is dropped first.
+        '''
+        self._ttl: float            = ttl
+        self._negative_ttl: float   = negative_ttl
+        self._max_size: int         = max_size
+        self._refresh_ahead: float  = ttl * refresh_ahead
+        self._refresh_min_hits: int = refresh_min_hits
+
+        self._entries: 'OrderedDict[CacheKey, _CacheEntry]' = OrderedDict()
+        self._inflight: Dict[CacheKey, asyncio.Future] = {}
+
+        self._hits: int         = 0
+        self._misses: int       = 0
+        self._refreshes: int    = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'size': len(self._entries),
+            'inflight': len(self._inflight),
+            'hits': self._hits,
+            'misses': self._misses,
+            'refreshes': self._refreshes,
+        }
+
+    def invalidate(self, host: str = None):
+        '''Drop cached entries of host, or all entries if host is None'''
+        if host is None:
+            self._entries.clear()
+        else:
+            for key in [k for k in self._entries if k[0] == host]:
+                del self._entries[key]
+
+    async def resolve(self, host: str, port: int, *,
+            family: int = socket.AF_INET,
+            socktype: int = socket.SOCK_STREAM,
+            proto: int = 0) -> List[SocketAddress]:
+        key = (host, port, family, socktype, proto)
+        entry = self._entries.get(key)
+        now = time.monotonic()
+
+        if entry is not None and now < entry.expire:
+            self._hits += 1
+            entry.hits += 1
+            self._entries.move_to_end(key)
+
+            if entry.error is not None:
+                # a fresh copy, so the traceback of the saved one never grows
+                raise copy.copy(entry.error)
+
+            if (entry.expire - now < self._refresh_ahead and
+                    entry.hits >= self._refresh_min_hits and
+                    key not in self._inflight):
+                self._refreshes += 1
+                self._start(key, refresh=True)
+
+            return list(entry.addrs)
+
+        self._misses += 1
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = self._start(key, refresh=False)
+
+        # a cancelled lookup should not cancel the shared one
+        addrs = await asyncio.shield(fut)
+        return list(addrs)
+
+    def _start(self, key: CacheKey, refresh: bool) -> asyncio.Future:
+        fut = asyncio.ensure_future(self._do_resolve(key, refresh))
+        self._inflight[key] = fut
+
+        # nobody waits for a refresh, and waiters of a shielded lookup may
+        # all be cancelled, always retrieve the exception
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return fut
+
+    async def _do_resolve(self, key: CacheKey, refresh: bool) -> List[SocketAddress]:
+        try:
+            addrs = await address._resolve_addrinfo(*key)
+        except OSError as e:
+            if refresh:
+                # keep the old entry until it expires
+                _logger.info(f'Refresh {key[0]}:{key[1]} failed {e}')
+            else:
+                self._save(key, _CacheEntry(None, e, time.monotonic() + self._negative_ttl))
+            raise
+        else:
+            self._save(key, _CacheEntry(addrs, None, time.monotonic() + self._ttl))
+            return addrs
+        finally:
+            self._inflight.pop(key, None)
+
+    def _save(self, key: CacheKey, entry: _CacheEntry):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            entry.hits = old.hits
+
+        self._entries[key] = entry
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
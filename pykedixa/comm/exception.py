@@ -4,6 +4,7 @@ __all__ = [
     'AdaptorEofError',
     'TransformerException',
     'TransformerEofError',
+    'TransformerTimeoutError',
     'BadMessage',
 ]
 
@@ -39,6 +40,10 @@ class TransformerEofError(TransformerException):
     pass
 
 
+class TransformerTimeoutError(TransformerException):
+    pass
+
+
 class BadMessage(CommException):
     pass
 
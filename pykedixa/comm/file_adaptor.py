@@ -1,49 +1,523 @@
+import asyncio
 import io
+import mmap
+import os
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from concurrent.futures import Future
+from typing import Deque, List, Set, Tuple
 
 from .basic import (
     AdaptorEofError,
+    AdaptorException,
     BasicAdaptor,
 
     ReadableBuffer,
     ReadRetType,
     WritableBuffer,
+    DEFAULT_MAX_READ_SIZE,
+    pread_into,
 )
 
 __all__ = [
     'FileAdaptor',
+    'shutdown_file_executor',
 ]
 
 
+DEFAULT_FILE_BLOCK_SIZE: int = 2 ** 16
+DEFAULT_FILE_WORKERS: int = 4
+
+_file_executor: Executor = None
+
+
+def _get_file_executor() -> Executor:
+    global _file_executor
+    if _file_executor is None:
+        _file_executor = ThreadPoolExecutor(DEFAULT_FILE_WORKERS,
+            thread_name_prefix='kedixa-file')
+    return _file_executor
+
+
+def shutdown_file_executor(wait: bool = True):
+    '''
+    Shut down the thread pool shared by FileAdaptors created without
+    executor, it is created again by the next FileAdaptor. Threads of
+    the pool are not daemon, an idle pool does not block exit.
+    '''
+    global _file_executor
+    executor, _file_executor = _file_executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def _can_pread(file: io.IOBase, mode: str) -> bool:
+    # text files, pipes and platforms without pread use the file object
+    return ('b' in mode and hasattr(os, 'pread') and hasattr(os, 'pwrite')
+        and file.seekable())
+
+
+def _pwrite_all(fd: int, data: ReadableBuffer, pos: int) -> int:
+    with memoryview(data) as view:
+        tot = 0
+        while tot < len(view):
+            tot += os.pwrite(fd, view[tot:], pos + tot)
+    return tot
+
+
+def _write_batch(file: io.RawIOBase, batch: List[Tuple[int, bytes]]):
+    for pos, data in batch:
+        if pos < 0:
+            file.write(data)
+        else:
+            _pwrite_all(file.fileno(), data, pos)
+
+
 class FileAdaptor(BasicAdaptor):
-    def __init__(self, filepath: str, mode: str = 'rb'):
+    def __init__(self, filepath: str, mode: str = 'rb', *,
+            offset: int = None,
+            length: int = -1,
+            file: io.RawIOBase = None,
+            executor: Executor = None,
+            block_size: int = DEFAULT_FILE_BLOCK_SIZE,
+            read_ahead: int = 1,
+            write_behind: int = 0,
+            use_mmap: bool = False,
+            mmap_advice: int = None):
+        '''
+        File I/O runs in executor, a dedicated thread pool if None,
+        so that slow disks never block the event loop.
+        Reads prefetch read_ahead blocks of block_size bytes in background,
+        if read_ahead is 0, each read goes to the file directly.
+        Writes return after the data is copied, when at most write_behind
+        bytes are not yet written, flush waits all of them be written;
+        if write_behind is 0, each write waits until it is written.
+
+        Seekable binary files are read and written at explicit positions
+        by os.pread/os.pwrite, others such as text files and pipes by the
+        methods of the file object, without read ahead.
+
+        If offset is not None, read and write the window of length bytes
+        (until the end of file if < 0) from offset by os.pread/os.pwrite,
+        the file must be a seekable binary file.
+        If file is not None, use the opened file instead of open filepath,
+        and do not close it in finish, see FileAdaptor.window.
+
+        If use_mmap, reads are served from a read-only map of the file,
+        read without buffer returns memoryview of the map without copy,
+        and mmap_advice such as mmap.MADV_SEQUENTIAL is given to madvise.
+        Page faults block the loop, so use it for files in page cache.
+        '''
         self._filepath: str = filepath
         self._mode: str     = mode
-        self._file: io.RawIOBase = None
+        self._file: io.RawIOBase = file
+        self._owner: bool   = file is None
+        self._fd: int       = -1
+        self._positional: bool = False
+
+        self._executor: Executor = executor or _get_file_executor()
+        self._block_size: int   = block_size
+        self._read_ahead: int   = read_ahead
+        self._write_behind: int = write_behind
+
+        self._use_mmap: bool    = use_mmap
+        self._mmap_advice: int  = mmap_advice
+        self._map: mmap.mmap    = None
+        self._map_view: memoryview = None
+        # file offset of _map_view[0], and the map of the parent if shared
+        self._map_base: int     = 0
+        self._map_parent: 'FileAdaptor' = None
+
+        self._offset: int   = offset
+        self._end: int      = -1
+        if offset is not None and length >= 0:
+            self._end = offset + length
+
+        # logical read position, and blocks prefetched after it
+        self._pos: int      = 0
+        self._ahead: Deque[Tuple[asyncio.Future, int]] = deque()
+        self._ahead_pos: int = 0
+        self._ahead_eof: bool = False
+        self._rbuf: bytes   = b''
+        self._rstart: int   = 0
+        # reads running in executor, they must end before the file is closed
+        self._reads: Set[Future] = set()
+
+        # data waiting to be written in order by one job at a time, at _pos
+        # by os.pwrite, or by file.write if _append, shared with reads
+        self._append: bool  = True
+        self._wque: List[Tuple[int, bytes]] = []
+        self._wpending: int = 0
+        self._writer: asyncio.Future = None
+        self._wexc: BaseException = None
+
+    @property
+    def file(self) -> io.RawIOBase:
+        '''The file object opened in prepare'''
+        return self._file
+
+    def tell(self) -> int:
+        '''The position of the next read or write'''
+        return self._pos
+
+    def remaining(self) -> int:
+        '''The number of bytes left in the window, -1 if not limited'''
+        if self._end < 0:
+            return -1
+        return max(0, self._end - self._pos)
+
+    def window(self, offset: int, length: int = -1, **kwargs) -> 'FileAdaptor':
+        '''
+        Create a FileAdaptor on the window of this opened file, windows
+        share the file descriptor and can be used concurrently, but should
+        finish before this one. kwargs are passed to FileAdaptor.
+        With use_mmap, windows share the map of this one if any, else
+        each maps only its own range.
+        '''
+        kwargs.setdefault('executor', self._executor)
+        kwargs.setdefault('block_size', self._block_size)
+        kwargs.setdefault('read_ahead', self._read_ahead)
+        kwargs.setdefault('use_mmap', self._use_mmap)
+        fa = FileAdaptor(self._filepath, self._mode,
+            offset=offset, length=length, file=self._file, **kwargs)
+        fa._map_parent = self
+        return fa
+
+    def seek(self, pos: int):
+        '''Set the position of the next read, data prefetched is dropped'''
+        if not self._positional and self._file is not None:
+            self._file.seek(pos)
+        self._pos = self._ahead_pos = pos
+        self._drop_ahead()
+        self._ahead_eof = False
+        self._rbuf, self._rstart = b'', 0
+
+    def can_sendfile(self) -> bool:
+        '''Whether the file can be the source of CommunicateBase.sendfile'''
+        return self._positional and self._file.readable()
+
+    def _run(self, func, *args) -> asyncio.Future:
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(self._executor, func, *args)
+
+    def _run_read(self, func, *args) -> asyncio.Future:
+        # cancel the returned future does not stop the thread,
+        # so keep the concurrent future until it is done
+        cf = self._executor.submit(func, *args)
+        self._reads.add(cf)
+        cf.add_done_callback(self._reads.discard)
+        return asyncio.wrap_future(cf)
 
     async def prepare(self):
-        self._file = open(self._filepath, self._mode)
+        if self._file is None:
+            self._file = await self._run(open, self._filepath, self._mode)
+        self._fd = self._file.fileno()
+        self._positional = _can_pread(self._file, self._mode)
+
+        if not self._positional:
+            if self._offset is not None:
+                raise AdaptorException('FileAdaptor: window needs a seekable binary file',
+                    mode=self._mode)
+            self._pos = self._file.tell() if self._file.seekable() else 0
+            return
+
+        if self._use_mmap:
+            await self._run(self._open_map)
+
+        self._append = 'a' in self._mode
+        if self._offset is not None:
+            self.seek(self._offset)
+        else:
+            self.seek(self._file.tell())
 
     async def finish(self):
-        self._file.close()
+        try:
+            if self._file.writable():
+                await self.flush()
+        finally:
+            await self._wait_reads()
+            self._close_map()
+            if self._owner:
+                await self._run(self._file.close)
+
+    async def _wait_reads(self):
+        # reads in flight, including prefetched blocks, use the descriptor
+        reads = [asyncio.wrap_future(cf) for cf in list(self._reads)]
+        if reads:
+            await asyncio.wait(reads)
+
+        self._drop_ahead()
+
+    def _open_map(self):
+        parent = self._map_parent
+        if parent is not None and parent._map_view is not None \
+                and parent._map_base <= self._offset and (parent._end < 0
+                or 0 <= self._end <= parent._map_base + len(parent._map_view)):
+            # slices of the parent's view, which is released after this one
+            self._map_view = parent._map_view
+            self._map_base = parent._map_base
+            return
+
+        self._map_parent = None
+        size = os.fstat(self._fd).st_size
+        if self._end >= 0:
+            size = min(size, self._end)
+
+        # the offset of mmap must be a multiple of ALLOCATIONGRANULARITY
+        start = self._offset or 0
+        base = start - start % mmap.ALLOCATIONGRANULARITY
+        if size <= base:
+            # empty range can not be mapped
+            self._map_view = memoryview(b'')
+            self._map_base = base
+            return
+
+        self._map = mmap.mmap(self._fd, size - base, access=mmap.ACCESS_READ,
+            offset=base)
+        if self._mmap_advice is not None and hasattr(self._map, 'madvise'):
+            self._map.madvise(self._mmap_advice)
+        self._map_view = memoryview(self._map)
+        self._map_base = base
+
+    def _close_map(self):
+        if self._map_parent is not None:
+            self._map_view = None
+            return
+
+        if self._map_view is not None:
+            self._map_view.release()
+            self._map_view = None
+
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # memoryview returned by read is alive, the map
+                # is closed after all of them are released
+                pass
+            self._map = None
+
+    def _read_map(self, max_bytes: int, buffer: WritableBuffer) -> ReadRetType:
+        end = self._map_base + len(self._map_view)
+        if self._end >= 0:
+            end = min(end, self._end)
+
+        n = end - self._pos
+        if max_bytes >= 0:
+            n = min(n, max_bytes)
+        if n <= 0:
+            raise AdaptorEofError('FileAdaptorEof')
+
+        start = self._pos - self._map_base
+        if start < 0:
+            raise AdaptorException('FileAdaptor: read before the mapped range',
+                pos=self._pos, base=self._map_base)
+
+        data = self._map_view[start:start+n]
+        self._pos += n
+
+        if buffer is None:
+            return data
+
+        buffer[:n] = data
+        data.release()
+        return n
+
+    def _drop_ahead(self):
+        # blocks already being read are waited in finish
+        for fut, _ in self._ahead:
+            if not fut.cancel() and not fut.cancelled():
+                fut.exception()
+        self._ahead.clear()
+
+    def _fill_ahead(self):
+        while len(self._ahead) < self._read_ahead and not self._ahead_eof:
+            size = self._block_size
+            if self._end >= 0:
+                size = min(size, self._end - self._ahead_pos)
+                if size <= 0:
+                    self._ahead_eof = True
+                    break
+
+            fut = self._run_read(os.pread, self._fd, size, self._ahead_pos)
+            self._ahead.append((fut, size))
+            self._ahead_pos += size
+
+    async def _read_into(self, func, *args) -> int:
+        fut = self._run_read(func, *args)
+        try:
+            return await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            # the thread still writes into the buffer of the caller,
+            # which can be released only after that
+            await asyncio.wait([fut])
+            raise
+
+    async def _read_direct(self, max_bytes: int, buffer: WritableBuffer) -> ReadRetType:
+        if self._end >= 0:
+            max_bytes = min(max_bytes, self._end - self._pos)
+            if max_bytes <= 0:
+                raise AdaptorEofError('FileAdaptorEof')
+
+        if buffer is not None:
+            with memoryview(buffer) as view, view[:max_bytes] as v:
+                ret = await self._read_into(pread_into, self._fd, v, self._pos)
+            nread = ret
+        else:
+            ret = await self._run_read(os.pread, self._fd, max_bytes, self._pos)
+            nread = len(ret)
+
+        if nread == 0:
+            raise AdaptorEofError('FileAdaptorEof')
+
+        self._pos += nread
+        self._ahead_pos = self._pos
+        return ret
+
+    async def _read_stream(self, max_bytes: int, buffer: WritableBuffer) -> ReadRetType:
+        # binary files return what is available, for example from a pipe,
+        # text files read max_bytes characters, or until the end if < 0
+        if buffer is not None:
+            readinto = getattr(self._file, 'readinto1', self._file.readinto)
+            with memoryview(buffer) as view, view[:max_bytes] as v:
+                ret = await self._read_into(readinto, v)
+            nread = ret
+        else:
+            if 'b' in self._mode and hasattr(self._file, 'read1'):
+                if max_bytes < 0:
+                    max_bytes = self._block_size
+                ret = await self._run_read(self._file.read1, max_bytes)
+            else:
+                ret = await self._run_read(self._file.read, max_bytes)
+            nread = len(ret)
+
+        if not nread:
+            raise AdaptorEofError('FileAdaptorEof')
+
+        self._pos += nread
+        return ret
 
     async def read(self, max_bytes: int = -1, *,
             buffer: WritableBuffer = None) -> ReadRetType:
-        if buffer:
+        if buffer is not None and (max_bytes < 0 or max_bytes > len(buffer)):
+            max_bytes = len(buffer)
+
+        # read what is written before
+        await self._wait_writer()
+
+        if not self._positional:
+            return await self._read_stream(max_bytes, buffer)
+
+        if self._map_view is not None:
             if max_bytes < 0:
-                max_bytes = len(buffer)
+                max_bytes = DEFAULT_MAX_READ_SIZE
+            return self._read_map(max_bytes, buffer)
 
-            with memoryview(buffer) as view:
-                ret = self._file.readinto(view[:max_bytes])
+        if self._read_ahead <= 0:
+            if max_bytes < 0:
+                max_bytes = self._block_size
+            return await self._read_direct(max_bytes, buffer)
 
-            if ret == 0:
+        if self._rstart == len(self._rbuf):
+            self._fill_ahead()
+            if not self._ahead:
                 raise AdaptorEofError('FileAdaptorEof')
-        else:
-            ret = self._file.read(max_bytes)
-            if len(ret) == 0:
+
+            # keep the block if this read is cancelled
+            fut, size = self._ahead[0]
+            data = await asyncio.shield(fut)
+            self._ahead.popleft()
+            self._rbuf, self._rstart = data, 0
+
+            if len(data) < size:
+                self._ahead_eof = True
+                self._drop_ahead()
+            self._fill_ahead()
+
+            if not data:
                 raise AdaptorEofError('FileAdaptorEof')
 
-        return ret
+        avail = len(self._rbuf) - self._rstart
+        n = avail if max_bytes < 0 else min(max_bytes, avail)
+        start = self._rstart
+        self._rstart += n
+        self._pos += n
+
+        if buffer is None:
+            if start == 0 and n == len(self._rbuf):
+                return self._rbuf
+            return self._rbuf[start:start+n]
+        else:
+            buffer[:n] = self._rbuf[start:start+n]
+            return n
+
+    def _start_writer(self):
+        batch, self._wque = self._wque, []
+        nbytes = sum(len(b) for _, b in batch)
+        self._writer = self._run(_write_batch, self._file, batch)
+
+        def done(fut: asyncio.Future):
+            self._wpending -= nbytes
+            self._writer = None
+            if fut.cancelled():
+                self._wexc = asyncio.CancelledError()
+            elif fut.exception() is not None:
+                self._wexc = fut.exception()
+            elif self._wque:
+                self._start_writer()
+
+        self._writer.add_done_callback(done)
+
+    def _check_write_error(self):
+        if self._wexc is not None:
+            raise self._wexc
 
     async def write(self, buffer: ReadableBuffer) -> int:
-        return self._file.write(buffer)
+        self._check_write_error()
+
+        blen = len(buffer)
+        pos = -1 if self._append else self._pos
+        if self._end >= 0 and pos >= 0 and pos + blen > self._end:
+            raise AdaptorException('FileAdaptor: write out of window',
+                offset=self._offset, end=self._end)
+
+        if self._write_behind <= 0:
+            if pos < 0:
+                ret = await self._run(self._file.write, buffer)
+                if not self._positional:
+                    self._pos += ret
+            else:
+                ret = await self._run(_pwrite_all, self._fd, buffer, pos)
+                self._advance(ret)
+            return ret
+
+        # str of text files is immutable, no need to copy
+        data = buffer if isinstance(buffer, str) else bytes(buffer)
+        self._wque.append((pos, data))
+        self._wpending += blen
+        if pos >= 0:
+            self._advance(blen)
+        elif not self._positional:
+            self._pos += blen
+        if self._writer is None:
+            self._start_writer()
+
+        while self._wpending > self._write_behind and self._writer is not None:
+            await asyncio.wait([self._writer])
+        self._check_write_error()
+        return blen
+
+    def _advance(self, nbytes: int):
+        # blocks read ahead may be overwritten
+        self.seek(self._pos + nbytes)
+
+    async def _wait_writer(self):
+        while self._writer is not None:
+            await asyncio.wait([self._writer])
+        self._check_write_error()
+
+    async def flush(self):
+        await self._wait_writer()
 
+        if self._file.writable():
+            await self._run(self._file.flush)
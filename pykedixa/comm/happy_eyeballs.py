@@ -0,0 +1,115 @@
+import asyncio
+import logging
+from typing import Callable, Dict, List
+
+from .basic import BasicAdaptor
+from .address import SocketAddress
+from .exception import AdaptorException
+from .socket_adaptor import TcpAdaptor
+
+__all__ = [
+    'happy_eyeballs_connect',
+]
+
+_logger = logging.getLogger('kedixa.comm.happy_eyeballs')
+
+DEFAULT_CONNECT_DELAY: float = 0.25
+
+
+def _interleave(addrs: List[SocketAddress]) -> List[SocketAddress]:
+    '''
+    Reorder addrs to alternate between address families,
+    start with the family of the first address, see RFC 8305 4.
+    '''
+    families: Dict[int, List[SocketAddress]] = {}
+    for addr in addrs:
+        families.setdefault(addr.family, []).append(addr)
+
+    lists = list(families.values())
+    ret = []
+    for i in range(max(len(x) for x in lists) if lists else 0):
+        for lst in lists:
+            if i < len(lst):
+                ret.append(lst[i])
+    return ret
+
+
+async def _finish_quietly(adaptor: BasicAdaptor):
+    try:
+        await adaptor.finish()
+    except Exception as e:
+        _logger.info(f'Exception when finish redundant adaptor {e}')
+
+
+async def happy_eyeballs_connect(addrs: List[SocketAddress], *,
+        delay: float = DEFAULT_CONNECT_DELAY,
+        adaptor_factory: Callable[[SocketAddress], BasicAdaptor] = TcpAdaptor
+        ) -> BasicAdaptor:
+    '''
+    Connect to addrs with staggered attempts, a new attempt starts when
+    the previous one fails or does not finish in delay seconds.
+    Return the first prepared adaptor, the other attempts are cancelled.
+    '''
+    if len(addrs) == 0:
+        raise AdaptorException('HappyEyeballs: no address to connect')
+
+    it = iter(_interleave(addrs))
+    attempts: Dict[asyncio.Future, BasicAdaptor] = {}
+    pending = set()
+    errors: List[Exception] = []
+    winner: BasicAdaptor = None
+    exhausted = False
+
+    def start_next():
+        nonlocal exhausted
+        addr = next(it, None)
+        if addr is None:
+            exhausted = True
+            return
+
+        adaptor = adaptor_factory(addr)
+        task = asyncio.ensure_future(adaptor.prepare())
+        attempts[task] = adaptor
+        pending.add(task)
+
+    start_next()
+
+    try:
+        while pending and winner is None:
+            timeout = None if exhausted else delay
+            done, _ = await asyncio.wait(pending, timeout=timeout,
+                return_when=asyncio.FIRST_COMPLETED)
+
+            failed = not done
+            for task in done:
+                pending.remove(task)
+                if task.cancelled():
+                    # cancelled by others, exception() would raise
+                    errors.append(AdaptorException('HappyEyeballs: attempt cancelled'))
+                    failed = True
+                elif task.exception() is not None:
+                    errors.append(task.exception())
+                    failed = True
+                elif winner is None:
+                    winner = attempts[task]
+                else:
+                    await _finish_quietly(attempts[task])
+
+            if winner is None and failed:
+                start_next()
+    finally:
+        for task in pending:
+            task.cancel()
+
+        if pending:
+            await asyncio.wait(pending)
+            for task in pending:
+                if not task.cancelled() and task.exception() is None:
+                    await _finish_quietly(attempts[task])
+
+    if winner is None:
+        if len(errors) == 1:
+            raise errors[0]
+        raise AdaptorException('HappyEyeballs: all attempts failed', errors=errors)
+
+    return winner
@@ -10,6 +10,7 @@ from ..exception import (
     TransformerEofError,
 )
 from ..read_until_transformer import ReadUntilTransformer
+from ..buffer_pool import default_buffer_pool
 
 __all__ = ['HttpChunkTransformer']
 
@@ -32,7 +33,9 @@ class HttpChunkTransformer(BasicTransformer):
             raise BadMessage(f'BadChunk: chunk length {data} isn\'t hex format')
 
         if chunk_len > 0:
-            self._buf.extend(await r.read_exactly(chunk_len))
+            with default_buffer_pool.acquire(chunk_len) as lease:
+                await r.read_exactly(chunk_len, buffer=lease.view)
+                self._buf.extend(lease.view)
             self._buflen = len(self._buf)
 
         eol = await r.read_exactly(end_len)
@@ -59,11 +62,13 @@ class HttpChunkTransformer(BasicTransformer):
 
     async def write(self, buffer: ReadableBuffer) -> int:
         blen = len(buffer)
-        buf = bytearray(hex(blen).lstrip('0x').encode())
-        buf.extend(b'\r\n')
-        buf.extend(buffer)
-        buf.extend(b'\r\n')
-        return await self._nxt.write_all(buf)
+        if blen == 0:
+            # empty chunk means the end of body, see flush
+            return 0
+
+        head = f'{blen:x}\r\n'.encode()
+        await self._nxt.write_all_vectored([head, buffer, b'\r\n'])
+        return blen
 
     async def flush(self):
         await self._nxt.write(b'0\r\n\r\n')
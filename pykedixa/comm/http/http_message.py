@@ -10,6 +10,7 @@ from ..basic import (
     StrHelper,
 )
 from ..read_until_transformer import ReadUntilTransformer
+from ..buffer_pool import default_buffer_pool
 from .http_code_map import get_http_code_phrase
 
 __all__ = [
@@ -253,7 +254,9 @@ class HttpMessage(MessageBase):
 
             # read chunk data and trailing \r\n
             if chunk_len > 0:
-                self._body.extend(await c.read_exactly(chunk_len))
+                with default_buffer_pool.acquire(chunk_len) as lease:
+                    await c.read_exactly(chunk_len, buffer=lease.view)
+                    self._body.extend(lease.view)
 
             eol = await c.read_exactly(end_len)
             if eol != line_end:
@@ -354,10 +357,10 @@ class HttpRequest(HttpMessage):
         data = data + self._headers.format_header() + '\r\n'
         data = data.encode()
 
-        if not self.is_empty_body():
-            data += self._body
-
-        await c.write_all(data)
+        if self.is_empty_body():
+            await c.write_all(data)
+        else:
+            await c.write_all_vectored([data, self._body])
 
     async def decode(self, c: CommunicateBase):
         await super().decode(c)
@@ -417,10 +420,10 @@ class HttpResponse(HttpMessage):
         data = data + self._headers.format_header() + '\r\n'
         data = data.encode()
 
-        if not self.is_empty_body():
-            data += self._body
-
-        await c.write_all(data)
+        if self.is_empty_body():
+            await c.write_all(data)
+        else:
+            await c.write_all_vectored([data, self._body])
 
     async def decode(self, c: CommunicateBase):
         await super().decode(c)
@@ -0,0 +1,160 @@
+import asyncio
+
+from .basic import (
+    BasicAdaptor,
+    BufferQueue,
+
+    ReadableBuffer,
+    ReadRetType,
+    WritableBuffer,
+)
+from .exception import (
+    AdaptorException,
+    AdaptorEofError,
+)
+
+__all__ = [
+    'MemoryPipe',
+    'MemoryPipeAdaptor',
+]
+
+
+DEFAULT_MEMORY_PIPE_SIZE: int = 2 ** 20
+
+
+class _PipeChannel:
+    '''One direction of a MemoryPipe'''
+    def __init__(self, maxsize: int):
+        self.que: BufferQueue   = BufferQueue()
+        self.maxsize: int       = maxsize
+        # the writer side will not write any more
+        self.eof: bool          = False
+        # the reader side will not read any more
+        self.closed: bool       = False
+
+        self._read_waiter: asyncio.Future   = None
+        self._write_waiter: asyncio.Future  = None
+
+    @staticmethod
+    def _wakeup(waiter: asyncio.Future):
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def wakeup_reader(self):
+        waiter, self._read_waiter = self._read_waiter, None
+        self._wakeup(waiter)
+
+    def wakeup_writer(self):
+        waiter, self._write_waiter = self._write_waiter, None
+        self._wakeup(waiter)
+
+    async def wait_readable(self):
+        assert self._read_waiter is None, 'Concurrent read on MemoryPipe'
+        self._read_waiter = asyncio.get_event_loop().create_future()
+        try:
+            await self._read_waiter
+        finally:
+            self._read_waiter = None
+
+    async def wait_writable(self):
+        assert self._write_waiter is None, 'Concurrent write on MemoryPipe'
+        self._write_waiter = asyncio.get_event_loop().create_future()
+        try:
+            await self._write_waiter
+        finally:
+            self._write_waiter = None
+
+
+class MemoryPipeAdaptor(BasicAdaptor):
+    '''
+    One end of a MemoryPipe. Read waits until data arrives,
+    write waits while the peer's buffer is full.
+    '''
+    def __init__(self, rchan: _PipeChannel, wchan: _PipeChannel):
+        super().__init__()
+        self._rchan: _PipeChannel = rchan
+        self._wchan: _PipeChannel = wchan
+
+    @property
+    def write_buffer_size(self) -> int:
+        '''The number of bytes written but not yet read by peer'''
+        return len(self._wchan.que)
+
+    def is_healthy(self) -> bool:
+        return not (self._rchan.eof or self._rchan.closed or self._wchan.closed)
+
+    async def finish(self):
+        self.write_eof()
+
+        rchan = self._rchan
+        rchan.closed = True
+        rchan.que.clear()
+        rchan.wakeup_writer()
+        rchan.wakeup_reader()
+
+    def can_write_eof(self) -> bool:
+        return True
+
+    def write_eof(self):
+        '''Half close, peer reads AdaptorEofError after all data consumed'''
+        if not self._wchan.eof:
+            self._wchan.eof = True
+            self._wchan.wakeup_reader()
+
+    async def read(self, max_bytes: int = -1, *,
+            buffer: WritableBuffer = None) -> ReadRetType:
+        rchan = self._rchan
+
+        while len(rchan.que) == 0:
+            if rchan.closed:
+                raise AdaptorException('MemoryPipeAdaptor: read after finish')
+            if rchan.eof:
+                raise AdaptorEofError('MemoryPipeAdaptorEof')
+            await rchan.wait_readable()
+
+        ret = rchan.que.get(max_bytes, buffer=buffer)
+        rchan.wakeup_writer()
+        return ret
+
+    async def write(self, buffer: ReadableBuffer) -> int:
+        wchan = self._wchan
+
+        while True:
+            if wchan.eof:
+                raise AdaptorException('MemoryPipeAdaptor: write after eof')
+            if wchan.closed:
+                raise AdaptorException('MemoryPipeAdaptor: closed by peer')
+
+            space = wchan.maxsize - len(wchan.que)
+            if space > 0 or len(buffer) == 0:
+                break
+            await wchan.wait_writable()
+
+        blen = min(len(buffer), space)
+        with memoryview(buffer) as view:
+            wchan.que.put(view[:blen])
+
+        wchan.wakeup_reader()
+        return blen
+
+
+class MemoryPipe:
+    '''
+    A pair of connected in memory adaptors, data written to client
+    is read from server and vice versa. maxsize bounds the bytes
+    buffered in each direction.
+    '''
+    def __init__(self, maxsize: int = DEFAULT_MEMORY_PIPE_SIZE):
+        c2s = _PipeChannel(maxsize)
+        s2c = _PipeChannel(maxsize)
+
+        self._client = MemoryPipeAdaptor(s2c, c2s)
+        self._server = MemoryPipeAdaptor(c2s, s2c)
+
+    @property
+    def client(self) -> MemoryPipeAdaptor:
+        return self._client
+
+    @property
+    def server(self) -> MemoryPipeAdaptor:
+        return self._server
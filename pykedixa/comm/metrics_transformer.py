@@ -0,0 +1,298 @@
+import asyncio
+import io
+import time
+import weakref
+from typing import Dict, List, Sequence
+
+from .basic import (
+    BasicTransformer,
+
+    ReadableBuffer,
+    WritableBuffer,
+    ReadRetType,
+)
+from .exception import (
+    AdaptorEofError,
+    TransformerEofError,
+)
+
+__all__ = [
+    'LatencyHistogram',
+    'CommMetrics',
+    'MetricsRegistry',
+    'MetricsTransformer',
+    'default_metrics_registry',
+]
+
+
+class LatencyHistogram:
+    '''
+    Histogram of durations in power of two buckets of microseconds,
+    bucket i counts durations in [2**(i-1), 2**i) us, bucket 0 is < 1us.
+    '''
+    NBUCKETS = 32
+
+    def __init__(self):
+        self._buckets: List[int] = [0] * self.NBUCKETS
+        self._count: int = 0
+        self._sum: float = 0.0
+        self._max: float = 0.0
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def record(self, seconds: float):
+        idx = int(seconds * 1e6).bit_length()
+        if idx >= self.NBUCKETS:
+            idx = self.NBUCKETS - 1
+
+        self._buckets[idx] += 1
+        self._count += 1
+        self._sum += seconds
+        if seconds > self._max:
+            self._max = seconds
+
+    def merge(self, other: 'LatencyHistogram'):
+        for i, n in enumerate(other._buckets):
+            self._buckets[i] += n
+        self._count += other._count
+        self._sum += other._sum
+        self._max = max(self._max, other._max)
+
+    def percentile(self, p: float) -> float:
+        '''Return the upper bound in seconds of the bucket at percentile p'''
+        if self._count == 0:
+            return 0.0
+
+        target = self._count * p / 100.0
+        acc = 0
+        for i, n in enumerate(self._buckets):
+            acc += n
+            if acc >= target:
+                return min((1 << i) / 1e6, self._max)
+        return self._max
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self._count,
+            'sum': self._sum,
+            'max': self._max,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+        }
+
+
+class CommMetrics:
+    def __init__(self):
+        self.read_bytes: int    = 0
+        self.read_calls: int    = 0
+        self.write_bytes: int   = 0
+        self.write_calls: int   = 0
+        self.flush_calls: int   = 0
+        self.errors: int        = 0
+        self.eofs: int          = 0
+        self.cancels: int       = 0
+        self.read_time: LatencyHistogram    = LatencyHistogram()
+        self.write_time: LatencyHistogram   = LatencyHistogram()
+        self.flush_time: LatencyHistogram   = LatencyHistogram()
+
+    def record_error(self, e: BaseException):
+        '''Count eof and cancellation apart, they are not failures'''
+        if isinstance(e, (AdaptorEofError, TransformerEofError)):
+            self.eofs += 1
+        elif isinstance(e, asyncio.CancelledError):
+            self.cancels += 1
+        else:
+            self.errors += 1
+
+    def merge(self, other: 'CommMetrics'):
+        self.read_bytes += other.read_bytes
+        self.read_calls += other.read_calls
+        self.write_bytes += other.write_bytes
+        self.write_calls += other.write_calls
+        self.flush_calls += other.flush_calls
+        self.errors += other.errors
+        self.eofs += other.eofs
+        self.cancels += other.cancels
+        self.read_time.merge(other.read_time)
+        self.write_time.merge(other.write_time)
+        self.flush_time.merge(other.flush_time)
+
+    def snapshot(self) -> dict:
+        return {
+            'read_bytes': self.read_bytes,
+            'read_calls': self.read_calls,
+            'write_bytes': self.write_bytes,
+            'write_calls': self.write_calls,
+            'flush_calls': self.flush_calls,
+            'errors': self.errors,
+            'eofs': self.eofs,
+            'cancels': self.cancels,
+            'read_time': self.read_time.snapshot(),
+            'write_time': self.write_time.snapshot(),
+            'flush_time': self.flush_time.snapshot(),
+        }
+
+
+class MetricsRegistry:
+    '''
+    Collect metrics of MetricsTransformer, live ones are reported one by one,
+    finished ones are folded into the aggregate of their name.
+    '''
+    def __init__(self):
+        self._live: 'weakref.WeakSet[MetricsTransformer]' = weakref.WeakSet()
+        self._finished: Dict[str, CommMetrics] = {}
+        self._connections: Dict[str, int] = {}
+
+    def register(self, t: 'MetricsTransformer'):
+        self._live.add(t)
+        self._connections[t.name] = self._connections.get(t.name, 0) + 1
+
+    def unregister(self, t: 'MetricsTransformer'):
+        if t in self._live:
+            self._live.discard(t)
+            agg = self._finished.get(t.name)
+            if agg is None:
+                agg = self._finished[t.name] = CommMetrics()
+            agg.merge(t.metrics)
+
+    def aggregate(self) -> Dict[str, CommMetrics]:
+        ret: Dict[str, CommMetrics] = {}
+        for name, m in self._finished.items():
+            ret[name] = CommMetrics()
+            ret[name].merge(m)
+
+        for t in list(self._live):
+            if t.name not in ret:
+                ret[t.name] = CommMetrics()
+            ret[t.name].merge(t.metrics)
+        return ret
+
+    def snapshot(self) -> dict:
+        live = [
+            {'name': t.name, 'tag': t.tag, **t.metrics.snapshot()}
+            for t in list(self._live)
+        ]
+        agg = {
+            name: {'connections': self._connections.get(name, 0), **m.snapshot()}
+            for name, m in self.aggregate().items()
+        }
+        return {'live': live, 'aggregate': agg}
+
+    def clear(self):
+        self._live = weakref.WeakSet()
+        self._finished.clear()
+        self._connections.clear()
+
+
+default_metrics_registry: MetricsRegistry = MetricsRegistry()
+
+
+class MetricsTransformer(BasicTransformer):
+    def __init__(self, name: str = 'default', *,
+            tag: str = None,
+            registry: MetricsRegistry = None):
+        '''
+        Count bytes, calls and time of read/write/flush passing this layer.
+        Bind it at several layers with different names to compare them,
+        for example one above SslTransformer and one below it;
+        tag can be used to tell connections apart in snapshot.
+        '''
+        super().__init__()
+        self._name: str = name
+        self._tag: str = tag
+        self._registry: MetricsRegistry = registry or default_metrics_registry
+        self._metrics: CommMetrics = CommMetrics()
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def tag(self) -> str:
+        return self._tag
+
+    @property
+    def metrics(self) -> CommMetrics:
+        return self._metrics
+
+    async def prepare(self):
+        self._registry.register(self)
+
+    async def finish(self):
+        self._registry.unregister(self)
+
+    async def read(self, max_bytes: int = -1, *,
+            buffer: WritableBuffer = None) -> ReadRetType:
+        m = self._metrics
+        start = time.perf_counter()
+        try:
+            ret = await self._nxt.read(max_bytes, buffer=buffer)
+        except BaseException as e:
+            m.record_error(e)
+            raise
+        finally:
+            m.read_time.record(time.perf_counter() - start)
+
+        m.read_calls += 1
+        m.read_bytes += len(ret) if buffer is None else ret
+        return ret
+
+    async def write(self, buffer: ReadableBuffer) -> int:
+        m = self._metrics
+        start = time.perf_counter()
+        try:
+            ret = await self._nxt.write(buffer)
+        except BaseException as e:
+            m.record_error(e)
+            raise
+        finally:
+            m.write_time.record(time.perf_counter() - start)
+
+        m.write_calls += 1
+        m.write_bytes += ret
+        return ret
+
+    async def write_vectored(self, buffers: Sequence[ReadableBuffer]) -> int:
+        m = self._metrics
+        start = time.perf_counter()
+        try:
+            ret = await self._nxt.write_vectored(buffers)
+        except BaseException as e:
+            m.record_error(e)
+            raise
+        finally:
+            m.write_time.record(time.perf_counter() - start)
+
+        m.write_calls += 1
+        m.write_bytes += ret
+        return ret
+
+    async def sendfile(self, file: io.BufferedIOBase, offset: int = 0,
+            count: int = None) -> int:
+        m = self._metrics
+        start = time.perf_counter()
+        try:
+            ret = await self._nxt.sendfile(file, offset, count)
+        except BaseException as e:
+            m.record_error(e)
+            raise
+        finally:
+            m.write_time.record(time.perf_counter() - start)
+
+        m.write_calls += 1
+        m.write_bytes += ret
+        return ret
+
+    async def flush(self):
+        m = self._metrics
+        start = time.perf_counter()
+        try:
+            return await self._nxt.flush()
+        except BaseException as e:
+            m.record_error(e)
+            raise
+        finally:
+            m.flush_calls += 1
+            m.flush_time.record(time.perf_counter() - start)
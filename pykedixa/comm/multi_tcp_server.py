@@ -0,0 +1,274 @@
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import signal
+import socket
+import time
+from typing import Callable, Dict, List, Tuple
+
+from .. import compat
+from .connection import Connection
+from .tcp_server import TcpServer
+
+__all__ = [
+    'MultiTcpServer',
+]
+
+_logger = logging.getLogger('kedixa.comm.multi_tcp_server')
+
+# accepted, active, finished of each worker
+_NSTATS = 3
+
+
+def _has_reuse_port() -> bool:
+    return hasattr(socket, 'SO_REUSEPORT')
+
+
+class _WorkerArgs:
+    def __init__(self, *,
+            index: int,
+            ip: str,
+            port: int,
+            sock: socket.socket,
+            processor: Callable[[Connection], None],
+            stats: 'mp.Array',
+            ready: 'mp.Event',
+            stop: 'mp.Event',
+            drain_timeout: float):
+        self.index = index
+        self.ip = ip
+        self.port = port
+        self.sock = sock
+        self.processor = processor
+        self.stats = stats
+        self.ready = ready
+        self.stop = stop
+        self.drain_timeout = drain_timeout
+
+
+async def _worker_main(args: _WorkerArgs):
+    base = args.index * _NSTATS
+    server: TcpServer = None
+
+    def update_stats(*_):
+        st = server.stats()
+        args.stats[base:base+_NSTATS] = [st['accepted'], st['active'], st['finished']]
+
+    async def processor(conn: Connection):
+        # update counters when a connection starts, and after it is counted
+        # as finished, instead of polling them
+        task = asyncio.current_task() if compat.PY37 else asyncio.Task.current_task()
+        task.add_done_callback(update_stats)
+        update_stats()
+        return await args.processor(conn)
+
+    if args.sock is not None:
+        server = TcpServer(processor=processor, sock=args.sock)
+    else:
+        server = TcpServer(local_ip=args.ip, listen_port=args.port,
+            processor=processor, reuse_port=True)
+
+    loop = asyncio.get_event_loop()
+    loop.add_signal_handler(signal.SIGTERM, args.stop.set)
+
+    await server.start()
+    args.ready.set()
+
+    # block in a thread until the parent or SIGTERM sets stop
+    await loop.run_in_executor(None, args.stop.wait)
+
+    # stop accepting, and wait for the processors in flight
+    server.stop()
+    await server.wait_finish(args.drain_timeout)
+    update_stats()
+
+
+def _worker(args: _WorkerArgs):
+    # the parent decides when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(_worker_main(args))
+    except:
+        _logger.exception(f'Exception pid:{os.getpid()}')
+    finally:
+        loop.close()
+
+
+class _Worker:
+    def __init__(self, generation: int, proc: mp.Process,
+            ready: 'mp.Event', stop: 'mp.Event'):
+        self.generation = generation
+        self.proc = proc
+        self.ready = ready
+        self.stop = stop
+
+
+class MultiTcpServer:
+    def __init__(self, *,
+            local_ip: str = '0.0.0.0',
+            listen_port: int = 0,
+            processor: Callable[[Connection], None],
+            workers: int = 0,
+            reuse_port: bool = None,
+            drain_timeout: float = 10.0,
+            mp_context=None):
+        '''
+        Run processor in `workers` processes (cpu count if 0), each with its
+        own event loop and TcpServer. With reuse_port, every worker binds its
+        own socket with SO_REUSEPORT and the kernel balances connections,
+        otherwise all workers accept on one listening socket created by
+        this process. reuse_port defaults to whether SO_REUSEPORT exists.
+        Workers are forked by default, so processor needs not be picklable.
+        '''
+        if reuse_port is None:
+            reuse_port = _has_reuse_port()
+
+        if mp_context is None:
+            methods = mp.get_all_start_methods()
+            mp_context = mp.get_context('fork' if 'fork' in methods else None)
+
+        self._ip: str           = local_ip
+        self._port: int         = listen_port
+        self._proc: Callable    = processor
+        self._nworkers: int     = workers if workers > 0 else (os.cpu_count() or 1)
+        self._reuse_port: bool  = reuse_port
+        self._drain_timeout: float = drain_timeout
+        self._ctx = mp_context
+
+        self._sock: socket.socket = None
+        self._stats = None
+        self._workers: List[_Worker] = []
+        self._generation: int = 0
+
+    @property
+    def port(self) -> int:
+        return self._port
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def _create_socket(self):
+        family = socket.AF_INET6 if ':' in self._ip else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        if self._reuse_port:
+            # only to reserve the port, workers bind their own sockets
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind((self._ip, self._port))
+        else:
+            sock.bind((self._ip, self._port))
+            sock.listen(socket.SOMAXCONN)
+            sock.setblocking(False)
+
+        self._sock = sock
+        self._port = sock.getsockname()[1]
+
+    def _spawn(self, generation: int) -> Tuple[List[_Worker], 'mp.Array']:
+        stats = self._ctx.Array('q', self._nworkers * _NSTATS)
+
+        workers = []
+        try:
+            for i in range(self._nworkers):
+                ready, stop = self._ctx.Event(), self._ctx.Event()
+                args = _WorkerArgs(index=i, ip=self._ip, port=self._port,
+                    sock=None if self._reuse_port else self._sock,
+                    processor=self._proc, stats=stats,
+                    ready=ready, stop=stop, drain_timeout=self._drain_timeout)
+
+                proc = self._ctx.Process(target=_worker, args=(args,), daemon=True)
+                proc.start()
+                workers.append(_Worker(generation, proc, ready, stop))
+        except:
+            self._kill(workers)
+            raise
+
+        return workers, stats
+
+    def _kill(self, workers: List[_Worker]):
+        for w in workers:
+            w.stop.set()
+            if w.proc.is_alive():
+                w.proc.terminate()
+        for w in workers:
+            w.proc.join()
+
+    def _wait_ready(self, workers: List[_Worker], timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        for w in workers:
+            while not w.ready.wait(0.05):
+                if not w.proc.is_alive() or time.monotonic() > deadline:
+                    return False
+        return True
+
+    def start(self, timeout: float = 10.0):
+        '''Start workers, return after all of them are listening'''
+        assert not self._workers, 'MultiTcpServer already started'
+
+        self._create_socket()
+        self._workers, self._stats = self._spawn(self._generation + 1)
+        self._generation += 1
+
+        if not self._wait_ready(self._workers, timeout):
+            self.stop()
+            raise RuntimeError('MultiTcpServer: workers failed to start')
+
+    def reload(self, timeout: float = 10.0):
+        '''
+        Start a new generation of workers, and then let the old ones stop
+        accepting and drain their connections. If the new workers fail
+        to start, they are killed and the old ones keep serving.
+        '''
+        old = self._workers
+        new, stats = self._spawn(self._generation + 1)
+
+        if not self._wait_ready(new, timeout):
+            self._kill(new)
+            raise RuntimeError('MultiTcpServer: new workers failed to start')
+
+        self._workers, self._stats = new, stats
+        self._generation += 1
+        for w in old:
+            w.stop.set()
+        for w in old:
+            w.proc.join(self._drain_timeout + 1.0)
+
+    def stop(self):
+        '''Let all workers stop accepting and drain, then wait for them'''
+        for w in self._workers:
+            w.stop.set()
+
+        for w in self._workers:
+            w.proc.join(self._drain_timeout + 1.0)
+            if w.proc.is_alive():
+                w.proc.terminate()
+                w.proc.join()
+
+        self._workers = []
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def alive_count(self) -> int:
+        return sum(1 for w in self._workers if w.proc.is_alive())
+
+    def stats(self) -> List[Dict[str, int]]:
+        '''Connection counters of each worker of the current generation'''
+        ret = []
+        for i, w in enumerate(self._workers):
+            base = i * _NSTATS
+            accepted, active, finished = self._stats[base:base+_NSTATS]
+            ret.append({
+                'pid': w.proc.pid,
+                'generation': w.generation,
+                'alive': int(w.proc.is_alive()),
+                'accepted': accepted,
+                'active': active,
+                'finished': finished,
+            })
+        return ret
@@ -1,3 +1,7 @@
+import functools
+import re
+from typing import AsyncIterator, List, Tuple, Union
+
 from .basic import (
     BasicTransformer,
     CommFlags,
@@ -7,61 +11,207 @@ from .basic import (
     ReadRetType,
 )
 from .exception import (
+    AdaptorEofError,
     TransformerException,
+    TransformerEofError,
     BadMessage,
 )
 
 __all__ = ['ReadUntilTransformer']
 
 
+# a delimiter, or a tuple of delimiters that any of them ends a record
+Delimiter = Union[bytes, Tuple[bytes, ...]]
+
+
+@functools.lru_cache(maxsize=64)
+def _compile(delimiters: Tuple[bytes, ...]):
+    # the longer one wins if delimiters match at the same position
+    alts = sorted(set(delimiters), key=len, reverse=True)
+    return re.compile(b'|'.join(re.escape(d) for d in alts))
+
+
+def _max_len(delimiter: Delimiter) -> int:
+    if isinstance(delimiter, tuple):
+        return max(len(d) for d in delimiter)
+    return len(delimiter)
+
+
+def _search(data: bytearray, delimiter: Delimiter, start: int) -> int:
+    '''Return the position after the first delimiter from start, or -1'''
+    if isinstance(delimiter, tuple):
+        if len(delimiter) > 1:
+            m = _compile(delimiter).search(data, start)
+            return -1 if m is None else m.end()
+        delimiter = delimiter[0]
+
+    pos = data.find(delimiter, start)
+    return -1 if pos < 0 else pos + len(delimiter)
+
+
 class ReadUntilTransformer(BasicTransformer):
     SUPPORTED_FLAGS = BasicTransformer.SUPPORTED_FLAGS | CommFlags.READ_UNTIL
 
     def __init__(self):
+        '''
+        Data before self._pos is consumed, it is removed lazily when it is
+        at least half of the buffer, so consume many small messages from
+        one big read costs linear time.
+        '''
         super().__init__()
         self._data: bytearray = bytearray()
+        self._pos: int = 0
+
+    @property
+    def buffered_size(self) -> int:
+        '''The number of bytes read from next but not consumed'''
+        return len(self._data) - self._pos
 
     async def finish(self):
-        if self._data:
+        if self.buffered_size > 0:
             what = 'BadTransformerState: data is not empty when finish'
-            raise TransformerException(what, data=self._data)
+            raise TransformerException(what, data=self._data[self._pos:])
+
+    def _consume(self, n: int):
+        self._pos += n
+
+        if self._pos == len(self._data):
+            self._pos = 0
+            try:
+                del self._data[:]
+            except BufferError:
+                # views returned by read_until_view are alive
+                self._data = bytearray()
+
+    def _extend(self, data: ReadableBuffer):
+        if self._pos > 0 and self._pos * 2 >= len(self._data):
+            try:
+                del self._data[:self._pos]
+            except BufferError:
+                self._data = self._data[self._pos:]
+            self._pos = 0
+
+        try:
+            self._data.extend(data)
+        except BufferError:
+            # copy on write, the old buffer is kept by views
+            self._data = self._data[self._pos:]
+            self._pos = 0
+            self._data.extend(data)
 
     async def read(self, max_bytes: int = -1, *,
             buffer: WritableBuffer = None) -> ReadRetType:
-        dlen = len(self._data)
+        dlen = self.buffered_size
 
         if dlen > 0:
-            if max_bytes < 0 or max_bytes >= dlen:
-                data, self._data = self._data, bytearray()
-            else:
-                data = self._data[:max_bytes]
-                del self._data[:max_bytes]
-                dlen = max_bytes
+            if max_bytes >= 0:
+                dlen = min(dlen, max_bytes)
+            if buffer is not None:
+                dlen = min(dlen, len(buffer))
 
+            start = self._pos
             if buffer is None:
+                data = self._data[start:start+dlen]
+                self._consume(dlen)
                 return data
             else:
-                buffer[:len(data)] = data
+                buffer[:dlen] = self._data[start:start+dlen]
+                self._consume(dlen)
                 return dlen
         else:
             return await self._nxt.read(max_bytes, buffer=buffer)
 
-    async def read_until(self, delimiter: bytes, max_bytes: int = -1) -> ReadableBuffer:
-        end_pos = self._data.find(delimiter)
-        end_len = len(delimiter)
+    async def _find(self, delimiter: Delimiter, max_bytes: int) -> int:
+        '''Return the position after delimiter, read more data if needed'''
+        end_len = _max_len(delimiter)
+        end_pos = _search(self._data, delimiter, self._pos)
 
         while end_pos < 0:
-            old_len = len(self._data)
-            if max_bytes >= 0 and old_len > max_bytes:
+            old_len = self.buffered_size
+            if max_bytes >= 0 and old_len >= max_bytes:
                 raise BadMessage(f'DelimiterNotFound: max_bytes:{max_bytes}')
 
             mbytes = max_bytes if max_bytes < 0 else max_bytes - old_len
-            self._data.extend(await self._nxt.read(mbytes))
+            self._extend(await self._nxt.read(mbytes))
+
+            last_pos = self._pos + max(0, old_len - end_len)
+            end_pos = _search(self._data, delimiter, last_pos)
+
+        return end_pos
+
+    def _split(self, delimiter: Delimiter, max_records: int,
+            max_bytes: int) -> List[bytearray]:
+        records = []
+        pos = self._pos
 
-            last_pos = max(0, old_len - end_len)
-            end_pos = self._data.find(delimiter, last_pos)
+        while max_records < 0 or len(records) < max_records:
+            end_pos = _search(self._data, delimiter, pos)
+            if end_pos < 0:
+                break
+            if max_bytes >= 0 and end_pos - pos > max_bytes:
+                # return the records before it, raise on the next call
+                if records:
+                    break
+                raise BadMessage(f'RecordTooLong: max_bytes:{max_bytes}')
 
-        end_pos += end_len
-        data = self._data[:end_pos]
-        del self._data[:end_pos]
+            records.append(self._data[pos:end_pos])
+            pos = end_pos
+
+        self._consume(pos - self._pos)
+        return records
+
+    async def read_until(self, delimiter: Delimiter, max_bytes: int = -1) -> ReadableBuffer:
+        end_pos = await self._find(delimiter, max_bytes)
+
+        data = self._data[self._pos:end_pos]
+        self._consume(end_pos - self._pos)
         return data
+
+    async def read_until_view(self, delimiter: Delimiter, max_bytes: int = -1) -> memoryview:
+        '''
+        The same as read_until, but return a memoryview of the internal
+        buffer without copy. Release it as soon as possible, the buffer
+        has to be copied when it grows while any view is alive.
+        '''
+        end_pos = await self._find(delimiter, max_bytes)
+
+        with memoryview(self._data) as view:
+            data = view[self._pos:end_pos]
+        self._consume(end_pos - self._pos)
+        return data
+
+    async def read_records(self, delimiter: Delimiter, max_records: int = -1,
+            max_bytes: int = -1) -> List[bytearray]:
+        '''
+        Wait until at least one record is buffered, then split at most
+        max_records of them in one pass, each ends with delimiter.
+        Raise BadMessage if the first record is longer than max_bytes,
+        a long record after others is left for the next call.
+        '''
+        if max_records == 0:
+            return []
+
+        await self._find(delimiter, max_bytes)
+        return self._split(delimiter, max_records, max_bytes)
+
+    async def read_lines(self, max_lines: int = -1,
+            max_bytes: int = -1) -> List[bytearray]:
+        '''Read a batch of lines ending with b'\\n', see read_records'''
+        return await self.read_records(b'\n', max_lines, max_bytes)
+
+    async def iter_until(self, delimiter: Delimiter,
+            max_bytes: int = -1) -> AsyncIterator[bytearray]:
+        '''
+        Iterate records until eof, records are read in batches. Eof error
+        is raised if the last record does not end with delimiter.
+        '''
+        while True:
+            try:
+                records = await self.read_records(delimiter, -1, max_bytes)
+            except (AdaptorEofError, TransformerEofError):
+                if self.buffered_size > 0:
+                    raise
+                return
+
+            for record in records:
+                yield record
@@ -1,11 +1,15 @@
 import asyncio
+import io
 import socket
 import logging
+import time
+from typing import Sequence
 
 from .. import compat
 
 from .basic import (
     AdaptorEofError,
+    AdaptorException,
     BasicAdaptor,
 
     ReadableBuffer,
@@ -18,13 +22,26 @@ from .address import SocketAddress
 __all__ = [
     'SyncTcpAdaptor',
     'TcpAdaptor',
+    'BufferedTcpAdaptor',
+    'RawTcpAdaptor',
+    'UnixAdaptor',
 ]
 
 _logger = logging.getLogger('kedixa.comm.socket_adaptor')
 
+DEFAULT_RECV_BUFFER_SIZE: int = 2 ** 18
+# the same as asyncio transports, memory per connection is kept small
+DEFAULT_WRITE_HIGH_WATER: int = 2 ** 16
+# the minimum IOV_MAX required by POSIX
+_IOV_MAX: int = 1024
+
 
 class SyncTcpAdaptor(BasicAdaptor):
     def __init__(self, addr: SocketAddress):
+        '''
+        Use blocking socket operations, the event loop is blocked
+        during each call, see RawTcpAdaptor for the non-blocking one.
+        '''
         self._addr: SocketAddress = addr
         self._socket = socket.socket(addr.family, socket.SOCK_STREAM, addr.proto)
 
@@ -58,11 +75,18 @@ class TcpAdaptor(BasicAdaptor):
     def __init__(self, addr: SocketAddress, *,
             reader: asyncio.StreamReader = None,
             writer: asyncio.StreamWriter = None,
-            close_on_finish: bool = True):
+            close_on_finish: bool = True,
+            write_high_water: int = DEFAULT_WRITE_HIGH_WATER,
+            write_low_water: int = None):
         '''
         If both reader and writer is not None,
         adaptor will use them without create a new one;
         and they will be closed when self.finish if close_on_finish.
+        When more than write_high_water bytes are buffered in transport,
+        write waits until it drains to write_low_water,
+        write_low_water defaults to a quarter of write_high_water.
+        The default high water is 64 KiB as asyncio, a larger one such as
+        1 MiB drains less often on fast links but costs memory per connection.
         '''
         self._addr: SocketAddress = addr
 
@@ -71,8 +95,20 @@ class TcpAdaptor(BasicAdaptor):
         self._reader: asyncio.StreamReader = reader
         self._writer: asyncio.StreamWriter = writer
 
+        self._high_water: int = write_high_water
+        self._low_water: int = write_low_water
+        if write_low_water is None:
+            self._low_water = write_high_water // 4
+
+        # for servers to find idle connections and slow reads
+        self._last_active: float = time.monotonic()
+        self._last_read: float = None
+        self._last_write: float = None
+        self._read_since: float = None
+
         if reader is not None and writer is not None:
             self._server_side = True
+            self._set_write_limits()
         else:
             assert reader is None and writer is None
             self._server_side = False
@@ -81,6 +117,40 @@ class TcpAdaptor(BasicAdaptor):
     def addr(self) -> SocketAddress:
         return self._addr
 
+    @property
+    def write_buffer_size(self) -> int:
+        '''The number of bytes buffered in transport, not yet sent'''
+        return self._writer.transport.get_write_buffer_size()
+
+    @property
+    def last_active(self) -> float:
+        '''time.monotonic() of the last read or write'''
+        return self._last_active
+
+    @property
+    def last_read(self) -> float:
+        '''time.monotonic() when data was read last time, None if never'''
+        return self._last_read
+
+    @property
+    def last_write(self) -> float:
+        '''time.monotonic() of the last write, None if never'''
+        return self._last_write
+
+    @property
+    def read_since(self) -> float:
+        '''time.monotonic() when the pending read started, None if no read'''
+        return self._read_since
+
+    def abort(self):
+        '''Close the connection at once, pending read gets eof'''
+        if self._writer is not None:
+            self._writer.transport.abort()
+
+    def _set_write_limits(self):
+        self._writer.transport.set_write_buffer_limits(
+            high=self._high_water, low=self._low_water)
+
     async def prepare(self):
         if not self._server_side:
             addr = self._addr
@@ -88,31 +158,48 @@ class TcpAdaptor(BasicAdaptor):
                 host=addr.ip, port=addr.port, family=addr.family,
                 proto=addr.proto
             )
+            self._set_write_limits()
 
     async def finish(self):
         if self._server_side and not self._close_on_finish:
             return
 
-        if self._writer.can_write_eof():
+        self.write_eof()
+        self._writer.close()
+
+        if compat.PY37:
+            await self._writer.wait_closed()
+
+    def can_write_eof(self) -> bool:
+        return self._writer.can_write_eof()
+
+    def write_eof(self):
+        if self._writer.can_write_eof() and not self._writer.transport.is_closing():
             try:
                 self._writer.write_eof()
             except OSError as e:
                 _logger.info(f'Exception when socket write eof {e}')
 
-        self._writer.close()
-
-        if compat.PY37:
-            await self._writer.wait_closed()
+    def is_healthy(self) -> bool:
+        if self._writer is None or self._writer.transport.is_closing():
+            return False
+        return not self._reader.at_eof()
 
     async def read(self, max_bytes: int = -1, *,
             buffer: WritableBuffer = None) -> ReadRetType:
         if max_bytes < 0:
             max_bytes = DEFAULT_MAX_READ_SIZE
 
-        data = await self._reader.read(max_bytes)
+        self._read_since = time.monotonic()
+        try:
+            data = await self._reader.read(max_bytes)
+        finally:
+            self._read_since = None
+            self._last_active = time.monotonic()
 
         if not data:
             raise AdaptorEofError('TcpAdaptorEof')
+        self._last_read = self._last_active
 
         if buffer:
             dlen = len(data)
@@ -125,7 +212,485 @@ class TcpAdaptor(BasicAdaptor):
         blen = len(buffer)
 
         self._writer.write(buffer)
+        self._last_active = self._last_write = time.monotonic()
+        await self._wait_low_water()
         return blen
 
+    async def write_vectored(self, buffers: Sequence[ReadableBuffer]) -> int:
+        # saves the concatenation in python, but before python 3.12 the
+        # transport joins the buffers into one before send, so this is
+        # not zero copy there; use RawTcpAdaptor for sendmsg
+        self._writer.writelines(buffers)
+        self._last_active = self._last_write = time.monotonic()
+        await self._wait_low_water()
+        return sum(len(b) for b in buffers)
+
+    async def sendfile(self, file: io.BufferedIOBase, offset: int = 0,
+            count: int = None) -> int:
+        if not compat.PY37:
+            return await super().sendfile(file, offset, count)
+
+        # the fallback of asyncio reads at the shared file position,
+        # use the one of CommunicateBase which reads at explicit offsets
+        loop = asyncio.get_event_loop()
+        try:
+            ret = await loop.sendfile(self._writer.transport, file, offset, count,
+                fallback=False)
+        except asyncio.SendfileNotAvailableError:
+            ret = await super().sendfile(file, offset, count)
+        self._last_active = self._last_write = time.monotonic()
+        return ret
+
+    async def _wait_low_water(self):
+        if self.write_buffer_size > self._high_water:
+            await self._writer.drain()
+
     async def flush(self):
         await self._writer.drain()
+
+
+class _BufferedTcpProtocol(getattr(asyncio, 'BufferedProtocol', asyncio.Protocol)):
+    '''
+    Kernel receives into self._buf directly, or into the buffer of a
+    pending read when there is no buffered data, see BufferedTcpAdaptor.
+    '''
+    def __init__(self, bufsize: int, direct_read: bool):
+        self._buf: bytearray        = bytearray(bufsize)
+        self._view: memoryview      = memoryview(self._buf)
+        self._start: int            = 0
+        self._end: int              = 0
+        self._direct_read: bool     = direct_read
+
+        self._transport: asyncio.Transport = None
+        self._eof: bool             = False
+        self._exc: Exception        = None
+        self._read_paused: bool     = False
+        self._write_paused: bool    = False
+
+        # a pending read that wants data be received into its buffer
+        self._user_buf: memoryview  = None
+        self._user_nbytes: int      = 0
+
+        self._read_waiter: asyncio.Future   = None
+        self._drain_waiter: asyncio.Future  = None
+        self._closed: asyncio.Future = asyncio.get_event_loop().create_future()
+
+    @staticmethod
+    def _wakeup(waiter: asyncio.Future, exc: Exception = None):
+        if waiter is not None and not waiter.done():
+            if exc is None:
+                waiter.set_result(None)
+            else:
+                waiter.set_exception(exc)
+
+    def connection_made(self, transport: asyncio.Transport):
+        self._transport = transport
+
+    def connection_lost(self, exc: Exception):
+        self._eof = True
+        self._exc = exc
+        self._wakeup(self._read_waiter)
+        self._wakeup(self._drain_waiter,
+            exc if exc is not None else ConnectionResetError('Connection lost'))
+        self._wakeup(self._closed)
+
+    def at_eof(self) -> bool:
+        return self._eof and self._start == self._end
+
+    def eof_received(self) -> bool:
+        self._eof = True
+        self._wakeup(self._read_waiter)
+        # keep transport open, we may still write to it
+        return True
+
+    def pause_writing(self):
+        self._write_paused = True
+
+    def resume_writing(self):
+        self._write_paused = False
+        self._wakeup(self._drain_waiter)
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        if self._user_buf is not None:
+            return self._user_buf
+
+        if self._start == self._end:
+            self._start = self._end = 0
+        elif self._end == len(self._buf):
+            # move pending data to the front of buffer
+            n = self._end - self._start
+            self._view[:n] = self._view[self._start:self._end]
+            self._start, self._end = 0, n
+
+        return self._view[self._end:]
+
+    def buffer_updated(self, nbytes: int):
+        if self._user_buf is not None:
+            self._user_buf = None
+            self._user_nbytes = nbytes
+        else:
+            self._end += nbytes
+            if self._end == len(self._buf) and self._start == 0:
+                self._read_paused = True
+                self._transport.pause_reading()
+
+        self._wakeup(self._read_waiter)
+
+    async def _wait_readable(self, buffer: memoryview):
+        if self._exc is not None:
+            raise self._exc
+        if self._eof:
+            raise AdaptorEofError('BufferedTcpAdaptorEof')
+
+        if self._direct_read and buffer is not None:
+            self._user_buf = buffer
+            self._user_nbytes = 0
+
+        self._read_waiter = asyncio.get_event_loop().create_future()
+        try:
+            await self._read_waiter
+        finally:
+            self._read_waiter = None
+            self._user_buf = None
+
+    def _keep_user_data(self, view: memoryview):
+        # the read is cancelled after data was received into its buffer,
+        # keep the data before that received into self._buf since then
+        n, self._user_nbytes = self._user_nbytes, 0
+        data = bytes(view[:n]) + bytes(self._view[self._start:self._end])
+
+        if len(data) > len(self._buf):
+            self._view.release()
+            self._buf = bytearray(len(data))
+            self._view = memoryview(self._buf)
+
+        self._view[:len(data)] = data
+        self._start, self._end = 0, len(data)
+        if self._end == len(self._buf) and not self._read_paused:
+            self._read_paused = True
+            self._transport.pause_reading()
+
+    async def read(self, max_bytes: int, buffer: WritableBuffer) -> ReadRetType:
+        view = None
+
+        while self._start == self._end:
+            if view is None and buffer is not None:
+                view = memoryview(buffer)[:max_bytes]
+
+            try:
+                await self._wait_readable(view)
+            except asyncio.CancelledError:
+                if self._user_nbytes > 0:
+                    self._keep_user_data(view)
+                raise
+
+            if self._user_nbytes > 0:
+                nbytes, self._user_nbytes = self._user_nbytes, 0
+                return nbytes
+
+        n = min(max_bytes, self._end - self._start)
+        data = self._view[self._start:self._start+n]
+
+        if buffer is None:
+            ret = bytes(data)
+        else:
+            buffer[:n] = data
+            ret = n
+
+        self._start += n
+        if self._read_paused:
+            self._read_paused = False
+            self._transport.resume_reading()
+
+        return ret
+
+    async def drain(self):
+        if self._exc is not None:
+            raise self._exc
+
+        if self._write_paused:
+            self._drain_waiter = asyncio.get_event_loop().create_future()
+            try:
+                await self._drain_waiter
+            finally:
+                self._drain_waiter = None
+
+    async def wait_closed(self):
+        await self._closed
+
+
+class BufferedTcpAdaptor(BasicAdaptor):
+    def __init__(self, addr: SocketAddress, *,
+            sock: socket.socket = None,
+            recv_buffer_size: int = DEFAULT_RECV_BUFFER_SIZE,
+            write_high_water: int = DEFAULT_WRITE_HIGH_WATER,
+            write_low_water: int = None):
+        '''
+        TcpAdaptor based on asyncio.BufferedProtocol, the kernel receives
+        data into a reusable buffer and read(buffer=...) copies at most once;
+        on selector event loops, a read with buffer that waits for data
+        lets the kernel receive into that buffer directly.
+        If sock is not None, use the connected socket instead of connect to addr.
+        The write watermarks work the same as TcpAdaptor.
+        '''
+        self._addr: SocketAddress = addr
+        self._sock: socket.socket = sock
+        self._bufsize: int = recv_buffer_size
+
+        self._high_water: int = write_high_water
+        self._low_water: int = write_low_water
+        if write_low_water is None:
+            self._low_water = write_high_water // 4
+
+        self._transport: asyncio.Transport = None
+        self._protocol: _BufferedTcpProtocol = None
+
+    @property
+    def addr(self) -> SocketAddress:
+        return self._addr
+
+    async def prepare(self):
+        if not compat.PY37:
+            raise AdaptorException('BufferedTcpAdaptor requires python 3.7+')
+
+        loop = asyncio.get_event_loop()
+        direct_read = isinstance(loop, asyncio.SelectorEventLoop)
+
+        def factory():
+            return _BufferedTcpProtocol(self._bufsize, direct_read)
+
+        if self._sock is not None:
+            tp = await loop.create_connection(factory, sock=self._sock)
+        else:
+            addr = self._addr
+            tp = await loop.create_connection(factory,
+                host=addr.ip, port=addr.port,
+                family=addr.family, proto=addr.proto)
+
+        self._transport, self._protocol = tp
+        self._transport.set_write_buffer_limits(
+            high=self._high_water, low=self._low_water)
+
+    @property
+    def write_buffer_size(self) -> int:
+        '''The number of bytes buffered in transport, not yet sent'''
+        return self._transport.get_write_buffer_size()
+
+    def is_healthy(self) -> bool:
+        if self._transport is None or self._transport.is_closing():
+            return False
+        return not self._protocol.at_eof()
+
+    def can_write_eof(self) -> bool:
+        return self._transport.can_write_eof()
+
+    def write_eof(self):
+        transport = self._transport
+
+        if transport.can_write_eof() and not transport.is_closing():
+            try:
+                transport.write_eof()
+            except OSError as e:
+                _logger.info(f'Exception when socket write eof {e}')
+
+    async def finish(self):
+        self.write_eof()
+        self._transport.close()
+        await self._protocol.wait_closed()
+
+    async def read(self, max_bytes: int = -1, *,
+            buffer: WritableBuffer = None) -> ReadRetType:
+        if buffer is not None and (max_bytes < 0 or max_bytes > len(buffer)):
+            max_bytes = len(buffer)
+        elif max_bytes < 0:
+            max_bytes = DEFAULT_MAX_READ_SIZE
+
+        return await self._protocol.read(max_bytes, buffer)
+
+    async def write(self, buffer: ReadableBuffer) -> int:
+        blen = len(buffer)
+
+        self._transport.write(buffer)
+        await self._wait_low_water()
+        return blen
+
+    async def write_vectored(self, buffers: Sequence[ReadableBuffer]) -> int:
+        # the same as TcpAdaptor, joined by the transport before python 3.12
+        self._transport.writelines(buffers)
+        await self._wait_low_water()
+        return sum(len(b) for b in buffers)
+
+    async def sendfile(self, file: io.BufferedIOBase, offset: int = 0,
+            count: int = None) -> int:
+        # see TcpAdaptor.sendfile
+        loop = asyncio.get_event_loop()
+        try:
+            return await loop.sendfile(self._transport, file, offset, count,
+                fallback=False)
+        except asyncio.SendfileNotAvailableError:
+            return await super().sendfile(file, offset, count)
+
+    async def _wait_low_water(self):
+        if self.write_buffer_size > self._high_water:
+            await self._protocol.drain()
+
+    async def flush(self):
+        await self._protocol.drain()
+
+
+class RawTcpAdaptor(BasicAdaptor):
+    def __init__(self, addr: SocketAddress, *,
+            sock: socket.socket = None):
+        '''
+        TcpAdaptor on a raw non-blocking socket driven by loop.sock_* APIs,
+        the socket is accessible for low-level control.
+        If sock is not None, use the connected socket instead of connect to addr.
+        '''
+        self._addr: SocketAddress = addr
+        self._socket: socket.socket = sock
+        self._connected: bool = sock is not None
+
+        if sock is None:
+            self._socket = socket.socket(addr.family, socket.SOCK_STREAM, addr.proto)
+        self._socket.setblocking(False)
+
+    @property
+    def addr(self) -> SocketAddress:
+        return self._addr
+
+    @property
+    def socket(self) -> socket.socket:
+        return self._socket
+
+    def fileno(self) -> int:
+        return self._socket.fileno()
+
+    def setsockopt(self, level: int, optname: int, value):
+        self._socket.setsockopt(level, optname, value)
+
+    def getsockopt(self, level: int, optname: int, buflen: int = None):
+        if buflen is None:
+            return self._socket.getsockopt(level, optname)
+        return self._socket.getsockopt(level, optname, buflen)
+
+    def is_healthy(self) -> bool:
+        if not self._connected or self._socket.fileno() < 0:
+            return False
+
+        try:
+            data = self._socket.recv(1, socket.MSG_PEEK)
+        except (BlockingIOError, InterruptedError):
+            return True
+        except OSError:
+            return False
+
+        # empty data means closed by peer
+        return len(data) > 0
+
+    async def prepare(self):
+        if not self._connected:
+            loop = asyncio.get_event_loop()
+            try:
+                await loop.sock_connect(self._socket, (self._addr.ip, self._addr.port))
+            except:
+                self._socket.close()
+                raise
+            self._connected = True
+
+    async def finish(self):
+        if self._connected:
+            self.write_eof()
+        self._socket.close()
+
+    def can_write_eof(self) -> bool:
+        return True
+
+    def write_eof(self):
+        try:
+            self._socket.shutdown(socket.SHUT_WR)
+        except OSError as e:
+            _logger.info(f'Exception when socket write eof {e}')
+
+    async def read(self, max_bytes: int = -1, *,
+            buffer: WritableBuffer = None) -> ReadRetType:
+        loop = asyncio.get_event_loop()
+
+        if buffer is not None:
+            if max_bytes < 0 or max_bytes > len(buffer):
+                max_bytes = len(buffer)
+
+            if compat.PY37:
+                with memoryview(buffer) as view, view[:max_bytes] as v:
+                    ret = await loop.sock_recv_into(self._socket, v)
+            else:
+                data = await loop.sock_recv(self._socket, max_bytes)
+                ret = len(data)
+                buffer[:ret] = data
+
+            if ret == 0:
+                raise AdaptorEofError('RawTcpAdaptorEof')
+        else:
+            if max_bytes < 0:
+                max_bytes = DEFAULT_RECV_BUFFER_SIZE
+
+            ret = await loop.sock_recv(self._socket, max_bytes)
+            if len(ret) == 0:
+                raise AdaptorEofError('RawTcpAdaptorEof')
+
+        return ret
+
+    async def write(self, buffer: ReadableBuffer) -> int:
+        loop = asyncio.get_event_loop()
+        await loop.sock_sendall(self._socket, buffer)
+        return len(buffer)
+
+    async def write_vectored(self, buffers: Sequence[ReadableBuffer]) -> int:
+        if not hasattr(self._socket, 'sendmsg'):
+            return await super().write_vectored(buffers)
+
+        buffers = [b for b in buffers[:_IOV_MAX] if len(b) > 0]
+        if not buffers:
+            return 0
+
+        try:
+            return self._socket.sendmsg(buffers)
+        except (BlockingIOError, InterruptedError):
+            # socket buffer is full, wait by sending the first one
+            return await self.write(buffers[0])
+
+    async def sendfile(self, file: io.BufferedIOBase, offset: int = 0,
+            count: int = None) -> int:
+        if not compat.PY37:
+            return await super().sendfile(file, offset, count)
+
+        # see TcpAdaptor.sendfile
+        loop = asyncio.get_event_loop()
+        try:
+            return await loop.sock_sendfile(self._socket, file, offset, count,
+                fallback=False)
+        except asyncio.SendfileNotAvailableError:
+            return await super().sendfile(file, offset, count)
+
+
+class UnixAdaptor(TcpAdaptor):
+    def __init__(self, addr: SocketAddress, *,
+            reader: asyncio.StreamReader = None,
+            writer: asyncio.StreamWriter = None,
+            close_on_finish: bool = True,
+            write_high_water: int = DEFAULT_WRITE_HIGH_WATER,
+            write_low_water: int = None):
+        '''
+        TcpAdaptor over unix domain socket, addr is created by
+        SocketAddress.from_path, the other arguments are the same.
+        '''
+        super().__init__(addr, reader=reader, writer=writer,
+            close_on_finish=close_on_finish,
+            write_high_water=write_high_water,
+            write_low_water=write_low_water)
+
+    async def prepare(self):
+        if not self._server_side:
+            self._reader, self._writer = await asyncio.open_unix_connection(
+                path=self._addr.path
+            )
+            self._set_write_limits()
@@ -1,6 +1,8 @@
 import asyncio
 import time
 import math
+from collections import deque
+from typing import Deque, Tuple
 
 from .basic import (
     BasicTransformer,
@@ -12,8 +14,10 @@ from .basic import (
 from .exception import (
     AdaptorEofError,
 )
+from .buffer_pool import default_buffer_pool
 
 __all__ = [
+    'TokenBucket',
     'SpeedLimitTransformer',
 ]
 
@@ -45,30 +49,141 @@ def _get_hint(bps: float) -> int:
     return hint
 
 
+class TokenBucket:
+    def __init__(self, rate: float, *, burst: float = None,
+            parent: 'TokenBucket' = None):
+        '''
+        A token bucket shared by many SpeedLimitTransformer, rate is the
+        number of bytes per second, and at most burst bytes are saved while
+        idle, rate / 10 if None. Buckets form a tree by parent, for example
+        global, then group, then connection, bytes are taken from the
+        bucket to the root in order, so idle groups leave their share to
+        busy ones. Waiters of one bucket are served in FIFO order.
+        '''
+        self._rate: float   = 1.0
+        self._burst: float  = 1.0
+        self._parent: 'TokenBucket' = parent
+
+        # tokens may be negative, bytes taken in advance are paid later
+        self._tokens: float = 0.0
+        self._stamp: float  = time.monotonic()
+        self._waiters: Deque[Tuple[asyncio.Future, float]] = deque()
+        self._timer: asyncio.TimerHandle = None
+
+        self.set_rate(rate, rate / 10 if burst is None else burst)
+        self._tokens = self._burst
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    @property
+    def burst(self) -> float:
+        return self._burst
+
+    @property
+    def parent(self) -> 'TokenBucket':
+        return self._parent
+
+    def set_rate(self, rate: float, burst: float = None):
+        '''
+        Change the rate at runtime, and burst if not None,
+        waiters are rescheduled.
+        '''
+        self._refill()
+        self._rate = max(float(rate), 1.0)
+        if burst is not None:
+            self._burst = max(float(burst), 1.0)
+        self._tokens = min(self._tokens, self._burst)
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._wakeup()
+
+    def _refill(self):
+        now = time.monotonic()
+        tokens = self._tokens + (now - self._stamp) * self._rate
+        self._tokens = min(tokens, self._burst)
+        self._stamp = now
+
+    def _wakeup(self):
+        self._timer = None
+        self._refill()
+
+        while self._waiters and self._tokens >= 0.0:
+            fut, nbytes = self._waiters.popleft()
+            if not fut.done():
+                self._tokens -= nbytes
+                fut.set_result(None)
+
+        if self._waiters:
+            delay = -self._tokens / self._rate
+            loop = asyncio.get_event_loop()
+            self._timer = loop.call_later(delay, self._wakeup)
+
+    async def _take(self, nbytes: float):
+        if not self._waiters:
+            self._refill()
+            if self._tokens >= 0.0:
+                self._tokens -= nbytes
+                return
+
+        fut = asyncio.get_event_loop().create_future()
+        self._waiters.append((fut, nbytes))
+        if self._timer is None:
+            self._wakeup()
+        await fut
+
+    async def acquire(self, nbytes: float):
+        '''Take nbytes from this bucket and all its parents'''
+        bucket = self
+        while bucket is not None:
+            await bucket._take(nbytes)
+            bucket = bucket._parent
+
+
 class SpeedLimitTransformer(BasicTransformer):
     def __init__(self, *,
             r_bytes: float = None, r_kbytes: float = None, r_mbytes: float = None,
-            w_bytes: float = None, w_kbytes: float = None, w_mbytes: float = None):
+            w_bytes: float = None, w_kbytes: float = None, w_mbytes: float = None,
+            r_bucket: TokenBucket = None, w_bucket: TokenBucket = None):
         '''
         Set atmost one of r_(bytes/kbytes/mbytes),
         indicate how many bytes to read per second,
         if none of them is set, the default value DEFAULT_READ_SPEED is used.
         It is the same for w_(bytes/kbytes/mbytes),
         if none of them is set, the default value DEFAULT_WRITE_SPEED is used.
+
+        If r_bucket or w_bucket is set, bytes are also taken from the shared
+        TokenBucket after the limit of this connection, and this connection
+        is not limited by the default value. Bytes to write are taken before
+        written, bytes read are taken after read since the size is unknown.
         '''
         super().__init__()
 
+        self._rbucket: TokenBucket = r_bucket
+        self._wbucket: TokenBucket = w_bucket
+
+        rdft = math.inf if r_bucket else DEFAULT_READ_SPEED
         self._rnext: float = 0.0
-        self._rbps:  float = _get_bps(r_bytes, r_kbytes, r_mbytes, DEFAULT_READ_SPEED)
-        self._rhint: int   = _get_hint(self._rbps)
+        self._rbps:  float = _get_bps(r_bytes, r_kbytes, r_mbytes, rdft)
 
+        wdft = math.inf if w_bucket else DEFAULT_WRITE_SPEED
         self._wnext: float = 0.0
-        self._wbps:  float = _get_bps(w_bytes, w_kbytes, w_mbytes, DEFAULT_WRITE_SPEED)
-        self._whint: int   = _get_hint(self._wbps)
+        self._wbps:  float = _get_bps(w_bytes, w_kbytes, w_mbytes, wdft)
+
+    @staticmethod
+    def _hint(bps: float, bucket: TokenBucket) -> int:
+        # the rate of bucket may be changed at runtime
+        if bucket is not None:
+            bps = min(bps, bucket.rate)
+        return _get_hint(bps)
 
     async def write(self, buffer: ReadableBuffer) -> int:
         blen = len(buffer)
         pos, iter = 0, 0
+        whint = self._hint(self._wbps, self._wbucket)
 
         with memoryview(buffer) as view:
             # try max 10 iter
@@ -82,7 +197,9 @@ class SpeedLimitTransformer(BasicTransformer):
                 else:
                     self._wnext = cur
 
-                wmax = min(self._whint, blen-pos)
+                wmax = min(whint, blen-pos)
+                if self._wbucket is not None:
+                    await self._wbucket.acquire(wmax)
                 wlen = await self._nxt.write(view[pos:pos+wmax])
 
                 pos += wlen
@@ -90,35 +207,46 @@ class SpeedLimitTransformer(BasicTransformer):
 
         return pos
 
-    async def read(self, max_bytes: int = -1, *,
-            buffer: WritableBuffer = None) -> ReadRetType:
-        if max_bytes < 0:
-            max_bytes = self._rhint * 10
-
+    async def _read_into(self, max_bytes: int, view: memoryview) -> int:
         pos, iter = 0, 0
-        buf = bytearray(max_bytes) if buffer is None else buffer
+        rhint = self._hint(self._rbps, self._rbucket)
 
-        with memoryview(buf) as view:
-            while iter < 10 and pos < max_bytes:
-                iter += 1
+        while iter < 10 and pos < max_bytes:
+            iter += 1
 
-                cur = time.monotonic()
-                delay = self._rnext - cur
-                if delay > 0.0:
-                    await asyncio.sleep(delay)
-                else:
-                    self._rnext = cur
+            cur = time.monotonic()
+            delay = self._rnext - cur
+            if delay > 0.0:
+                await asyncio.sleep(delay)
+            else:
+                self._rnext = cur
 
-                rmax = min(self._rhint, max_bytes-pos)
+            rmax = min(rhint, max_bytes-pos)
 
-                try:
-                    rlen = await self._nxt.read(rmax, buffer=view[pos:pos+rmax])
-                except AdaptorEofError:
-                    if pos == 0:
-                        raise
-                    break
+            try:
+                rlen = await self._nxt.read(rmax, buffer=view[pos:pos+rmax])
+            except AdaptorEofError:
+                if pos == 0:
+                    raise
+                break
 
-                pos += rlen
-                self._rnext += float(rlen) / self._rbps
+            pos += rlen
+            self._rnext += float(rlen) / self._rbps
+            if self._rbucket is not None:
+                await self._rbucket.acquire(rlen)
 
-        return buf[:pos] if buffer is None else pos
+        return pos
+
+    async def read(self, max_bytes: int = -1, *,
+            buffer: WritableBuffer = None) -> ReadRetType:
+        if max_bytes < 0:
+            max_bytes = self._hint(self._rbps, self._rbucket) * 10
+
+        if buffer is None:
+            # read into a pooled buffer, and copy out only the bytes read
+            with default_buffer_pool.acquire(max_bytes) as lease:
+                pos = await self._read_into(max_bytes, lease.view)
+                return bytes(lease.view[:pos])
+
+        with memoryview(buffer) as view:
+            return await self._read_into(max_bytes, view)
@@ -1,43 +1,38 @@
 import asyncio
 import logging
+import os
 import socket
-from typing import Callable, Awaitable
+import stat
+import time
+from typing import Callable, Awaitable, Dict, List
 
-from . import Connection, TcpAdaptor, SocketAddress
+from .. import compat
+from . import Connection, TcpAdaptor, UnixAdaptor, SocketAddress
 
 __all__ = [
     'ProcessorType',
     'TcpServer',
+    'UnixServer',
 ]
 
 ProcessorType = Callable[[Connection], Awaitable[None]]
 _logger = logging.getLogger('kedixa.comm.tcp_server')
 
+DEFAULT_BACKLOG: int = 1024
 
-def _wrap_processor(proc: ProcessorType):
-    async def wrapper(r: asyncio.StreamReader, w: asyncio.StreamWriter):
-        ip, port, family = None, None, None
-        peer = w.get_extra_info('peername')
-        if isinstance(peer, tuple):
-            if len(peer) >= 2:
-                ip, port = peer[:2]
-                if len(peer) == 2:
-                    family = socket.AF_INET
-                elif len(peer) == 4:
-                    family = socket.AF_INET6
 
-        addr = SocketAddress(ip, port, family=family)
-        adaptor = TcpAdaptor(addr=addr, reader=r, writer=w)
-        conn = Connection(adaptor, prepared=True)
+def _peer_address(w: asyncio.StreamWriter) -> SocketAddress:
+    ip, port, family = None, None, None
+    peer = w.get_extra_info('peername')
+    if isinstance(peer, tuple):
+        if len(peer) >= 2:
+            ip, port = peer[:2]
+            if len(peer) == 2:
+                family = socket.AF_INET
+            elif len(peer) == 4:
+                family = socket.AF_INET6
 
-        try:
-            async with conn:
-                return await proc(conn)
-        except BaseException as e:
-            _logger.error(f'Exception when process {ip}:{port} {type(e)}{e}')
-        return None
-
-    return wrapper
+    return SocketAddress(ip, port, family=family)
 
 
 async def _forever():
@@ -52,15 +47,52 @@ class TcpServer:
     def __init__(self, *,
             local_ip: str = '0.0.0.0',
             listen_port: int = 0,
-            processor: Callable[[Connection], None]):
+            processor: Callable[[Connection], None],
+            sock: socket.socket = None,
+            reuse_port: bool = False,
+            max_connections: int = 0,
+            idle_timeout: float = 0.0,
+            read_timeout: float = 0.0):
+        '''
+        If sock is not None, serve on the listening socket
+        instead of create a new one by local_ip and listen_port.
+        When max_connections (> 0) connections are being processed,
+        a listening socket stops accepting after it accepts one more
+        connection, which waits until one of them finishes.
+        Connections without any read or write for idle_timeout seconds are
+        aborted. A read pending for more than read_timeout seconds is
+        aborted too if data is read after the last write, that is the peer
+        stops in the middle of a message; the timer starts with each read,
+        so a long message that keeps arriving is never aborted. Waiting for
+        the first byte after a write, for example the next request of a
+        keep-alive connection, is limited by idle_timeout only. A connection
+        that never writes is in one message after its first byte, so
+        streams that only read and may pause should use idle_timeout.
+        Zero means no limit.
+        '''
         self._ip: str           = local_ip
         self._port: int         = listen_port
         self._proc: Callable    = processor
+        self._sock: socket.socket = sock
+        self._reuse_port: bool  = reuse_port
         self._stopped: bool     = True
         self._port_zero: bool   = self._port == 0
-        self._server: asyncio.AbstractServer = None
         self._forever: asyncio.Task = None
 
+        self._max_conns: int        = max_connections
+        self._idle_timeout: float   = idle_timeout
+        self._read_timeout: float   = read_timeout
+
+        self._sockets: List[socket.socket] = []
+        self._accept_tasks: List[asyncio.Task] = []
+        self._sweeper: asyncio.Task = None
+        self._slots: asyncio.Semaphore = None
+        self._conns: Dict[asyncio.Task, TcpAdaptor] = {}
+
+        self._accepted: int     = 0
+        self._finished: int     = 0
+        self._timeouts: int     = 0
+
     @property
     def port(self) -> int:
         '''
@@ -69,27 +101,175 @@ class TcpServer:
         '''
         return self._port
 
+    @property
+    def sockets(self) -> List[socket.socket]:
+        '''The listening sockets after start'''
+        return list(self._sockets)
+
+    @property
+    def connections(self) -> List[TcpAdaptor]:
+        '''Adaptors of the connections being processed'''
+        return list(self._conns.values())
+
+    def stats(self) -> Dict[str, int]:
+        '''The number of connections accepted, being processed and finished'''
+        return {
+            'accepted': self._accepted,
+            'active': len(self._conns),
+            'finished': self._finished,
+            'timeouts': self._timeouts,
+        }
+
+    def _create_sockets(self) -> List[socket.socket]:
+        infos = socket.getaddrinfo(self._ip, self._port,
+            type=socket.SOCK_STREAM, flags=socket.AI_PASSIVE)
+
+        socks = []
+        try:
+            for family, socktype, proto, _, sa in infos:
+                sock = socket.socket(family, socktype, proto)
+                socks.append(sock)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                if self._reuse_port:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+                if family == socket.AF_INET6 and hasattr(socket, 'IPPROTO_IPV6'):
+                    sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+
+                sock.bind(sa)
+                sock.listen(DEFAULT_BACKLOG)
+        except:
+            for sock in socks:
+                sock.close()
+            raise
+
+        return socks
+
+    def _make_adaptor(self, r: asyncio.StreamReader,
+            w: asyncio.StreamWriter) -> TcpAdaptor:
+        return TcpAdaptor(addr=_peer_address(w), reader=r, writer=w)
+
     async def start(self):
         assert self._stopped is True
         self._stopped = False
-        proc = _wrap_processor(self._proc)
-        self._server = await asyncio.start_server(proc, self._ip, self._port)
+
+        if self._sock is not None:
+            self._sockets = [self._sock]
+        else:
+            self._sockets = self._create_sockets()
 
         if self._port == 0:
-            for sock in self._server.sockets:
+            for sock in self._sockets:
                 s = sock.getsockname()
                 if isinstance(s, tuple) and len(s) >= 2 and isinstance(s[1], int):
                     self._port = s[1]
                     break
 
+        if self._max_conns > 0:
+            self._slots = asyncio.Semaphore(self._max_conns)
+
+        for sock in self._sockets:
+            sock.setblocking(False)
+            task = asyncio.ensure_future(self._accept_loop(sock))
+            self._accept_tasks.append(task)
+
+        if self._idle_timeout > 0 or self._read_timeout > 0:
+            self._sweeper = asyncio.ensure_future(self._sweep_loop())
+
+    async def _accept_loop(self, sock: socket.socket):
+        loop = asyncio.get_event_loop()
+
+        while not self._stopped:
+            try:
+                csock, _ = await loop.sock_accept(sock)
+            except asyncio.CancelledError:
+                raise
+            except OSError as e:
+                # for example, too many open files
+                _logger.error(f'Exception when accept {type(e)}{e}')
+                await asyncio.sleep(0.1)
+                continue
+
+            if self._slots is not None:
+                # acquire after accept, so an idle listener never holds a
+                # slot; while there are too many connections, the accepted
+                # one waits and this listener stops accepting
+                try:
+                    await self._slots.acquire()
+                except:
+                    csock.close()
+                    raise
+
+            self._accepted += 1
+            task = asyncio.ensure_future(self._process(csock))
+            self._conns[task] = None
+
+    async def _process(self, csock: socket.socket):
+        task = asyncio.current_task() if compat.PY37 else asyncio.Task.current_task()
+        conn = None
+
+        try:
+            r, w = await asyncio.open_connection(sock=csock)
+            adaptor = self._make_adaptor(r, w)
+            self._conns[task] = adaptor
+            conn = Connection(adaptor, prepared=True)
+
+            async with conn:
+                return await self._proc(conn)
+        except BaseException as e:
+            peer = conn.info if conn else 'unknown'
+            _logger.error(f'Exception when process {peer} {type(e)}{e}')
+            if conn is None:
+                csock.close()
+        finally:
+            del self._conns[task]
+            self._finished += 1
+            if self._slots is not None:
+                self._slots.release()
+        return None
+
+    async def _sweep_loop(self):
+        timeouts = [t for t in (self._idle_timeout, self._read_timeout) if t > 0]
+        interval = max(0.01, min(timeouts) / 4)
+
+        while not self._stopped:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+
+            for adaptor in list(self._conns.values()):
+                if adaptor is None:
+                    continue
+
+                idle = self._idle_timeout > 0 and \
+                    now - adaptor.last_active > self._idle_timeout
+                since, rtime = adaptor.read_since, adaptor.last_read
+                wtime = adaptor.last_write
+                slow = self._read_timeout > 0 and since is not None and \
+                    now - since > self._read_timeout and rtime is not None \
+                    and (wtime is None or rtime > wtime)
+
+                if idle or slow:
+                    self._timeouts += 1
+                    adaptor.abort()
+
     def stop(self):
+        '''Stop accepting new connections'''
         if not self._stopped:
             self._stopped = True
 
             if self._port_zero:
                 self._port = 0
 
-            self._server.close()
+            for task in self._accept_tasks:
+                task.cancel()
+            self._accept_tasks = []
+
+            for sock in self._sockets:
+                sock.close()
+            self._sockets = []
+
+            if self._sweeper:
+                self._sweeper.cancel()
+                self._sweeper = None
 
             if self._forever:
                 self._forever.cancel()
@@ -100,7 +280,89 @@ class TcpServer:
         await self._forever
         self._forever = None
 
-    async def wait_finish(self):
+    async def wait_finish(self, timeout: float = None):
+        '''
+        Stop accepting and wait until the listening sockets are closed.
+        If timeout is not None, also wait for the processors in flight,
+        and cancel the ones not finished in timeout seconds; otherwise
+        they are left running, as an idle keep-alive connection may
+        never finish.
+        '''
+        accepts = self._accept_tasks
         if not self._stopped:
             self.stop()
-        await self._server.wait_closed()
+        if accepts:
+            await asyncio.wait(accepts)
+
+        if timeout is None:
+            return
+
+        tasks = list(self._conns)
+        if not tasks:
+            return
+
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+
+
+class UnixServer(TcpServer):
+    def __init__(self, *,
+            path: str,
+            processor: Callable[[Connection], None],
+            abstract: bool = False,
+            sock: socket.socket = None,
+            max_connections: int = 0,
+            idle_timeout: float = 0.0,
+            read_timeout: float = 0.0):
+        '''
+        Serve on unix domain socket path, in the linux abstract namespace
+        if abstract, otherwise a stale socket file on path is removed
+        before bind, and the socket file is removed after stop.
+        The other arguments are the same as TcpServer.
+        '''
+        super().__init__(processor=processor, sock=sock,
+            max_connections=max_connections,
+            idle_timeout=idle_timeout,
+            read_timeout=read_timeout)
+
+        self._addr: SocketAddress = SocketAddress.from_path(path, abstract=abstract)
+
+    @property
+    def addr(self) -> SocketAddress:
+        return self._addr
+
+    def _create_sockets(self) -> List[socket.socket]:
+        path = self._addr.path
+        if not self._addr.abstract:
+            try:
+                if stat.S_ISSOCK(os.stat(path).st_mode):
+                    os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(path)
+            sock.listen(DEFAULT_BACKLOG)
+        except:
+            sock.close()
+            raise
+
+        return [sock]
+
+    def _make_adaptor(self, r: asyncio.StreamReader,
+            w: asyncio.StreamWriter) -> TcpAdaptor:
+        return UnixAdaptor(self._addr, reader=r, writer=w)
+
+    def stop(self):
+        if not self._stopped:
+            super().stop()
+
+            if self._sock is None and not self._addr.abstract:
+                try:
+                    os.unlink(self._addr.path)
+                except FileNotFoundError:
+                    pass
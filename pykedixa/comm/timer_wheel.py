@@ -0,0 +1,292 @@
+import asyncio
+import io
+import math
+import weakref
+from typing import Callable, Dict, List, Sequence
+
+from .. import compat
+from .basic import (
+    BasicTransformer,
+
+    ReadableBuffer,
+    WritableBuffer,
+    ReadRetType,
+)
+from .exception import (
+    TransformerTimeoutError,
+)
+
+__all__ = [
+    'WheelTimer',
+    'TimerWheel',
+    'get_timer_wheel',
+    'DeadlineTransformer',
+]
+
+
+DEFAULT_WHEEL_TICK: float = 0.1
+DEFAULT_WHEEL_SLOTS: int = 512
+
+
+class WheelTimer:
+    __slots__ = ('_wheel', '_slot', '_rounds', '_callback', '_args')
+
+    def __init__(self, wheel: 'TimerWheel', slot: int, rounds: int,
+            callback: Callable, args: tuple):
+        self._wheel = wheel
+        self._slot: int = slot
+        self._rounds: int = rounds
+        self._callback: Callable = callback
+        self._args: tuple = args
+
+    def cancelled(self) -> bool:
+        return self._wheel is None
+
+    def cancel(self):
+        '''Disarm the timer in O(1), nothing happens if it already fired'''
+        if self._wheel is not None:
+            self._wheel._remove(self)
+            self._wheel = None
+
+
+class TimerWheel:
+    def __init__(self, *,
+            tick: float = DEFAULT_WHEEL_TICK,
+            slots: int = DEFAULT_WHEEL_SLOTS,
+            loop: asyncio.AbstractEventLoop = None):
+        '''
+        Hashed timer wheel for coarse deadlines, timers fire in the
+        first tick after their deadline, so at most one tick late.
+        Arm and cancel are O(1), and there is only one loop timer for
+        all the timers, which runs only when some timers are armed.
+        '''
+        self._tick: float = tick
+        self._slots: List[Dict[WheelTimer, None]] = [{} for _ in range(slots)]
+        self._loop: asyncio.AbstractEventLoop = loop or asyncio.get_event_loop()
+
+        self._cursor: int = 0
+        self._count: int = 0
+        self._next_time: float = 0.0
+        self._handle: asyncio.TimerHandle = None
+        self._ticking: bool = False
+
+    @property
+    def tick(self) -> float:
+        return self._tick
+
+    def __len__(self) -> int:
+        return self._count
+
+    def time(self) -> float:
+        return self._loop.time()
+
+    def call_later(self, delay: float, callback: Callable, *args) -> WheelTimer:
+        '''Call callback(*args) after at least delay seconds'''
+        now = self._loop.time()
+        if self._handle is None and not self._ticking:
+            self._next_time = now + self._tick
+            self._handle = self._loop.call_at(self._next_time, self._on_tick)
+
+        nslots = len(self._slots)
+        ticks = math.ceil((now + delay - self._next_time) / self._tick) + 1
+        if ticks < 1:
+            ticks = 1
+
+        slot = (self._cursor + ticks) % nslots
+        timer = WheelTimer(self, slot, (ticks - 1) // nslots, callback, args)
+        self._slots[slot][timer] = None
+        self._count += 1
+        return timer
+
+    def _remove(self, timer: WheelTimer):
+        del self._slots[timer._slot][timer]
+        self._count -= 1
+
+    def _on_tick(self):
+        self._handle = None
+        now = self._loop.time()
+
+        # callbacks may arm timers, they are scheduled by this tick
+        self._ticking = True
+        try:
+            # catch up if the loop was blocked for several ticks
+            while self._next_time <= now and self._count > 0:
+                self._next_time += self._tick
+                self._cursor = (self._cursor + 1) % len(self._slots)
+                self._expire(self._slots[self._cursor])
+        finally:
+            self._ticking = False
+
+        if self._count > 0 and self._handle is None:
+            self._handle = self._loop.call_at(self._next_time, self._on_tick)
+
+    def _expire(self, slot: Dict[WheelTimer, None]):
+        if not slot:
+            return
+
+        fired = []
+        for timer in slot:
+            if timer._rounds > 0:
+                timer._rounds -= 1
+            else:
+                fired.append(timer)
+
+        for timer in fired:
+            del slot[timer]
+            self._count -= 1
+            timer._wheel = None
+
+        for timer in fired:
+            try:
+                timer._callback(*timer._args)
+            except Exception as e:
+                self._loop.call_exception_handler({
+                    'message': 'Exception in TimerWheel callback',
+                    'exception': e,
+                })
+
+    def close(self):
+        '''Drop all the timers without calling them'''
+        for slot in self._slots:
+            for timer in slot:
+                timer._wheel = None
+            slot.clear()
+        self._count = 0
+
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+
+_wheels: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, TimerWheel]' \
+    = weakref.WeakKeyDictionary()
+
+
+def get_timer_wheel() -> TimerWheel:
+    '''The default TimerWheel of the current event loop'''
+    loop = asyncio.get_event_loop()
+    wheel = _wheels.get(loop)
+    if wheel is None:
+        wheel = _wheels[loop] = TimerWheel(loop=loop)
+    return wheel
+
+
+def _current_task() -> asyncio.Task:
+    return asyncio.current_task() if compat.PY37 else asyncio.Task.current_task()
+
+
+_READ    = 0
+_WRITE   = 1
+
+
+class DeadlineTransformer(BasicTransformer):
+    def __init__(self, *,
+            read_timeout: float = 0.0,
+            write_timeout: float = 0.0,
+            idle_timeout: float = 0.0,
+            wheel: TimerWheel = None):
+        '''
+        Raise TransformerTimeoutError when a read does not finish in
+        read_timeout seconds, a write or flush in write_timeout seconds,
+        or no read or write finishes in idle_timeout seconds; the pending
+        operation is cancelled and all the later ones raise the same error.
+        Zero means no limit.
+        Timers are kept in wheel, the default one of the loop if None.
+        '''
+        super().__init__()
+        self._timeouts: List[float] = [read_timeout, write_timeout]
+        self._idle_timeout: float = idle_timeout
+        self._wheel: TimerWheel = wheel
+
+        self._tasks: List[asyncio.Task] = [None, None]
+        self._fired: List[str] = [None, None]
+        self._idle_timer: WheelTimer = None
+        self._last_active: float = 0.0
+        self._expired: str = None
+
+    @property
+    def expired(self) -> str:
+        '''The reason if the deadline was exceeded, otherwise None'''
+        return self._expired
+
+    async def prepare(self):
+        if self._wheel is None:
+            self._wheel = get_timer_wheel()
+
+        if self._idle_timeout > 0:
+            self._last_active = self._wheel.time()
+            self._idle_timer = self._wheel.call_later(self._idle_timeout, self._on_idle)
+
+    async def finish(self):
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+    def _on_timeout(self, kind: int, reason: str):
+        task = self._tasks[kind]
+        if task is not None and self._fired[kind] is None:
+            self._fired[kind] = reason
+            task.cancel()
+
+    def _on_idle(self):
+        # operations only record the time, rearm for the rest if active
+        rest = self._last_active + self._idle_timeout - self._wheel.time()
+        if rest > 0:
+            self._idle_timer = self._wheel.call_later(rest, self._on_idle)
+            return
+
+        self._idle_timer = None
+        self._expired = 'IdleTimeout'
+        self._on_timeout(_READ, 'IdleTimeout')
+        self._on_timeout(_WRITE, 'IdleTimeout')
+
+    async def _guard(self, kind: int, coro):
+        if self._expired is not None:
+            coro.close()
+            raise TransformerTimeoutError(self._expired)
+
+        if self._wheel is None:
+            await self.prepare()
+
+        timeout = self._timeouts[kind]
+        timer = None
+        if timeout > 0:
+            timer = self._wheel.call_later(timeout, self._on_timeout, kind,
+                'ReadTimeout' if kind == _READ else 'WriteTimeout')
+
+        task = self._tasks[kind] = _current_task()
+        try:
+            return await coro
+        except asyncio.CancelledError:
+            reason = self._fired[kind]
+            if reason is None:
+                raise
+
+            if hasattr(task, 'uncancel'):
+                task.uncancel()
+            self._expired = self._expired or reason
+            raise TransformerTimeoutError(reason, timeout=timeout)
+        finally:
+            if timer is not None:
+                timer.cancel()
+            self._tasks[kind] = None
+            self._fired[kind] = None
+            if self._idle_timeout > 0:
+                self._last_active = self._wheel.time()
+
+    async def read(self, max_bytes: int = -1, *,
+            buffer: WritableBuffer = None) -> ReadRetType:
+        return await self._guard(_READ, self._nxt.read(max_bytes, buffer=buffer))
+
+    async def write(self, buffer: ReadableBuffer) -> int:
+        return await self._guard(_WRITE, self._nxt.write(buffer))
+
+    async def write_vectored(self, buffers: Sequence[ReadableBuffer]) -> int:
+        return await self._guard(_WRITE, self._nxt.write_vectored(buffers))
+
+    async def sendfile(self, file: io.BufferedIOBase, offset: int = 0,
+            count: int = None) -> int:
+        return await self._guard(_WRITE, self._nxt.sendfile(file, offset, count))
+
+    async def flush(self):
+        return await self._guard(_WRITE, self._nxt.flush())
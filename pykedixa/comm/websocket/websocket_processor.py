@@ -1,6 +1,7 @@
 import asyncio
 import logging
 import random
+import socket
 import ssl
 from urllib.parse import urlparse
 from typing import (
@@ -10,15 +11,17 @@ from typing import (
 
 from .. import (
     Connection,
-    TcpAdaptor,
     SslTransformer,
     ReadUntilTransformer,
+    SocketAddress,
+    UnixAdaptor,
 
     CommException,
     TransformerEofError,
     AdaptorEofError,
 
     getaddrinfo,
+    happy_eyeballs_connect,
 )
 from .websocket_message import (
     WebSocketFrame,
@@ -151,29 +154,42 @@ class WebSocketClient(WebSocketProcessor):
     def __init__(self, url: str, *,
             ssl_ctx: ssl.SSLContext = None,
             upgrade_headers: List[Tuple[str, str]] = None,
+            unix_path: str = None,
             frame_handler: WebSocketHandlerBase):
+        '''
+        If unix_path is not None, connect to the unix domain socket
+        instead of the host in url, which is still used in Host header.
+        '''
         super().__init__(frame_handler=frame_handler)
 
         self._url : str = url
         self._ssl_ctx: ssl.SSLContext = ssl_ctx
+        self._unix_path: str = unix_path
 
         self._ex_hdrs: List[Tuple[str, str]] = upgrade_headers
         if self._ex_hdrs is None:
             self._ex_hdrs = []
 
-    async def _open(self):
-        scheme, host, port, req_url = _ws_parse_url(self._url)
-        addrs = await getaddrinfo(host, port)
+    async def _connect(self, host: str, port: int) -> Connection:
+        if self._unix_path is not None:
+            conn = Connection(UnixAdaptor(SocketAddress(None, None, path=self._unix_path)))
+            await conn.open()
+            return conn
+
+        addrs = await getaddrinfo(host, port, family=socket.AF_UNSPEC)
 
         if len(addrs) == 0:
             what = 'Cannot resolve host'
             raise WebSocketProcessorError(what, host=host, port=port)
 
-        conn = Connection(TcpAdaptor(addrs[0]))
+        adaptor = await happy_eyeballs_connect(addrs)
+        return Connection(adaptor, prepared=True)
 
-        try:
-            await conn.open()
+    async def _open(self):
+        scheme, host, port, req_url = _ws_parse_url(self._url)
+        conn = await self._connect(host, port)
 
+        try:
             if scheme == 'wss':
                 if self._ssl_ctx is None:
                     self._ssl_ctx = ssl.create_default_context()
@@ -0,0 +1,149 @@
+import asyncio
+import os
+import socket
+
+import pytest
+from kedixa.comm import *
+
+async def read_all(c: CommunicateBase) -> bytes:
+    data = bytearray()
+    while True:
+        try:
+            data.extend(await c.read())
+        except AdaptorEofError:
+            break
+    return bytes(data)
+
+async def echo(conn: Connection):
+    while True:
+        try:
+            data = await conn.c.read()
+        except AdaptorEofError:
+            break
+        await conn.c.write_all(data)
+
+@pytest.mark.asyncio
+async def test_duplex_bridge_half_close():
+    p1, p2 = MemoryPipe(), MemoryPipe()
+    bridge = DuplexBridge(p1.server, p2.client, max_per_read=1000)
+    task = asyncio.ensure_future(bridge.run())
+
+    request = os.urandom(100000)
+    await p1.client.write_all(request)
+    p1.client.write_eof()
+
+    # the peer sees eof, and can still reply
+    assert await read_all(p2.server) == request
+    await p2.server.write_all(b'reply')
+    p2.server.write_eof()
+
+    assert await read_all(p1.client) == b'reply'
+    await asyncio.wait_for(task, 1.0)
+    assert bridge.stats() == {'a_to_b': len(request), 'b_to_a': 5}
+
+@pytest.mark.asyncio
+async def test_duplex_bridge_stop():
+    p1, p2 = MemoryPipe(), MemoryPipe()
+    bridge = DuplexBridge(p1.server, p2.client)
+    task = asyncio.ensure_future(bridge.run())
+
+    await p1.client.write_all(b'hello')
+    assert await p2.server.read() == b'hello'
+
+    bridge.stop()
+    await asyncio.wait_for(task, 1.0)
+    assert bridge.a_to_b == 5 and bridge.b_to_a == 0
+
+class BrokenWriter(BasicAdaptor):
+    '''Never sends anything, and fails on write'''
+    async def read(self, max_bytes: int = -1, *, buffer=None):
+        await asyncio.Event().wait()
+
+    async def write(self, buffer) -> int:
+        await asyncio.sleep(0.01)
+        raise AdaptorException('BrokenWriter: write failed')
+
+@pytest.mark.asyncio
+async def test_duplex_bridge_write_error():
+    p1 = MemoryPipe()
+    bridge = DuplexBridge(p1.server, BrokenWriter())
+    task = asyncio.ensure_future(bridge.run())
+
+    # the write fails while the next read waits forever
+    await p1.client.write_all(b'hello')
+    with pytest.raises(AdaptorException):
+        await asyncio.wait_for(task, 1.0)
+
+@pytest.mark.asyncio
+async def test_duplex_bridge_proxy():
+    upstream = TcpServer(local_ip='127.0.0.1', processor=echo)
+    await upstream.start()
+
+    async def proxy(conn: Connection):
+        up = Connection(TcpAdaptor(SocketAddress('127.0.0.1', upstream.port)))
+        async with up:
+            await DuplexBridge(conn, up).run()
+
+    server = TcpServer(local_ip='127.0.0.1', processor=proxy)
+    await server.start()
+
+    try:
+        data = os.urandom(4 * 1024 * 1024)
+        async with TcpAdaptor(SocketAddress('127.0.0.1', server.port)) as c:
+            async def send():
+                await c.write_all(data)
+                c.write_eof()
+
+            sender = asyncio.ensure_future(send())
+            assert await asyncio.wait_for(read_all(c), 5.0) == data
+            await sender
+    finally:
+        await server.wait_finish(1.0)
+        await upstream.wait_finish(1.0)
+
+async def start_sink_server(received: bytearray) -> TcpServer:
+    async def sink(conn: Connection):
+        while True:
+            try:
+                received.extend(await conn.c.read())
+            except AdaptorEofError:
+                break
+
+    server = TcpServer(local_ip='127.0.0.1', processor=sink)
+    await server.start()
+    return server
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('raw', [True, False])
+async def test_splice_bridge(raw):
+    received = bytearray()
+    sink = await start_sink_server(received)
+    data = os.urandom(1024 * 1024 + 123)
+
+    # only RawTcpAdaptor on both sides can be spliced
+    if raw:
+        s1, s2 = socket.socketpair()
+        src, peer = RawTcpAdaptor(None, sock=s1), RawTcpAdaptor(None, sock=s2)
+    else:
+        pipe = MemoryPipe()
+        src, peer = pipe.server, pipe.client
+
+    async def send():
+        await peer.write_all(data)
+        await peer.finish()
+
+    try:
+        sender = asyncio.ensure_future(send())
+        async with RawTcpAdaptor(SocketAddress('127.0.0.1', sink.port)) as dst:
+            bridge = SpliceBridge(src, dst, max_bytes=len(data) - 100,
+                pipe_size=1024 * 1024)
+            # os.splice is new in python 3.10, otherwise it is copied
+            assert bridge.can_splice() == (raw and hasattr(os, 'splice'))
+            await bridge.run()
+            assert bridge.total_bytes == len(data) - 100
+        await sender
+        await src.finish()
+    finally:
+        await sink.wait_finish(2.0)
+
+    assert received == data[:-100]
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+from kedixa.comm import *
+from kedixa.comm.http import *
+
+def test_buffer_pool():
+    pool = BufferPool(min_size=16, max_size=1024, max_bytes=2100)
+
+    with pool.acquire(10) as lease:
+        assert len(lease) == 10
+        assert lease.capacity == 16
+        lease.view[:] = b'0123456789'
+
+    with pool.acquire(12) as lease:
+        assert lease.capacity == 16
+    assert pool.stats()['hits'] == 1
+
+    leases = [pool.acquire(1000) for _ in range(3)]
+    for lease in leases:
+        lease.release()
+        lease.release()
+
+    stats = pool.stats()
+    assert stats['misses'] == 4
+    assert stats['bytes_leased'] == 0
+    # the third one exceeds max_bytes
+    assert stats['bytes_held'] == 16 + 1024 * 2
+
+    with pool.acquire(4096) as lease:
+        assert lease.capacity == 4096
+    assert pool.stats()['bytes_held'] == 16 + 1024 * 2
+
+@pytest.mark.asyncio
+async def test_bridge_with_pool():
+    pool = BufferPool(min_size=16)
+    data = bytes(range(256)) * 64
+    src = LoopbackAdaptor()
+    dst = LoopbackAdaptor()
+    chunk = HttpChunkTransformer()
+    runtil = ReadUntilTransformer()
+    chunk.bind_next(runtil)
+    runtil.bind_next(dst)
+
+    await src.write_all(data)
+    await CommBridge(src, chunk, max_per_read=1000, buffer_pool=pool).run()
+    await chunk.flush()
+    assert pool.stats()['misses'] == 1
+    assert pool.stats()['bytes_leased'] == 0
+
+    out = bytearray()
+    while True:
+        try:
+            out.extend(await chunk.read())
+        except TransformerEofError:
+            break
+    assert out == data
+
+class HoldAdaptor(BasicAdaptor):
+    '''Keep written buffers without copy, like a transport with unsent data'''
+    def __init__(self):
+        super().__init__()
+        self.buffers = []
+
+    async def write(self, buffer):
+        self.buffers.append(buffer)
+        return len(buffer)
+
+@pytest.mark.asyncio
+async def test_bridge_buffer_reuse():
+    data = os.urandom(10000)
+    src, dst = LoopbackAdaptor(), HoldAdaptor()
+    await src.write_all(data)
+    await CommBridge(src, dst, max_per_read=1000, buffer_pool=BufferPool()).run()
+    assert b''.join(dst.buffers) == data
@@ -0,0 +1,45 @@
+import os
+
+import pytest
+from kedixa.comm import *
+
+@pytest.mark.asyncio
+async def test_capture_replay():
+    tmp_fn = 'files/capture.tmp'
+    writer = CaptureWriter(tmp_fn)
+    lo = LoopbackAdaptor()
+    cap = CaptureTransformer(writer)
+    skip = CaptureTransformer(writer, sample_rate=0.0)
+    cap.bind_next(lo)
+    skip.bind_next(lo)
+
+    async with lo, cap, skip:
+        await cap.write_all(b'hello ')
+        await cap.write_all_vectored([b'wor', b'ld'])
+        assert await cap.read(8) == b'hello wo'
+        await skip.write_all(b'not captured')
+        buf = bytearray(16)
+        n = await cap.read(buffer=buf)
+        assert buf[:n] == b'rldnot captured'
+
+    await writer.aclose()
+    assert writer.dropped == 0
+
+    records = list(iter_capture(tmp_fn))
+    os.remove(tmp_fn)
+
+    assert all(r.conn_id == cap.conn_id for r in records)
+    assert [r.direction for r in records] == [
+        CaptureDirection.OPEN,
+        CaptureDirection.WRITE,
+        CaptureDirection.WRITE,
+        CaptureDirection.WRITE,
+        CaptureDirection.READ,
+        CaptureDirection.READ,
+        CaptureDirection.CLOSE,
+    ]
+
+    replay = CaptureReplayAdaptor(records, cap.conn_id)
+    assert await replay.read_exactly(23) == b'hello world' + b'not captured'
+    with pytest.raises(AdaptorEofError):
+        await replay.read()
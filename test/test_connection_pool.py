@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+from kedixa.comm import *
+
+async def echo(conn: Connection):
+    while True:
+        try:
+            data = await conn.c.read()
+        except AdaptorEofError:
+            break
+        await conn.c.write_all(data)
+
+async def close_at_once(conn: Connection):
+    pass
+
+@pytest.mark.asyncio
+async def test_connection_pool_reuse():
+    server = TcpServer(local_ip='127.0.0.1', processor=echo)
+    await server.start()
+    pool = ConnectionPool(max_per_host=1)
+    addr = SocketAddress('127.0.0.1', server.port)
+
+    try:
+        async with pool.connection(addr) as conn:
+            await conn.bind(ReadUntilTransformer())
+            await conn.c.write_all(b'ping\n')
+            assert await conn.c.read_until(b'\n') == b'ping\n'
+            first = conn
+
+        assert first.depth == 0
+        assert pool.idle == 1
+
+        async with pool.connection(addr) as conn:
+            assert conn is first
+            await conn.c.write_all(b'pong')
+            assert await conn.c.read_exactly(4) == b'pong'
+
+        # the second acquire waits until the first one is released
+        c1 = await pool.acquire(addr)
+        task = asyncio.ensure_future(pool.acquire(addr))
+        await asyncio.sleep(0.01)
+        assert not task.done()
+        await pool.release(c1)
+        c2 = await task
+        assert c2 is c1
+        await pool.release(c2)
+
+        assert pool.stats()['hits'] == 3
+        assert pool.total == 1
+    finally:
+        await pool.close()
+        await server.wait_finish()
+
+    assert pool.total == 0
+
+@pytest.mark.asyncio
+async def test_connection_pool_half_closed():
+    server = TcpServer(local_ip='127.0.0.1', processor=close_at_once)
+    await server.start()
+    pool = ConnectionPool()
+    addr = SocketAddress('127.0.0.1', server.port)
+
+    try:
+        c1 = await pool.acquire(addr)
+        await pool.release(c1)
+        # wait for the peer to close the connection
+        await asyncio.sleep(0.05)
+
+        c2 = await pool.acquire(addr)
+        assert c2 is not c1
+        await pool.release(c2, reuse=False)
+    finally:
+        await pool.close()
+        await server.wait_finish()
+
+@pytest.mark.asyncio
+async def test_connection_pool_wake_one():
+    server = TcpServer(local_ip='127.0.0.1', processor=echo)
+    await server.start()
+    pool = ConnectionPool(max_per_host=1)
+    addr = SocketAddress('127.0.0.1', server.port)
+
+    try:
+        c1 = await pool.acquire(addr)
+        tasks = [asyncio.ensure_future(pool.acquire(addr)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+
+        # only the first waiter is woken, it passes the wakeup on
+        # if it is cancelled before it runs
+        await pool.release(c1)
+        tasks[0].cancel()
+        await asyncio.sleep(0.01)
+        assert [t.done() for t in tasks] == [True, True, False]
+        assert tasks[1].result() is c1
+
+        await pool.release(c1)
+        assert await tasks[2] is c1
+        await pool.release(c1)
+    finally:
+        await pool.close()
+        await server.wait_finish()
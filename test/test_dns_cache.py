@@ -0,0 +1,54 @@
+import asyncio
+import socket
+import traceback
+
+import pytest
+from kedixa.comm import *
+from kedixa.comm import address
+
+@pytest.mark.asyncio
+async def test_dns_cache(monkeypatch):
+    calls = []
+
+    async def fake_resolve(host, port, family, socktype, proto):
+        calls.append(host)
+        await asyncio.sleep(0.01)
+        if host == 'bad.host':
+            raise socket.gaierror('not found')
+        return [SocketAddress('10.0.0.1', port)]
+
+    monkeypatch.setattr(address, '_resolve_addrinfo', fake_resolve)
+    cache = AddrInfoCache(ttl=0.2, negative_ttl=0.1, max_size=2)
+
+    # concurrent lookups share one resolution
+    res = await asyncio.gather(*[
+        getaddrinfo('a.host', 80, cache=cache) for _ in range(10)
+    ])
+    assert calls == ['a.host']
+    assert all(r[0].ip == '10.0.0.1' for r in res)
+
+    await getaddrinfo('a.host', 80, cache=cache)
+    assert len(calls) == 1
+
+    errors = []
+    for _ in range(3):
+        with pytest.raises(socket.gaierror) as info:
+            await getaddrinfo('bad.host', 80, cache=cache)
+        errors.append(info.value)
+    assert calls.count('bad.host') == 1
+
+    # cached failures are raised as fresh copies with short tracebacks
+    assert errors[1] is not errors[2]
+    assert errors[1].args == errors[2].args
+    depth = [len(list(traceback.walk_tb(e.__traceback__))) for e in errors[1:]]
+    assert depth[0] == depth[1]
+
+    # entries in the end of ttl are refreshed in background
+    await asyncio.sleep(0.17)
+    await getaddrinfo('a.host', 80, cache=cache)
+    await asyncio.sleep(0.02)
+    assert calls.count('a.host') == 2
+    assert cache.stats()['refreshes'] == 1
+
+    await getaddrinfo('c.host', 80, cache=cache)
+    assert len(cache) == 2
@@ -1,4 +1,10 @@
+import asyncio
+import mmap
 import os
+import sys
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
 from kedixa.comm import *
@@ -26,3 +32,351 @@ async def test_file_adaptor():
     assert x.get_method() == y.get_method()
     assert x.get_body() == y.get_body()
     assert y.get_header('name') == ['value']
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('read_ahead', [0, 1, 4])
+async def test_file_adaptor_read_ahead(read_ahead):
+    tmp_fn = 'files/fileadaptor_ra.tmp'
+    data = os.urandom(100000)
+    with open(tmp_fn, 'wb') as f:
+        f.write(data)
+
+    out = bytearray()
+    buf = bytearray(3000)
+    try:
+        async with FileAdaptor(tmp_fn, block_size=4096, read_ahead=read_ahead) as fa:
+            # mix reads of different size, with or without buffer
+            while True:
+                try:
+                    if len(out) % 2 == 0:
+                        out.extend(await fa.read(1000 + len(out) % 7000))
+                    else:
+                        n = await fa.read(buffer=buf)
+                        out.extend(buf[:n])
+                except AdaptorEofError:
+                    break
+            assert fa.tell() == len(data)
+
+            fa.seek(12345)
+            assert await fa.read_exactly(100) == data[12345:12445]
+    finally:
+        os.remove(tmp_fn)
+
+    assert out == data
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('write_behind', [0, 10000])
+async def test_file_adaptor_write_behind(write_behind):
+    tmp_fn = 'files/fileadaptor_wb.tmp'
+    data = os.urandom(100000)
+    buf = bytearray(1000)
+
+    try:
+        async with FileAdaptor(tmp_fn, 'wb', write_behind=write_behind) as fa:
+            for i in range(0, len(data), 1000):
+                # the buffer is reused after write returns
+                buf[:] = data[i:i+1000]
+                assert await fa.write(buf) == 1000
+
+        with open(tmp_fn, 'rb') as f:
+            assert f.read() == data
+    finally:
+        os.remove(tmp_fn)
+
+@pytest.mark.asyncio
+async def test_file_adaptor_window():
+    tmp_fn = 'files/fileadaptor_win.tmp'
+    data = os.urandom(100000)
+    with open(tmp_fn, 'wb') as f:
+        f.write(data)
+
+    async def read_all(fa: FileAdaptor) -> bytes:
+        out = bytearray()
+        while True:
+            try:
+                out.extend(await fa.read(3000))
+            except AdaptorEofError:
+                return bytes(out)
+
+    try:
+        async with FileAdaptor(tmp_fn, offset=1000, length=5000) as fa:
+            assert fa.remaining() == 5000
+            assert await read_all(fa) == data[1000:6000]
+            assert fa.remaining() == 0
+
+        # segments read concurrently on one file descriptor
+        async with FileAdaptor(tmp_fn, block_size=4096) as fa:
+            segments = [fa.window(i, 30000, read_ahead=ra)
+                for i, ra in zip(range(0, len(data), 30000), (0, 1, 2, 3))]
+            for seg in segments:
+                await seg.prepare()
+            outs = await asyncio.gather(*[read_all(seg) for seg in segments])
+            for seg in segments:
+                await seg.finish()
+            assert b''.join(outs) == data
+
+        # segments written concurrently
+        async with FileAdaptor(tmp_fn, 'r+b') as fa:
+            segments = [fa.window(i, 50000, write_behind=wb)
+                for i, wb in ((0, 0), (50000, 10000))]
+
+            async def write_seg(seg: FileAdaptor, part: bytes):
+                async with seg:
+                    for i in range(0, len(part), 1000):
+                        await seg.write(part[i:i+1000])
+                    with pytest.raises(AdaptorException):
+                        await seg.write(b'x')
+
+            rev = data[::-1]
+            await asyncio.gather(write_seg(segments[0], rev[:50000]),
+                write_seg(segments[1], rev[50000:]))
+
+        with open(tmp_fn, 'rb') as f:
+            assert f.read() == rev
+    finally:
+        os.remove(tmp_fn)
+
+@pytest.mark.asyncio
+async def test_file_adaptor_mmap():
+    tmp_fn = 'files/fileadaptor_mmap.tmp'
+    data = os.urandom(100000)
+    with open(tmp_fn, 'wb') as f:
+        f.write(data)
+
+    try:
+        fa = FileAdaptor(tmp_fn, use_mmap=True, mmap_advice=getattr(mmap, 'MADV_SEQUENTIAL', None))
+        async with fa:
+            views = []
+            while True:
+                try:
+                    views.append(await fa.read(30000))
+                except AdaptorEofError:
+                    break
+
+            assert all(isinstance(v, memoryview) for v in views)
+            assert b''.join(views) == data
+
+            fa.seek(50000)
+            buf = bytearray(100)
+            assert await fa.read(buffer=buf) == 100
+            assert buf == data[50000:50100]
+
+            async with fa.window(99990, 100) as w:
+                assert await w.read() == data[99990:]
+
+        # views are still usable after finish
+        assert views[0] == data[:30000]
+        for v in views:
+            v.release()
+
+        with open('files/empty.tmp', 'wb'):
+            pass
+        async with FileAdaptor('files/empty.tmp', use_mmap=True) as fa:
+            with pytest.raises(AdaptorEofError):
+                await fa.read()
+    finally:
+        os.remove(tmp_fn)
+        os.remove('files/empty.tmp')
+
+@pytest.mark.asyncio
+async def test_file_adaptor_stream():
+    tmp_fn = 'files/fileadaptor_text.tmp'
+    try:
+        async with FileAdaptor(tmp_fn, 'w', write_behind=100) as fa:
+            await fa.write('abc\n')
+            await fa.write('def\n')
+
+        # text mode reads str by the file object
+        async with FileAdaptor(tmp_fn, 'r') as fa:
+            assert await fa.read(4) == 'abc\n'
+            assert await fa.read() == 'def\n'
+            with pytest.raises(AdaptorEofError):
+                await fa.read()
+            assert not fa.can_sendfile()
+    finally:
+        os.remove(tmp_fn)
+
+    if not hasattr(os, 'mkfifo'):
+        return
+
+    fifo_fn = 'files/fileadaptor_fifo.tmp'
+    os.mkfifo(fifo_fn)
+    try:
+        def feed():
+            with open(fifo_fn, 'wb') as f:
+                f.write(b'hello fifo')
+
+        loop = asyncio.get_event_loop()
+        writer = loop.run_in_executor(None, feed)
+        buf = bytearray(100)
+        out = bytearray()
+        async with FileAdaptor(fifo_fn, 'rb') as fa:
+            while True:
+                try:
+                    n = await fa.read(buffer=buf)
+                except AdaptorEofError:
+                    break
+                out.extend(buf[:n])
+        await writer
+        assert out == b'hello fifo'
+    finally:
+        os.remove(fifo_fn)
+
+@pytest.mark.asyncio
+async def test_file_adaptor_finish_waits_reads():
+    tmp_fn = 'files/fileadaptor_fin.tmp'
+    with open(tmp_fn, 'wb') as f:
+        f.write(os.urandom(100000))
+
+    closed = []
+    executor = ThreadPoolExecutor(2)
+    real_pread = os.pread
+
+    def slow_pread(fd, n, pos):
+        time.sleep(0.05)
+        data = real_pread(fd, n, pos)
+        closed.append(False)
+        return data
+
+    try:
+        fa = FileAdaptor(tmp_fn, block_size=4096, read_ahead=4, executor=executor)
+        await fa.prepare()
+        os.pread = slow_pread
+        task = asyncio.ensure_future(fa.read(10))
+        await asyncio.sleep(0.01)
+        task.cancel()
+
+        # the prefetched blocks are still being read by the executor
+        await fa.finish()
+        closed.append(True)
+        assert closed == [False] * 4 + [True]
+    finally:
+        os.pread = real_pread
+        executor.shutdown()
+        os.remove(tmp_fn)
+
+def test_shutdown_file_executor():
+    async def read_one(fn):
+        async with FileAdaptor(fn) as fa:
+            return await fa.read()
+
+    fn = 'files/fileadaptor_sd.tmp'
+    with open(fn, 'wb') as f:
+        f.write(b'x')
+
+    loop = asyncio.new_event_loop()
+    try:
+        for _ in range(2):
+            assert loop.run_until_complete(read_one(fn)) == b'x'
+            shutdown_file_executor()
+    finally:
+        loop.close()
+        os.remove(fn)
+
+@pytest.mark.asyncio
+async def test_file_adaptor_mmap_window(monkeypatch):
+    tmp_fn = 'files/fileadaptor_mmapw.tmp'
+    data = os.urandom(200000)
+    with open(tmp_fn, 'wb') as f:
+        f.write(data)
+
+    maps = []
+    real_mmap = mmap.mmap
+
+    def count_mmap(fd, length, *args, **kwargs):
+        maps.append((length, kwargs.get('offset', 0)))
+        return real_mmap(fd, length, *args, **kwargs)
+
+    monkeypatch.setattr(mmap, 'mmap', count_mmap)
+    try:
+        # windows share the map of the parent
+        async with FileAdaptor(tmp_fn, use_mmap=True) as fa:
+            for off in (0, 70000, 150000):
+                async with fa.window(off, 30000) as w:
+                    assert await w.read() == data[off:off+30000]
+        assert len(maps) == 1
+
+        # or map only their own range
+        maps.clear()
+        gran = mmap.ALLOCATIONGRANULARITY
+        off = gran * 2 + 100
+        async with FileAdaptor(tmp_fn) as fa:
+            async with fa.window(off, 1000, use_mmap=True) as w:
+                assert await w.read() == data[off:off+1000]
+                w.seek(off + 500)
+                assert await w.read() == data[off+500:off+1000]
+        assert maps == [(off + 1000 - gran * 2, gran * 2)]
+    finally:
+        os.remove(tmp_fn)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('write_behind', [0, 10000])
+async def test_file_adaptor_read_write(write_behind):
+    tmp_fn = 'files/fileadaptor_rw.tmp'
+    data = os.urandom(100000)
+    with open(tmp_fn, 'wb') as f:
+        f.write(data)
+
+    try:
+        # reads and writes share one position
+        async with FileAdaptor(tmp_fn, 'r+b', write_behind=write_behind) as fa:
+            assert await fa.read_exactly(1000) == data[:1000]
+            await fa.write_all(b'x' * 1000)
+            assert fa.tell() == 2000
+            assert await fa.read_exactly(1000) == data[2000:3000]
+
+            fa.seek(500)
+            assert await fa.read_exactly(1000) == data[500:1000] + b'x' * 500
+
+        with open(tmp_fn, 'rb') as f:
+            assert f.read() == data[:1000] + b'x' * 1000 + data[2000:]
+    finally:
+        os.remove(tmp_fn)
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not hasattr(os, 'preadv'), reason='os.preadv is not available')
+async def test_file_adaptor_cancel(monkeypatch):
+    tmp_fn = 'files/fileadaptor_cancel.tmp'
+    with open(tmp_fn, 'wb') as f:
+        f.write(os.urandom(10000))
+
+    real_preadv = os.preadv
+    results = []
+    def slow_preadv(fd, buffers, pos):
+        time.sleep(0.1)
+        try:
+            results.append(real_preadv(fd, buffers, pos))
+        except Exception as e:
+            results.append(e)
+            raise
+        return results[-1]
+
+    monkeypatch.setattr(os, 'preadv', slow_preadv)
+    executor = ThreadPoolExecutor(1)
+    try:
+        # the buffer is not released until the thread reading into it ends
+        async with FileAdaptor(tmp_fn, read_ahead=0, executor=executor) as fa:
+            buf = bytearray(100)
+            task = asyncio.ensure_future(fa.read(buffer=buf))
+            await asyncio.sleep(0.02)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert results == [100]
+            assert fa.tell() == 0
+
+        if sys.version_info < (3, 9):
+            return
+
+        # a write cancelled by the executor is reported as cancelled
+        fa = FileAdaptor(tmp_fn, 'r+b', write_behind=10000, executor=executor)
+        await fa.prepare()
+        executor.submit(time.sleep, 0.1)
+        await fa.write(b'x')
+        executor.shutdown(wait=False, cancel_futures=True)
+        with pytest.raises(asyncio.CancelledError):
+            await fa.flush()
+        fa.file.close()
+    finally:
+        executor.shutdown()
+        os.remove(tmp_fn)
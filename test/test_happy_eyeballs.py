@@ -0,0 +1,54 @@
+import asyncio
+import socket
+import time
+
+import pytest
+from kedixa.comm import *
+
+class FakeAdaptor(LoopbackAdaptor):
+    delays = {}
+
+    def __init__(self, addr: SocketAddress):
+        super().__init__()
+        self.addr = addr
+
+    async def prepare(self):
+        delay = self.delays[self.addr.ip]
+        if delay is None:
+            raise ConnectionRefusedError(self.addr.ip)
+        if delay == 'cancel':
+            raise asyncio.CancelledError()
+        await asyncio.sleep(delay)
+
+@pytest.mark.asyncio
+async def test_happy_eyeballs():
+    FakeAdaptor.delays = {'10.0.0.1': 10, '::1': 0.01, '10.0.0.2': None}
+    addrs = [
+        SocketAddress('10.0.0.1', 80),
+        SocketAddress('10.0.0.2', 80),
+        SocketAddress('::1', 80, family=socket.AF_INET6),
+    ]
+
+    start = time.monotonic()
+    c = await happy_eyeballs_connect(addrs, delay=0.05, adaptor_factory=FakeAdaptor)
+    cost = time.monotonic() - start
+
+    # families are interleaved, ::1 is the second attempt
+    assert c.addr.ip == '::1'
+    assert cost < 0.5
+
+    FakeAdaptor.delays = {'10.0.0.1': None, '10.0.0.2': None, '::1': None}
+    with pytest.raises(AdaptorException):
+        await happy_eyeballs_connect(addrs, adaptor_factory=FakeAdaptor)
+
+@pytest.mark.asyncio
+async def test_happy_eyeballs_cancelled_attempt():
+    # an attempt cancelled by others counts as failed
+    FakeAdaptor.delays = {'10.0.0.1': 'cancel', '10.0.0.2': 0.01}
+    addrs = [SocketAddress('10.0.0.1', 80), SocketAddress('10.0.0.2', 80)]
+    c = await happy_eyeballs_connect(addrs, delay=1.0, adaptor_factory=FakeAdaptor)
+    assert c.addr.ip == '10.0.0.2'
+
+    FakeAdaptor.delays = {'10.0.0.1': 'cancel', '10.0.0.2': None}
+    with pytest.raises(AdaptorException):
+        await happy_eyeballs_connect(addrs, adaptor_factory=FakeAdaptor)
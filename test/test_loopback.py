@@ -1,5 +1,5 @@
 import pytest
-from kedixa.comm import LoopbackAdaptor, AdaptorEofError
+from kedixa.comm import LoopbackAdaptor, AdaptorEofError, AdaptorException
 
 @pytest.mark.asyncio
 async def test_loopback01():
@@ -34,3 +34,39 @@ async def test_loopback03():
 
         with pytest.raises(AdaptorEofError):
             await lo.read(1)
+
+@pytest.mark.asyncio
+async def test_loopback04():
+    async with LoopbackAdaptor() as lo:
+        data = bytes([i % 251 for i in range(100000)])
+        with memoryview(data) as view:
+            for i in range(0, len(data), 7):
+                await lo.write_all(view[i:i+7], flush=False)
+
+        out = bytearray()
+        buf = bytearray(5)
+        while len(out) < len(data):
+            n = await lo.read(5, buffer=buf)
+            out.extend(buf[:n])
+        assert out == data
+
+        await lo.write(b'abc')
+        await lo.write(b'def')
+        assert await lo.read(3) == b'abc'
+        assert await lo.read(-1) == b'def'
+
+        with pytest.raises(AdaptorEofError):
+            await lo.read(1)
+
+@pytest.mark.asyncio
+async def test_loopback_vectored():
+    async with LoopbackAdaptor(maxsize=10) as lo:
+        assert await lo.write_vectored([b'abc', b'', b'defgh', b'ijklm']) == 10
+        assert await lo.read() == b'abcdefghij'
+
+        parts = [b'12345', bytearray(b'678'), memoryview(b'90')]
+        assert await lo.write_all_vectored(parts) == 10
+        assert await lo.read() == b'1234567890'
+
+        with pytest.raises(AdaptorException):
+            await lo.write_all_vectored(parts + [b'x'])
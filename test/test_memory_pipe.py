@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+from kedixa.comm import *
+from kedixa.comm.http import *
+
+@pytest.mark.asyncio
+async def test_memory_pipe_backpressure():
+    pipe = MemoryPipe(maxsize=16)
+    data = bytes(range(256)) * 64
+
+    async def producer():
+        async with pipe.client as c:
+            await c.write_all(data)
+            assert c.write_buffer_size <= 16
+            c.write_eof()
+
+    async def consumer():
+        out = bytearray()
+        async with pipe.server as s:
+            await asyncio.sleep(0.01)
+            while True:
+                try:
+                    out.extend(await s.read(10))
+                except AdaptorEofError:
+                    break
+        return out
+
+    _, out = await asyncio.gather(producer(), consumer())
+    assert out == data
+
+@pytest.mark.asyncio
+async def test_memory_pipe_half_close():
+    pipe = MemoryPipe()
+    await pipe.client.write_all(b'ping')
+    pipe.client.write_eof()
+
+    assert await pipe.server.read() == b'ping'
+    with pytest.raises(AdaptorEofError):
+        await pipe.server.read()
+
+    # the other direction still works after half close
+    await pipe.server.write_all(b'pong')
+    assert await pipe.client.read() == b'pong'
+
+    await pipe.server.finish()
+    with pytest.raises(AdaptorException):
+        await pipe.client.write(b'x')
+
+@pytest.mark.asyncio
+async def test_memory_pipe_http():
+    pipe = MemoryPipe()
+
+    async def server():
+        async with Connection(pipe.server, prepared=True) as conn:
+            await conn.bind(ReadUntilTransformer())
+            req = HttpRequest()
+            await conn.receive(req)
+            resp = HttpResponse(body=req.get_body())
+            await conn.send(resp)
+
+    async def client():
+        async with Connection(pipe.client) as conn:
+            req = HttpRequest(method=HttpMethod.POST, body=b'echo')
+            resp = HttpResponse()
+            await conn.request(req, resp)
+            return resp
+
+    _, resp = await asyncio.gather(server(), client())
+    assert resp.get_status_code() == 200
+    assert resp.get_body() == b'echo'
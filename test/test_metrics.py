@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+from kedixa.comm import *
+
+@pytest.mark.asyncio
+async def test_metrics_transformer():
+    registry = MetricsRegistry()
+    conn = Connection(LoopbackAdaptor())
+
+    async with conn:
+        await conn.bind(MetricsTransformer('raw', registry=registry))
+        await conn.bind(ReadUntilTransformer())
+        await conn.bind(MetricsTransformer('app', tag='c1', registry=registry))
+        assert conn.info == (
+            'LoopbackAdaptor > MetricsTransformer > '
+            'ReadUntilTransformer > MetricsTransformer')
+
+        await conn.c.write_all(b'line1\nline2\n')
+        await conn.c.write_all_vectored([b'abc', b'def'])
+        assert await conn.c.read_exactly(6) == b'line1\n'
+
+        snapshot = registry.snapshot()
+        assert len(snapshot['live']) == 2
+        app = [x for x in snapshot['live'] if x['name'] == 'app'][0]
+        assert app['tag'] == 'c1'
+        assert app['write_bytes'] == 18
+        assert app['read_bytes'] == 6
+        assert app['flush_calls'] == 2
+
+        raw = registry.aggregate()['raw']
+        assert raw.read_bytes == 6
+        assert raw.write_bytes == 18
+        await conn.c.read_exactly(12)
+
+    snapshot = registry.snapshot()
+    assert len(snapshot['live']) == 0
+    assert snapshot['aggregate']['app']['connections'] == 1
+    assert snapshot['aggregate']['app']['read_bytes'] == 18
+
+def test_latency_histogram():
+    h = LatencyHistogram()
+    for _ in range(99):
+        h.record(0.0001)
+    h.record(1.0)
+    assert h.count == 100
+    assert h.percentile(50) <= 0.000128
+    assert h.percentile(100) == 1.0
+
+@pytest.mark.asyncio
+async def test_metrics_errors():
+    pipe = MemoryPipe()
+    metrics = MetricsTransformer('errors', registry=MetricsRegistry())
+    metrics.bind_next(pipe.server)
+
+    # a cancelled read and eof are not counted as errors
+    task = asyncio.ensure_future(metrics.read())
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    pipe.client.write_eof()
+    with pytest.raises(AdaptorEofError):
+        await metrics.read()
+
+    m = metrics.metrics
+    assert (m.errors, m.eofs, m.cancels) == (0, 1, 1)
+
+    # a failed flush is counted as an error
+    class BrokenFlush(LoopbackAdaptor):
+        async def flush(self):
+            raise AdaptorException('BrokenFlush: flush failed')
+
+    metrics.bind_next(BrokenFlush())
+    with pytest.raises(AdaptorException):
+        await metrics.flush()
+    assert (m.errors, m.eofs, m.cancels) == (1, 1, 1)
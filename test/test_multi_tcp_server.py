@@ -0,0 +1,94 @@
+import asyncio
+import os
+import time
+
+import pytest
+from kedixa.comm import *
+
+async def pid_processor(conn: Connection):
+    await conn.c.write_all(str(os.getpid()).encode())
+
+async def get_pids(port: int, n: int):
+    pids = set()
+    addr = SocketAddress('127.0.0.1', port)
+    for _ in range(n):
+        async with Connection(TcpAdaptor(addr)) as conn:
+            data = bytearray()
+            while True:
+                try:
+                    data.extend(await conn.c.read())
+                except AdaptorEofError:
+                    break
+            pids.add(int(data))
+    return pids
+
+def run(coro):
+    # asyncio.run is not available before python 3.7
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+def wait_stats(server: MultiTcpServer, finished: int):
+    for _ in range(50):
+        if sum(x['finished'] for x in server.stats()) >= finished:
+            break
+        time.sleep(0.05)
+    return server.stats()
+
+def test_multi_tcp_server():
+    for reuse_port in [True, False]:
+        server = MultiTcpServer(local_ip='127.0.0.1', workers=2,
+            processor=pid_processor, reuse_port=reuse_port)
+        server.start()
+
+        try:
+            assert server.alive_count() == 2
+            pids = run(get_pids(server.port, 20))
+            worker_pids = set(x['pid'] for x in server.stats())
+            assert pids <= worker_pids
+
+            stats = wait_stats(server, 20)
+            assert sum(x['accepted'] for x in stats) == 20
+
+            server.reload()
+            assert server.generation == 2
+            new_pids = set(x['pid'] for x in server.stats())
+            assert not (new_pids & worker_pids)
+
+            pids = run(get_pids(server.port, 4))
+            assert pids <= new_pids
+        finally:
+            server.stop()
+
+        assert server.alive_count() == 0
+
+def test_multi_tcp_server_reload_fail():
+    server = MultiTcpServer(local_ip='127.0.0.1', workers=1, processor=pid_processor)
+    server.start()
+
+    try:
+        # keep the workers of the failed generation to check them
+        spawned = []
+        spawn = server._spawn
+
+        def spawn_and_keep(generation):
+            workers, stats = spawn(generation)
+            spawned.extend(workers)
+            return workers, stats
+
+        server._spawn = spawn_and_keep
+        server._wait_ready = lambda workers, timeout: False
+        with pytest.raises(RuntimeError):
+            server.reload()
+
+        assert server.generation == 1
+        assert len(spawned) == 1 and not spawned[0].proc.is_alive()
+
+        # the old workers still serve and report their counters
+        pid = server.stats()[0]['pid']
+        assert run(get_pids(server.port, 4)) == {pid}
+        assert wait_stats(server, 4)[0]['accepted'] == 4
+    finally:
+        server.stop()
@@ -3,7 +3,10 @@ import pytest
 from kedixa.comm import (
     ReadUntilTransformer,
     LoopbackAdaptor,
+    MemoryPipe,
     TransformerException,
+    AdaptorEofError,
+    BadMessage,
 )
 
 @pytest.mark.asyncio
@@ -28,3 +31,116 @@ async def test_read_until01():
 
         with pytest.raises(TransformerException):
             await runtil.finish()
+
+@pytest.mark.asyncio
+async def test_read_until_pipelined():
+    lo = LoopbackAdaptor()
+    runtil = ReadUntilTransformer()
+    runtil.bind_next(lo)
+    async with lo, runtil:
+        lines = [b'line%d\n' % i for i in range(10000)]
+        await lo.write_all(b''.join(lines))
+
+        for line in lines[:5000]:
+            assert await runtil.read_until(b'\n') == line
+
+        # consumed data is removed lazily, not on each message
+        assert runtil.buffered_size == sum(len(x) for x in lines[5000:])
+
+        for line in lines[5000:-1]:
+            assert await runtil.read_until(b'\n') == line
+        assert await runtil.read(3) == b'lin'
+        assert await runtil.read() == b'e9999\n'
+
+@pytest.mark.asyncio
+async def test_read_until_view():
+    lo = LoopbackAdaptor()
+    runtil = ReadUntilTransformer()
+    runtil.bind_next(lo)
+    async with lo, runtil:
+        await lo.write_all(b'GET / HTTP/1.1\r\nHost: a')
+        line = await runtil.read_until_view(b'\r\n')
+        assert isinstance(line, memoryview)
+        assert line == b'GET / HTTP/1.1\r\n'
+
+        # the buffer grows while the view is alive, view is not changed
+        await lo.write_all(b'\r\n\r\n')
+        assert await runtil.read_until(b'\r\n\r\n') == b'Host: a\r\n\r\n'
+        assert line == b'GET / HTTP/1.1\r\n'
+        line.release()
+
+@pytest.mark.asyncio
+async def test_read_lines():
+    lo = LoopbackAdaptor()
+    runtil = ReadUntilTransformer()
+    runtil.bind_next(lo)
+    async with lo, runtil:
+        await lo.write_all(b'a\r\nbb\nccc\ndd')
+        assert await runtil.read_lines(2) == [b'a\r\n', b'bb\n']
+        assert await runtil.read_lines() == [b'ccc\n']
+        assert await runtil.read_lines(0) == []
+
+        # wait for more data if no whole line buffered
+        await lo.write_all(b'd\n')
+        assert await runtil.read_lines() == [b'ddd\n']
+
+        # read at most max_bytes from next when looking for a line
+        await lo.write_all(b'1\n22222\n')
+        assert await runtil.read_lines(max_bytes=4) == [b'1\n']
+        with pytest.raises(BadMessage):
+            await runtil.read_lines(max_bytes=4)
+        assert await runtil.read_exactly(6) == b'22222\n'
+
+        # records before a long one are returned when it is already buffered
+        await lo.write_all(b'x\n1\n2\n33333333\n')
+        assert await runtil.read_until(b'\n') == b'x\n'
+        assert await runtil.read_lines(max_bytes=4) == [b'1\n', b'2\n']
+        with pytest.raises(BadMessage):
+            await runtil.read_lines(max_bytes=4)
+        assert await runtil.read_exactly(9) == b'33333333\n'
+
+@pytest.mark.asyncio
+async def test_read_until_max_bytes():
+    lo = LoopbackAdaptor()
+    runtil = ReadUntilTransformer()
+    runtil.bind_next(lo)
+    async with lo, runtil:
+        # max_bytes buffered without delimiter, do not read zero more bytes
+        await lo.write_all(b'abcd')
+        with pytest.raises(BadMessage):
+            await runtil.read_until(b'\n', max_bytes=4)
+        assert await runtil.read_until(b'd', max_bytes=4) == b'abcd'
+
+@pytest.mark.asyncio
+async def test_read_records_delimiters():
+    lo = LoopbackAdaptor()
+    runtil = ReadUntilTransformer()
+    runtil.bind_next(lo)
+    async with lo, runtil:
+        await lo.write_all(b'a;b\r\nc\nd\r')
+        delimiters = (b'\n', b';', b'\r\n')
+        assert await runtil.read_records(delimiters) == [b'a;', b'b\r\n', b'c\n']
+        assert await runtil.read_until((b'\r', b'\n')) == b'd\r'
+
+@pytest.mark.asyncio
+async def test_iter_until():
+    pipe = MemoryPipe()
+    runtil = ReadUntilTransformer()
+    runtil.bind_next(pipe.server)
+
+    records = [b'record%d|' % i for i in range(1000)]
+    await pipe.client.write_all(b''.join(records))
+    pipe.client.write_eof()
+
+    result = [bytes(r) async for r in runtil.iter_until(b'|', max_bytes=20)]
+    assert result == records
+
+    # the last record is not complete
+    pipe = MemoryPipe()
+    runtil.bind_next(pipe.server)
+    await pipe.client.write_all(b'a|b')
+    pipe.client.write_eof()
+
+    with pytest.raises(AdaptorEofError):
+        async for r in runtil.iter_until(b'|'):
+            assert r == b'a|'
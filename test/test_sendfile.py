@@ -0,0 +1,156 @@
+import asyncio
+import os
+
+import pytest
+from kedixa.comm import *
+from kedixa.comm.http import *
+
+FILE_PATH = 'files/sendfile.tmp'
+FILE_DATA = os.urandom(1024 * 1024)
+
+@pytest.fixture(scope='module', autouse=True)
+def data_file():
+    with open(FILE_PATH, 'wb') as f:
+        f.write(FILE_DATA)
+    yield
+    os.remove(FILE_PATH)
+
+@pytest.fixture
+def sendfile_calls(monkeypatch):
+    calls = []
+    origin = os.sendfile
+
+    def sendfile(*args):
+        calls.append(args)
+        return origin(*args)
+
+    monkeypatch.setattr(os, 'sendfile', sendfile)
+    return calls
+
+async def start_sink_server(received: bytearray) -> TcpServer:
+    async def sink(conn: Connection):
+        while True:
+            try:
+                received.extend(await conn.c.read())
+            except AdaptorEofError:
+                break
+
+    server = TcpServer(local_ip='127.0.0.1', processor=sink)
+    await server.start()
+    return server
+
+async def bridge_file(c: CommunicateBase, skip: int, max_bytes: int):
+    async with FileAdaptor(FILE_PATH) as fa:
+        fa.seek(skip)
+        await CommBridge(fa, c, max_bytes=max_bytes).run()
+        await c.flush()
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('adaptor_type', [TcpAdaptor, RawTcpAdaptor])
+async def test_sendfile_socket(adaptor_type, sendfile_calls):
+    received = bytearray()
+    server = await start_sink_server(received)
+
+    try:
+        conn = Connection(adaptor_type(SocketAddress('127.0.0.1', server.port)))
+        async with conn:
+            # transformers do not change the bytes written pass sendfile down
+            await conn.bind(ReadUntilTransformer())
+            await conn.bind(MetricsTransformer('sendfile', registry=MetricsRegistry()))
+            metrics = conn.c.metrics
+
+            await bridge_file(conn.c, 100, 300000)
+            await bridge_file(conn.c, 0, -1)
+            assert metrics.write_bytes == 300000 + len(FILE_DATA)
+    finally:
+        await server.wait_finish(1.0)
+
+    assert len(sendfile_calls) > 0
+    assert received == FILE_DATA[100:300100] + FILE_DATA
+
+@pytest.mark.asyncio
+async def test_sendfile_fallback(sendfile_calls):
+    dst = LoopbackAdaptor()
+    chunk = HttpChunkTransformer()
+    runtil = ReadUntilTransformer()
+    chunk.bind_next(runtil)
+    runtil.bind_next(dst)
+
+    await bridge_file(chunk, 10, 200000)
+    assert len(sendfile_calls) == 0
+
+    out = bytearray()
+    while True:
+        try:
+            out.extend(await chunk.read())
+        except TransformerEofError:
+            break
+    assert out == FILE_DATA[10:200010]
+
+@pytest.mark.asyncio
+async def test_sendfile_window(sendfile_calls):
+    received = bytearray()
+    server = await start_sink_server(received)
+
+    try:
+        async with TcpAdaptor(SocketAddress('127.0.0.1', server.port)) as c:
+            async with FileAdaptor(FILE_PATH, offset=5000, length=70000) as fa:
+                await CommBridge(fa, c).run()
+                assert fa.remaining() == 0
+    finally:
+        await server.wait_finish(1.0)
+
+    assert len(sendfile_calls) > 0
+    assert received == FILE_DATA[5000:75000]
+
+async def read_until_eof(c: CommunicateBase) -> bytes:
+    out = bytearray()
+    while True:
+        try:
+            out.extend(await c.read())
+        except AdaptorEofError:
+            return bytes(out)
+
+@pytest.mark.asyncio
+async def test_sendfile_windows_copy():
+    # windows share the file object, the copy path must not use its position
+    size = len(FILE_DATA) // 4
+    async with FileAdaptor(FILE_PATH) as fa:
+        async def send(i: int) -> bytes:
+            pipe = MemoryPipe(maxsize=10000)
+            async def bridge():
+                async with fa.window(i * size, size) as w:
+                    await CommBridge(w, pipe.server).run()
+                pipe.server.write_eof()
+            _, data = await asyncio.gather(bridge(), read_until_eof(pipe.client))
+            return data
+
+        outs = await asyncio.gather(*[send(i) for i in range(4)])
+
+    for i, out in enumerate(outs):
+        assert out == FILE_DATA[i * size:(i + 1) * size]
+
+@pytest.mark.asyncio
+async def test_sendfile_windows_no_native(monkeypatch):
+    # without os.sendfile, socket adaptors copy the file by themselves
+    monkeypatch.delattr(os, 'sendfile')
+    received = [bytearray(), bytearray()]
+    servers = [await start_sink_server(r) for r in received]
+    size = len(FILE_DATA) // 2
+
+    try:
+        async with FileAdaptor(FILE_PATH) as fa:
+            async def send(i: int, adaptor_type):
+                addr = SocketAddress('127.0.0.1', servers[i].port)
+                async with adaptor_type(addr) as c:
+                    async with fa.window(i * size, size) as w:
+                        await CommBridge(w, c).run()
+                    await c.flush()
+
+            await asyncio.gather(send(0, TcpAdaptor), send(1, RawTcpAdaptor))
+    finally:
+        for s in servers:
+            await s.wait_finish(1.0)
+
+    assert received[0] == FILE_DATA[:size]
+    assert received[1] == FILE_DATA[size:]
@@ -0,0 +1,139 @@
+import asyncio
+import socket
+
+import pytest
+from kedixa import compat
+from kedixa.comm import *
+
+# BufferedTcpAdaptor needs asyncio.BufferedProtocol, new in python 3.7
+BUFFERED = [BufferedTcpAdaptor] if compat.PY37 else []
+
+async def echo(conn: Connection):
+    while True:
+        try:
+            data = await conn.c.read()
+        except AdaptorEofError:
+            break
+        await conn.c.write_all(data)
+
+async def start_echo_server() -> TcpServer:
+    server = TcpServer(local_ip='127.0.0.1', processor=echo)
+    await server.start()
+    return server
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not compat.PY37, reason='BufferedProtocol is new in python 3.7')
+async def test_buffered_tcp_adaptor():
+    server = await start_echo_server()
+    data = bytes(range(256)) * 4096
+
+    try:
+        addr = SocketAddress('127.0.0.1', server.port)
+        async with BufferedTcpAdaptor(addr, recv_buffer_size=4096) as c:
+            await c.write_all(data)
+            buf = await c.read_exactly(len(data))
+            assert buf == data
+
+            await c.write_all(b'hello')
+            buf = bytearray(16)
+            n = await c.read_exactly(5, buffer=buf)
+            assert n == 5 and buf[:n] == b'hello'
+    finally:
+        await server.wait_finish()
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not compat.PY37, reason='BufferedProtocol is new in python 3.7')
+async def test_buffered_tcp_adaptor_cancel():
+    s1, s2 = socket.socketpair()
+    try:
+        async with BufferedTcpAdaptor(None, sock=s1, recv_buffer_size=4) as c:
+            buf = bytearray(16)
+            task = asyncio.ensure_future(c.read(100, buffer=buf))
+            await asyncio.sleep(0.01)
+
+            # data is received into buf, then the read is cancelled before
+            # it returns, and more data is received into the adaptor
+            proto = c._protocol
+            view = proto.get_buffer(-1)
+            assert len(view) == 16
+            view[:6] = b'hello '
+            proto.buffer_updated(6)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+            s2.sendall(b'world')
+            assert await asyncio.wait_for(c.read_exactly(11), 1.0) == b'hello world'
+    finally:
+        s2.close()
+
+@pytest.mark.asyncio
+async def test_raw_tcp_adaptor():
+    server = await start_echo_server()
+    data = bytes(range(256)) * 4096
+
+    try:
+        addr = SocketAddress('127.0.0.1', server.port)
+        async with RawTcpAdaptor(addr) as c:
+            assert c.fileno() >= 0
+            await c.write_all(data)
+            buf = await c.read_exactly(len(data))
+            assert buf == data
+
+            c.write_eof()
+            with pytest.raises(AdaptorEofError):
+                await c.read()
+    finally:
+        await server.wait_finish()
+
+@pytest.mark.asyncio
+async def test_write_vectored():
+    server = await start_echo_server()
+    parts = [b'head\r\n', bytes(range(256)) * 1024, b'', b'tail']
+    data = bytes().join(parts)
+
+    try:
+        addr = SocketAddress('127.0.0.1', server.port)
+        for cls in [TcpAdaptor, RawTcpAdaptor] + BUFFERED:
+            async with cls(addr) as c:
+                runtil = ReadUntilTransformer()
+                runtil.bind_next(c)
+                assert await runtil.write_all_vectored(parts) == len(data)
+                assert await runtil.read_exactly(len(data)) == data
+    finally:
+        await server.wait_finish()
+
+@pytest.mark.asyncio
+async def test_write_high_water():
+    async def slow_reader(conn: Connection):
+        await asyncio.sleep(0.2)
+        n = 0
+        while True:
+            try:
+                n += len(await conn.c.read())
+            except AdaptorEofError:
+                break
+        await conn.c.write_all(str(n).encode())
+
+    server = TcpServer(local_ip='127.0.0.1', processor=slow_reader)
+    await server.start()
+    block = bytes(65536)
+    total = 64 * 1024 * 1024
+
+    try:
+        addr = SocketAddress('127.0.0.1', server.port)
+        for cls in [TcpAdaptor] + BUFFERED:
+            c = cls(addr, write_high_water=len(block))
+            await c.prepare()
+            max_size = 0
+            for _ in range(total // len(block)):
+                await c.write_all(block, flush=False)
+                max_size = max(max_size, c.write_buffer_size)
+            assert max_size <= 2 * len(block)
+
+            await c.flush()
+            c.write_eof()
+            assert await c.read() == str(total).encode()
+            await c.finish()
+    finally:
+        await server.wait_finish()
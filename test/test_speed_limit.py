@@ -1,3 +1,4 @@
+import asyncio
 import time
 
 import pytest
@@ -35,3 +36,72 @@ async def test_speed_limit():
         assert abs(cost-0.5) < 0.01
 
         assert BUF == data
+
+async def write_through(bucket: TokenBucket, size: int) -> float:
+    lo = LoopbackAdaptor(maxsize=size+1)
+    sl = SpeedLimitTransformer(w_bucket=bucket)
+    sl.bind_next(lo)
+
+    start = time.time()
+    await sl.write_all(bytes(size))
+    return time.time() - start
+
+def make_buckets(rate: float):
+    # each group is limited below the global rate, but above half of it
+    root = TokenBucket(rate, burst=1)
+    return root, [TokenBucket(rate * 5 / 8, parent=root) for _ in range(2)]
+
+@pytest.mark.asyncio
+async def test_token_bucket_shared():
+    # writes are split into blocks of 512KB, the last one taken in advance
+    # is not waited, groups save rate / 16 bytes of burst while idle
+    size, rate = 3 * 1024 * 1024, 8 * 1024 * 1024
+
+    # the idle group leaves its share to the busy one, which runs at its
+    # own rate, 2 * size bytes take about 1.0s instead of 1.4s at rate / 2
+    root, (busy, idle) = make_buckets(rate)
+    assert busy.parent is root
+    costs = await asyncio.gather(*[write_through(busy, size) for _ in range(2)])
+    assert abs(max(costs) - 1.0) < 0.1
+
+    # busy groups share the global rate, about 0.7s at rate
+    root, (busy, idle) = make_buckets(rate)
+    costs = await asyncio.gather(write_through(busy, size), write_through(idle, size))
+    assert abs(max(costs) - 0.7) < 0.1 and min(costs) > 0.4
+
+@pytest.mark.asyncio
+async def test_token_bucket_set_rate():
+    bucket = TokenBucket(1024, burst=1)
+    task = asyncio.ensure_future(write_through(bucket, 64 * 1024))
+    await asyncio.sleep(0.1)
+    assert not task.done()
+
+    bucket.set_rate(16 * 1024 * 1024)
+    assert bucket.rate == 16 * 1024 * 1024
+    assert await asyncio.wait_for(task, 1.0) < 0.2
+
+@pytest.mark.asyncio
+async def test_token_bucket_set_rate_hint():
+    # an explicit burst is kept when only the rate is changed
+    bucket = TokenBucket(1024, burst=4096)
+    bucket.set_rate(2048)
+    assert bucket.burst == 4096
+
+    # an explicit zero burst is not replaced by the default
+    assert TokenBucket(1024, burst=0).burst == 1.0
+    assert TokenBucket(1024).burst == 102.4
+
+    class CountAdaptor(LoopbackAdaptor):
+        writes = 0
+
+        async def write(self, buffer):
+            self.writes += 1
+            return await super().write(buffer)
+
+    # blocks follow the current rate of the bucket
+    lo = CountAdaptor()
+    sl = SpeedLimitTransformer(w_bucket=bucket)
+    sl.bind_next(lo)
+    bucket.set_rate(16 * 1024 * 1024, 16 * 1024 * 1024)
+    await sl.write_all(bytes(1024 * 1024))
+    assert lo.writes == 1
@@ -0,0 +1,201 @@
+import asyncio
+import socket
+
+import pytest
+from kedixa.comm import *
+
+async def echo(conn: Connection):
+    while True:
+        try:
+            data = await conn.c.read()
+        except AdaptorEofError:
+            break
+        await conn.c.write_all(data)
+
+async def sleep_long(conn: Connection):
+    await asyncio.sleep(3600)
+
+async def echo_once(c: TcpAdaptor, data: bytes) -> bytes:
+    await c.write_all(data)
+    return await asyncio.wait_for(c.read_exactly(len(data)), 1.0)
+
+@pytest.mark.asyncio
+async def test_max_connections():
+    server = TcpServer(local_ip='127.0.0.1', processor=echo, max_connections=2)
+    await server.start()
+    addr = SocketAddress('127.0.0.1', server.port)
+
+    try:
+        c1, c2, c3 = TcpAdaptor(addr), TcpAdaptor(addr), TcpAdaptor(addr)
+        await c1.prepare()
+        await c2.prepare()
+        assert await echo_once(c1, b'one') == b'one'
+        assert await echo_once(c2, b'two') == b'two'
+
+        # the third one waits until a slot is free
+        await c3.prepare()
+        await c3.write_all(b'three')
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(c3.read_exactly(5), 0.2)
+        assert server.stats()['active'] == 2
+
+        await c1.finish()
+        buf = await asyncio.wait_for(c3.read_exactly(5), 1.0)
+        assert buf == b'three'
+
+        await c2.finish()
+        await c3.finish()
+    finally:
+        await server.wait_finish(1.0)
+
+    st = server.stats()
+    assert st['accepted'] == 3 and st['active'] == 0 and st['finished'] == 3
+
+@pytest.mark.asyncio
+async def test_idle_timeout():
+    server = TcpServer(local_ip='127.0.0.1', processor=echo, idle_timeout=0.2)
+    await server.start()
+    addr = SocketAddress('127.0.0.1', server.port)
+
+    try:
+        async with TcpAdaptor(addr) as c:
+            assert await echo_once(c, b'hello') == b'hello'
+            assert len(server.connections) == 1
+
+            with pytest.raises(AdaptorEofError):
+                await asyncio.wait_for(c.read(), 2.0)
+
+        assert server.stats()['timeouts'] == 1
+    finally:
+        await server.wait_finish(1.0)
+
+@pytest.mark.asyncio
+async def test_read_timeout():
+    async def read_one(conn: Connection):
+        data = await conn.c.read_exactly(4)
+        await conn.c.write_all(data)
+
+    server = TcpServer(local_ip='127.0.0.1', processor=read_one, read_timeout=0.2)
+    await server.start()
+    addr = SocketAddress('127.0.0.1', server.port)
+
+    try:
+        async with TcpAdaptor(addr) as c:
+            # send only part of the message
+            await c.write_all(b'ab')
+            with pytest.raises(AdaptorEofError):
+                await asyncio.wait_for(c.read(), 2.0)
+    finally:
+        await server.wait_finish(1.0)
+
+    assert server.stats()['timeouts'] == 1
+
+@pytest.mark.asyncio
+async def test_read_timeout_keep_alive():
+    server = TcpServer(local_ip='127.0.0.1', processor=echo, read_timeout=0.1)
+    await server.start()
+    addr = SocketAddress('127.0.0.1', server.port)
+
+    try:
+        async with TcpAdaptor(addr) as c:
+            # waiting for the next message is not a slow read
+            assert await echo_once(c, b'one') == b'one'
+            await asyncio.sleep(0.3)
+            assert await echo_once(c, b'two') == b'two'
+    finally:
+        await server.wait_finish(1.0)
+
+    assert server.stats()['timeouts'] == 0
+
+@pytest.mark.asyncio
+async def test_read_timeout_long_message():
+    async def read_all(conn: Connection):
+        n = 0
+        while True:
+            try:
+                n += len(await conn.c.read())
+            except AdaptorEofError:
+                break
+        await conn.c.write_all(str(n).encode())
+
+    server = TcpServer(local_ip='127.0.0.1', processor=read_all, read_timeout=0.1)
+    await server.start()
+    addr = SocketAddress('127.0.0.1', server.port)
+
+    try:
+        async with TcpAdaptor(addr) as c:
+            # a message takes longer than read_timeout, but keeps arriving
+            for _ in range(10):
+                await c.write_all(b'x' * 1000)
+                await asyncio.sleep(0.04)
+            c.write_eof()
+            assert await asyncio.wait_for(c.read(), 1.0) == b'10000'
+    finally:
+        await server.wait_finish(1.0)
+
+    assert server.stats()['timeouts'] == 0
+
+class TwoSocketServer(TcpServer):
+    def _create_sockets(self):
+        socks = []
+        for _ in range(2):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind(('127.0.0.1', 0))
+            sock.listen(16)
+            socks.append(sock)
+        return socks
+
+@pytest.mark.asyncio
+async def test_max_connections_sockets():
+    server = TwoSocketServer(processor=echo, max_connections=1)
+    await server.start()
+
+    try:
+        # an idle listener does not hold the only slot
+        for sock in server.sockets[::-1]:
+            addr = SocketAddress('127.0.0.1', sock.getsockname()[1])
+            async with TcpAdaptor(addr) as c:
+                assert await echo_once(c, b'hello') == b'hello'
+    finally:
+        await server.wait_finish(1.0)
+
+    assert server.stats()['finished'] == 2
+
+@pytest.mark.asyncio
+async def test_wait_finish_timeout():
+    server = TcpServer(local_ip='127.0.0.1', processor=sleep_long)
+    await server.start()
+    addr = SocketAddress('127.0.0.1', server.port)
+
+    async with TcpAdaptor(addr) as c:
+        for _ in range(100):
+            if server.stats()['active'] == 1:
+                break
+            await asyncio.sleep(0.01)
+        assert server.stats()['active'] == 1
+
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        await server.wait_finish(0.1)
+        assert loop.time() - start < 1.0
+
+        assert server.stats()['active'] == 0
+        with pytest.raises(AdaptorEofError):
+            await asyncio.wait_for(c.read(), 1.0)
+
+@pytest.mark.asyncio
+async def test_wait_finish_no_timeout():
+    server = TcpServer(local_ip='127.0.0.1', processor=echo)
+    await server.start()
+    addr = SocketAddress('127.0.0.1', server.port)
+
+    async with TcpAdaptor(addr) as c:
+        assert await echo_once(c, b'hello') == b'hello'
+
+        # an idle keep-alive connection does not block wait_finish
+        await asyncio.wait_for(server.wait_finish(), 1.0)
+        assert server.stats()['active'] == 1
+        assert await echo_once(c, b'world') == b'world'
+
+    await server.wait_finish(1.0)
+    assert server.stats()['active'] == 0
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+from kedixa.comm import *
+
+@pytest.mark.asyncio
+async def test_timer_wheel():
+    loop = asyncio.get_event_loop()
+    wheel = TimerWheel(tick=0.01, slots=8)
+    fired = []
+
+    start = loop.time()
+    for delay in (0.05, 0.02, 0.15):
+        wheel.call_later(delay, lambda d: fired.append((d, loop.time() - start)), delay)
+    t = wheel.call_later(0.03, fired.append, 'cancelled')
+    assert len(wheel) == 4
+
+    t.cancel()
+    t.cancel()
+    assert t.cancelled() and len(wheel) == 3
+
+    await asyncio.sleep(0.3)
+    assert [d for d, _ in fired] == [0.02, 0.05, 0.15]
+    for delay, elapsed in fired:
+        # never early, at most about one tick late
+        assert delay <= elapsed < delay + 0.05
+    assert len(wheel) == 0
+    wheel.close()
+
+@pytest.mark.asyncio
+async def test_timer_wheel_rearm():
+    wheel = TimerWheel(tick=0.01, slots=8)
+    ticks, fired = 0, 0
+    on_tick = wheel._on_tick
+
+    def count_tick():
+        nonlocal ticks
+        ticks += 1
+        on_tick()
+
+    def rearm():
+        nonlocal fired
+        fired += 1
+        wheel.call_later(0.01, rearm)
+
+    # only one loop timer, even when callbacks arm timers in a tick
+    wheel._on_tick = count_tick
+    wheel.call_later(0.01, rearm)
+    await asyncio.sleep(0.5)
+    assert 25 <= ticks <= 55
+    assert fired >= ticks // 2 - 1
+
+    wheel.close()
+    ticks = 0
+    await asyncio.sleep(0.05)
+    assert ticks == 0
+
+@pytest.mark.asyncio
+async def test_deadline_read_timeout():
+    pipe = MemoryPipe()
+    conn = Connection(pipe.client)
+    async with conn:
+        dt = DeadlineTransformer(read_timeout=0.05,
+            wheel=TimerWheel(tick=0.01))
+        await conn.bind(dt)
+
+        await pipe.server.write_all(b'hello')
+        assert await conn.c.read() == b'hello'
+
+        with pytest.raises(TransformerTimeoutError) as e:
+            await conn.c.read()
+        assert e.value.what() == 'ReadTimeout'
+        assert dt.expired == 'ReadTimeout'
+
+        # the task is usable after the timeout
+        await asyncio.sleep(0)
+
+        with pytest.raises(TransformerTimeoutError):
+            await conn.c.write_all(b'again')
+
+@pytest.mark.asyncio
+async def test_deadline_idle_timeout():
+    pipe = MemoryPipe()
+    conn = Connection(pipe.client)
+    async with conn:
+        dt = DeadlineTransformer(idle_timeout=0.1,
+            wheel=TimerWheel(tick=0.01))
+        await conn.bind(dt)
+
+        # activity keeps the connection alive
+        for _ in range(5):
+            await asyncio.sleep(0.04)
+            await pipe.server.write_all(b'x')
+            assert await conn.c.read() == b'x'
+        assert dt.expired is None
+
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        with pytest.raises(TransformerTimeoutError) as e:
+            await conn.c.read()
+        assert e.value.what() == 'IdleTimeout'
+        assert 0.05 < loop.time() - start < 0.5
+
+@pytest.mark.asyncio
+async def test_deadline_not_timeout():
+    pipe = MemoryPipe()
+    conn = Connection(pipe.client)
+    async with conn:
+        await conn.bind(DeadlineTransformer(read_timeout=1.0, write_timeout=1.0))
+
+        task = asyncio.ensure_future(conn.c.read())
+        await asyncio.sleep(0.01)
+        task.cancel()
+
+        # cancel from outside is not a timeout
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        await pipe.server.write_all(b'hello')
+        assert await conn.c.read() == b'hello'
@@ -0,0 +1,76 @@
+import asyncio
+import os
+import sys
+
+import pytest
+from kedixa.comm import *
+from kedixa.comm.http import *
+
+SOCK_PATH = 'files/unix_socket.tmp'
+
+async def echo(conn: Connection):
+    while True:
+        try:
+            data = await conn.c.read()
+        except AdaptorEofError:
+            break
+        await conn.c.write_all(data)
+
+async def http_hello(conn: Connection):
+    await conn.bind(ReadUntilTransformer())
+    req = HttpRequest()
+    await conn.receive(req)
+
+    body = b'hello ' + req.get_req_url().encode()
+    resp = HttpResponse(headers=[('Content-Length', str(len(body)))], body=body)
+    await conn.send(resp)
+
+def test_unix_address():
+    addr = SocketAddress.from_path('/tmp/a.sock')
+    assert addr.path == '/tmp/a.sock' and addr.sockaddr == '/tmp/a.sock'
+    assert not addr.abstract
+    assert addr.info.startswith('unix:/tmp/a.sock')
+
+    addr = SocketAddress.from_path('kedixa', abstract=True)
+    assert addr.path == '\0kedixa' and addr.abstract
+    assert addr.info.startswith('unix:@kedixa')
+
+    addr = SocketAddress('127.0.0.1', 80)
+    assert addr.path is None and addr.sockaddr == ('127.0.0.1', 80)
+
+@pytest.mark.asyncio
+async def test_unix_echo():
+    server = UnixServer(path=SOCK_PATH, processor=echo)
+    await server.start()
+    assert os.path.exists(SOCK_PATH)
+
+    try:
+        async with UnixAdaptor(server.addr) as c:
+            data = bytes(range(256)) * 1024
+            await c.write_all(data)
+            assert await c.read_exactly(len(data)) == data
+    finally:
+        await server.wait_finish()
+
+    assert not os.path.exists(SOCK_PATH)
+    assert server.stats()['finished'] == 1
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'),
+    reason='abstract namespace is linux only')
+@pytest.mark.asyncio
+async def test_unix_http_abstract():
+    server = UnixServer(path='kedixa-test', abstract=True, processor=http_hello)
+    await server.start()
+
+    try:
+        addr = SocketAddress.from_path('kedixa-test', abstract=True)
+        conn = Connection(UnixAdaptor(addr))
+        async with conn:
+            await conn.bind(ReadUntilTransformer())
+            resp = HttpResponse()
+            await conn.request(HttpRequest(req_url='/uds'), resp)
+
+        assert resp.get_status_code() == 200
+        assert resp.get_body() == b'hello /uds'
+    finally:
+        await server.wait_finish()